@@ -21,6 +21,8 @@ const MachineSchema = new mongoose.Schema(
     hasIssues: { type: Boolean, default: false },
     issues: { type: [String], default: [] },
 
+    stateVersion: { type: String, default: null }, // agent's version of the stored state (delta base)
+
     firstSeenAt: { type: Date, default: () => new Date() },
     lastSeenAt: { type: Date, default: () => new Date(), index: true },
     reportedAt: { type: Date, default: () => new Date() }, // from agent 'timestamp'
@@ -11,6 +11,18 @@ const {
 
 const router = express.Router();
 
+// Optional scheduling hint for agents: with AGENT_NEXT_REPORT_SECONDS set,
+// every acknowledged upload asks the agent to wait that long before the
+// next one (utility/outbox.py honours it, capped at an hour). Raise it to
+// shed load; 429/503 responses may carry Retry-After as usual.
+const NEXT_REPORT_SECONDS = Number(process.env.AGENT_NEXT_REPORT_SECONDS) || 0;
+
+function ack(body) {
+  return NEXT_REPORT_SECONDS > 0
+    ? { ok: true, ...body, nextReportSeconds: NEXT_REPORT_SECONDS }
+    : { ok: true, ...body };
+}
+
 // zod schema matching your Python payload
 const SnapshotSchema = z.object({
   machineId: z.string().min(1),
@@ -26,20 +38,55 @@ const SnapshotSchema = z.object({
   sleepPolicyOk: z.boolean().nullable().optional(),
   sleepTimeoutMinutes: z.number().int().nullable().optional(),
   timestamp: z.string().datetime().optional(),
+  version: z.string().optional(),
+  // about the collection, not the machine: kept with the stored report only
+  checkTimings: z.record(z.string(), z.number()).optional(),
+  timedOut: z.array(z.string()).optional(),
+  agentMetrics: z.record(z.string(), z.number().nullable()).optional(),
 });
 
-router.post("/report", authAgent, async (req, res) => {
-  const parse = SnapshotSchema.safeParse(req.body);
-  if (!parse.success) {
-    return res
-      .status(400)
-      .json({ error: "invalid payload", details: parse.error.flatten() });
+// Collection metadata sent next to a delta (not part of the versioned state).
+const META_FIELDS = ["timestamp", "checkTimings", "timedOut", "agentMetrics"];
+
+// Field-level delta against the state the server last stored for the machine
+// (see utility/outbox.py for the protocol).
+const DeltaSchema = z.object({
+  machineId: z.string().min(1),
+  baseVersion: z.string().min(1),
+  version: z.string().min(1),
+  delta: SnapshotSchema.omit({ machineId: true }).partial(),
+  timestamp: SnapshotSchema.shape.timestamp,
+  checkTimings: SnapshotSchema.shape.checkTimings,
+  timedOut: SnapshotSchema.shape.timedOut,
+  agentMetrics: SnapshotSchema.shape.agentMetrics,
+});
+
+const SNAPSHOT_FIELDS = [
+  "hostname",
+  "os",
+  "osVersion",
+  "diskEncrypted",
+  "osUpdated",
+  "updatesPending",
+  "antivirusInstalled",
+  "antivirusRunning",
+  "antivirusName",
+  "sleepPolicyOk",
+  "sleepTimeoutMinutes",
+];
+
+// Rebuild the last snapshot from the stored machine document.
+function snapshotFromMachine(doc) {
+  const snap = { machineId: doc.machineId };
+  for (const k of SNAPSHOT_FIELDS) {
+    if (doc[k] !== null && doc[k] !== undefined) snap[k] = doc[k];
   }
-  const snap = parse.data;
+  return snap;
+}
 
+async function ingestSnapshot(snap, now) {
   const { hasIssues, issues } = deriveIssues(snap);
 
-  const now = new Date();
   const reportedAt = snap.timestamp ? new Date(snap.timestamp) : now;
 
   const update = {
@@ -65,6 +112,7 @@ router.post("/report", authAgent, async (req, res) => {
     hasIssues,
     issues,
 
+    stateVersion: snap.version ?? null,
     lastSeenAt: now,
     reportedAt,
   };
@@ -83,8 +131,85 @@ router.post("/report", authAgent, async (req, res) => {
     payload: snap,
     createdAt: now,
   });
+}
+
+router.post("/report", authAgent, async (req, res) => {
+  const parse = SnapshotSchema.safeParse(req.body);
+  if (!parse.success) {
+    return res
+      .status(400)
+      .json({ error: "invalid payload", details: parse.error.flatten() });
+  }
+
+  await ingestSnapshot(parse.data, new Date());
+
+  return res.json(ack({}));
+});
+
+// Batched upload from the agent outbox (see utility/outbox.py).
+// Body: { reports: [item, ...] } in send order, usually gzip-encoded
+// (express.json inflates Content-Encoding: gzip). An item is a full snapshot
+// or a delta against the machine's stored stateVersion. The batch is
+// acknowledged as a whole; items that fail validation are listed in
+// `rejected`. A delta whose baseVersion does not match stops the batch with
+// 409 and the number of items already applied.
+router.post("/reports/batch", authAgent, async (req, res) => {
+  const reports = Array.isArray(req.body?.reports) ? req.body.reports : null;
+  if (!reports) {
+    return res.status(400).json({ error: "invalid payload: reports[] required" });
+  }
+
+  const now = new Date();
+  const rejected = [];
+  let accepted = 0;
+  for (let i = 0; i < reports.length; i++) {
+    let snap;
+    if (reports[i] && reports[i].delta !== undefined) {
+      const parse = DeltaSchema.safeParse(reports[i]);
+      if (!parse.success) {
+        rejected.push(i);
+        continue;
+      }
+      const d = parse.data;
+      const machine = await Machine.findOne({ machineId: d.machineId }).lean();
+      if (!machine || machine.stateVersion !== d.baseVersion) {
+        return res.status(409).json({
+          error: "version mismatch",
+          accepted,
+          rejected,
+          index: i,
+          serverVersion: machine?.stateVersion ?? null,
+        });
+      }
+      const meta = {};
+      for (const k of META_FIELDS) {
+        if (d[k] !== undefined) meta[k] = d[k];
+      }
+      const merged = SnapshotSchema.safeParse({
+        ...snapshotFromMachine(machine),
+        ...d.delta,
+        ...meta,
+        machineId: d.machineId,
+        version: d.version,
+      });
+      if (!merged.success) {
+        rejected.push(i);
+        continue;
+      }
+      snap = merged.data;
+    } else {
+      const parse = SnapshotSchema.safeParse(reports[i]);
+      if (!parse.success) {
+        rejected.push(i);
+        continue;
+      }
+      snap = parse.data;
+    }
+    await ingestSnapshot(snap, now);
+    accepted++;
+  }
 
-  return res.json({ ok: true });
+  return res.json(ack({ accepted, rejected }));
 });
 
 router.get("/reports/:machineId", getReportsByMachineId);
@@ -0,0 +1,400 @@
+"""
+Fleet compliance analytics over exported Report documents.
+
+Streams JSON lines (plain or .gz, or "-" for stdin), as written by
+
+    mongoexport --db syshealth --collection reports --sort '{createdAt: 1}' --out reports.jsonl
+
+or by `mongoexport --jsonArray`, or bare agent snapshots (main.collect_snapshot
+shape). Records are parsed in chunks into NumPy columns (tri-states as int8:
+1 true, 0 false, -1 unknown) and the deriveIssues rules (rules.py) are applied
+column-wise. Memory is bounded by chunk size, fleet size and the number of
+time buckets, never by the size of the input.
+
+    python analyze.py reports.jsonl.gz --bucket 1d --top 10
+
+Rollups:
+  compliance   per time bucket: machines known so far and the share whose
+               latest report up to the end of the bucket has no issue (agents
+               report on change, so a machine's state holds until its next
+               report); "reporting" counts those that reported in the bucket
+  remediation  per issue: episodes closed, mean time to remediate, episodes
+               still open at the end of the input
+  offenders    machines with the most time spent with issues
+
+Remediation times and time-with-issues follow each machine's reports in
+order, so the input should be sorted by time (the --sort above). Reports
+are reordered within a chunk, but a report older than the machine's newest
+report in an earlier chunk is counted as out of order and skipped; on
+unsorted input these two rollups therefore depend on --chunk. Sort the
+export, or give a --chunk larger than the input, for exact results.
+"""
+import argparse
+import gzip
+import io
+import json
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # analytics only; the agent itself never needs NumPy
+    sys.exit("analyze.py needs NumPy: pip install numpy")
+
+from rules import ISSUES
+
+TRI_FIELDS = ["diskEncrypted", "osUpdated", "antivirusInstalled", "antivirusRunning", "sleepPolicyOk"]
+CHUNK_RECORDS = 100_000
+UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+_TRI = {True: 1, False: 0}
+
+
+# ---------------- input ----------------
+
+def _open(path: str) -> io.TextIOBase:
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_documents(f: io.TextIOBase) -> Iterator[Dict[str, Any]]:
+    """JSON lines, or one JSON array decoded incrementally."""
+    first = f.read(1)
+    while first and first.isspace():
+        first = f.read(1)
+    if first != "[":
+        for line in _prepend(first, f):
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+        return
+    decoder, buf = json.JSONDecoder(), ""
+    while True:
+        chunk = f.read(1 << 20)
+        buf += chunk
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf) and buf[pos] == "]":
+                return
+            try:
+                doc, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                break  # incomplete object: read more
+            yield doc
+            pos = end
+        buf = buf[pos:]
+        if not chunk:
+            if buf.strip(" \t\r\n,]"):
+                raise ValueError("truncated JSON array")
+            return
+
+
+def _prepend(first: str, f: io.TextIOBase) -> Iterable[str]:
+    head = f.readline()
+    yield first + head
+    yield from f
+
+
+def _epoch(v: Any) -> Optional[float]:
+    """createdAt / timestamp in any export form: ISO string, epoch ms, {"$date": ...}."""
+    if isinstance(v, dict):
+        v = v.get("$date", v.get("$numberLong"))
+        if isinstance(v, dict):
+            v = int(v.get("$numberLong", 0))
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return v / 1000.0
+    if isinstance(v, str):
+        try:
+            return datetime.fromisoformat(v.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            return None
+    return None
+
+
+class Chunk:
+    """Columns of up to CHUNK_RECORDS reports."""
+
+    def __init__(self, t, machine, tri, pending):
+        self.t = t                  # float64 epoch seconds
+        self.machine = machine      # int32 machine index
+        self.tri = tri              # int8 [n, len(TRI_FIELDS)]
+        self.pending = pending      # int32, -1 unknown
+
+    def __len__(self) -> int:
+        return len(self.t)
+
+
+def iter_chunks(docs: Iterable[Dict[str, Any]], machines: Dict[str, int], hostnames: List[str],
+                size: int = CHUNK_RECORDS) -> Iterator[Chunk]:
+    t = np.empty(size, np.float64)
+    machine = np.empty(size, np.int32)
+    tri = np.empty((size, len(TRI_FIELDS)), np.int8)
+    pending = np.empty(size, np.int32)
+    n = 0
+    for doc in docs:
+        payload = doc.get("payload") if isinstance(doc.get("payload"), dict) else doc
+        mid = doc.get("machineId") or payload.get("machineId")
+        when = _epoch(doc.get("createdAt")) or _epoch(payload.get("timestamp"))
+        if not mid or when is None:
+            continue
+        m = machines.get(mid)
+        if m is None:
+            m = machines[mid] = len(machines)
+            hostnames.append("")
+        if payload.get("hostname"):
+            hostnames[m] = payload["hostname"]
+        t[n] = when
+        machine[n] = m
+        for j, f in enumerate(TRI_FIELDS):
+            tri[n, j] = _TRI.get(payload.get(f), -1)
+        p = payload.get("updatesPending")
+        pending[n] = p if isinstance(p, int) and not isinstance(p, bool) and p >= 0 else -1
+        n += 1
+        if n == size:
+            yield Chunk(t.copy(), machine.copy(), tri.copy(), pending.copy())
+            n = 0
+    if n:
+        yield Chunk(t[:n].copy(), machine[:n].copy(), tri[:n].copy(), pending[:n].copy())
+
+
+# ---------------- rules ----------------
+
+def issue_bits(c: Chunk) -> np.ndarray:
+    """deriveIssues, column-wise: bit i set when ISSUES[i] applies (uint8 per report)."""
+    disk, updated, av_inst, av_run, sleep = (c.tri[:, j] for j in range(len(TRI_FIELDS)))
+    rules = {
+        "disk_not_encrypted": disk == 0,
+        "os_outdated": updated == 0,
+        "updates_pending": c.pending > 0,
+        "antivirus_missing": av_inst == 0,
+        "antivirus_not_running": (av_inst == 1) & (av_run == 0),
+        "sleep_policy_too_high": sleep == 0,
+    }
+    bits = np.zeros(len(c), np.uint8)
+    for i, name in enumerate(ISSUES):
+        bits |= rules[name].astype(np.uint8) << i
+    return bits
+
+
+# ---------------- rollups ----------------
+
+class Compliance:
+    """
+    Per (bucket, machine): the last report's compliance. Rows are merged chunk
+    by chunk; the rollup carries each machine's state into later buckets.
+    """
+
+    def __init__(self, bucket: float):
+        self.bucket = bucket
+        self.key = np.empty(0, np.int64)    # bucket << 32 | machine
+        self.t = np.empty(0, np.float64)
+        self.ok = np.empty(0, np.bool_)
+
+    def add(self, c: Chunk, bits: np.ndarray) -> None:
+        b = np.floor(c.t / self.bucket).astype(np.int64)
+        key = np.concatenate([self.key, (b << 32) | c.machine.astype(np.int64)])
+        t = np.concatenate([self.t, c.t])
+        ok = np.concatenate([self.ok, bits == 0])
+        order = np.lexsort((t, key))
+        key, t, ok = key[order], t[order], ok[order]
+        last = np.append(key[1:] != key[:-1], True)  # latest row per key
+        self.key, self.t, self.ok = key[last], t[last], ok[last]
+
+    def rollup(self) -> List[Dict[str, Any]]:
+        """
+        Per bucket from the first to the last: every machine seen so far, in the
+        state of its latest report up to the end of the bucket (agents report
+        on change, so silence means unchanged), and how many reported in it.
+        """
+        if not len(self.key):
+            return []
+        b, m = self.key >> 32, self.key & 0xFFFFFFFF
+        first, end = int(b.min()), int(b.max()) + 1
+        # rows are sorted by bucket then machine: regroup per machine in time order
+        order = np.lexsort((b, m))
+        b, m, ok = b[order] - first, m[order], self.ok[order]
+        # each row holds from its bucket until the machine's next row, or the end
+        until = np.append(b[1:], end - first)
+        until[np.append(m[1:] != m[:-1], True)] = end - first
+        machines = np.zeros(end - first + 1, np.int64)
+        compliant = np.zeros(end - first + 1, np.int64)
+        np.add.at(machines, b, 1)
+        np.add.at(machines, until, -1)
+        np.add.at(compliant, b[ok], 1)
+        np.add.at(compliant, until[ok], -1)
+        machines, compliant = np.cumsum(machines)[:-1], np.cumsum(compliant)[:-1]
+        reporting = np.bincount(b, minlength=end - first)
+        return [{"start": _iso((first + i) * self.bucket), "machines": int(n), "reporting": int(r),
+                 "compliant": int(k), "pct": round(100.0 * k / n, 1)}
+                for i, (n, r, k) in enumerate(zip(machines.tolist(), reporting.tolist(), compliant.tolist()))]
+
+
+class Timeline:
+    """
+    Per-machine state carried across chunks, for the order-dependent rollups:
+    issue episodes (onset → remediation) and time spent with issues.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.last_t = np.empty(0, np.float64)        # NaN: no report yet
+        self.last_bits = np.empty(0, np.uint8)
+        self.open_since = np.empty((0, len(ISSUES)), np.float64)  # NaN: issue not open
+        self.bad_seconds = np.empty(0, np.float64)
+        self.reports = np.empty(0, np.int64)
+        self.issue_reports = np.empty((0, len(ISSUES)), np.int64)
+        self.ttr_sum = np.zeros(len(ISSUES))
+        self.ttr_count = np.zeros(len(ISSUES), np.int64)
+        self.out_of_order = 0
+        self.end_t = float("-inf")  # newest report seen
+
+    def _grow(self, n: int) -> None:
+        if n <= self.size:
+            return
+        extra = n - self.size
+        nan = lambda *shape: np.full(shape, np.nan)
+        self.last_t = np.concatenate([self.last_t, nan(extra)])
+        self.last_bits = np.concatenate([self.last_bits, np.zeros(extra, np.uint8)])
+        self.open_since = np.concatenate([self.open_since, nan(extra, len(ISSUES))])
+        self.bad_seconds = np.concatenate([self.bad_seconds, np.zeros(extra)])
+        self.reports = np.concatenate([self.reports, np.zeros(extra, np.int64)])
+        self.issue_reports = np.concatenate([self.issue_reports, np.zeros((extra, len(ISSUES)), np.int64)])
+        self.size = n
+
+    def add(self, c: Chunk, bits: np.ndarray, machines: int) -> None:
+        self._grow(machines)
+        order = np.lexsort((c.t, c.machine))
+        m, t, bits = c.machine[order], c.t[order], bits[order]
+        start = np.ones(len(m), np.bool_)
+        start[1:] = m[1:] != m[:-1]
+
+        # older than the newest report of the machine in an earlier chunk; rows
+        # are sorted within a machine, so every stale row goes in one pass
+        stale = self.last_t[m] > t
+        if stale.any():
+            self.out_of_order += int(stale.sum())
+            keep = ~stale
+            m, t, bits = m[keep], t[keep], bits[keep]
+            start = np.ones(len(m), np.bool_)
+            start[1:] = m[1:] != m[:-1]
+        if not len(m):
+            return
+
+        # previous report of the same machine: the row before, or the carried state
+        prev_t = np.where(start, self.last_t[m], np.roll(t, 1))
+        prev_bits = np.where(start, self.last_bits[m], np.roll(bits, 1))
+
+        # time with issues: the previous report's state holds until this one
+        dt = np.where(np.isnan(prev_t), 0.0, t - prev_t)
+        self.bad_seconds += np.bincount(m, weights=dt * (prev_bits != 0), minlength=self.size)
+        self.reports += np.bincount(m, minlength=self.size)
+        idx = np.arange(len(m))
+        end = np.append(start[1:], True)
+
+        for i in range(len(ISSUES)):
+            has = ((bits >> i) & 1).astype(np.bool_)
+            had = ((prev_bits >> i) & 1).astype(np.bool_)
+            self.issue_reports[:, i] += np.bincount(m, weights=has, minlength=self.size).astype(np.int64)
+            onset = has & ~had
+            # onset time in force at each row: last onset in the group, else the carried one
+            v = np.where(onset, t, np.where(start, self.open_since[m, i], np.nan))
+            filled = v[np.maximum.accumulate(np.where(onset | start, idx, 0))]
+            fixed = ~has & had & ~np.isnan(filled)
+            self.ttr_sum[i] += float((t[fixed] - filled[fixed]).sum())
+            self.ttr_count[i] += int(fixed.sum())
+            self.open_since[m[end], i] = np.where(has[end], filled[end], np.nan)
+
+        self.end_t = max(self.end_t, float(t.max()))
+        self.last_t[m[end]] = t[end]
+        self.last_bits[m[end]] = bits[end]
+
+    def remediation(self) -> Dict[str, Dict[str, Any]]:
+        out = {}
+        for i, name in enumerate(ISSUES):
+            n = int(self.ttr_count[i])
+            out[name] = {"remediated": n,
+                         "meanHours": round(float(self.ttr_sum[i]) / n / 3600, 2) if n else None,
+                         "stillOpen": int((~np.isnan(self.open_since[:, i])).sum())}
+        return out
+
+    def offenders(self, ids: List[str], hostnames: List[str], top: int) -> List[Dict[str, Any]]:
+        # issues still open hold until the end of the input
+        bad = self.bad_seconds + np.where(self.last_bits != 0, self.end_t - self.last_t, 0.0)
+        order = np.argsort(-bad, kind="stable")[:top]
+        return [{"machineId": ids[m], "hostname": hostnames[m] or None,
+                 "hoursWithIssues": round(float(bad[m]) / 3600, 1),
+                 "reports": int(self.reports[m]),
+                 "issues": {ISSUES[i]: int(self.issue_reports[m, i])
+                            for i in range(len(ISSUES)) if self.issue_reports[m, i]},
+                 "openNow": [ISSUES[i] for i in range(len(ISSUES)) if self.last_bits[m] >> i & 1]}
+                for m in order.tolist() if bad[m] > 0]
+
+
+def _iso(t: float) -> str:
+    return datetime.fromtimestamp(t, timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+
+
+def analyze(path: str, bucket: float = 86400, top: int = 10, chunk: int = CHUNK_RECORDS) -> Dict[str, Any]:
+    machines: Dict[str, int] = {}
+    hostnames: List[str] = []
+    compliance, timeline = Compliance(bucket), Timeline()
+    total = 0
+    with _open(path) as f:
+        for c in iter_chunks(iter_documents(f), machines, hostnames, chunk):
+            bits = issue_bits(c)
+            compliance.add(c, bits)
+            timeline.add(c, bits, len(machines))
+            total += len(c)
+    ids = list(machines)
+    return {
+        "reports": total,
+        "machines": len(machines),
+        "outOfOrder": timeline.out_of_order,
+        "compliance": compliance.rollup(),
+        "remediation": timeline.remediation(),
+        "offenders": timeline.offenders(ids, hostnames, top),
+    }
+
+
+def _duration(s: str) -> float:
+    if s[-1:] in UNITS:
+        return float(s[:-1]) * UNITS[s[-1]]
+    return float(s)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("path", help="JSONL / JSON array export, .gz ok, - for stdin")
+    ap.add_argument("--bucket", type=_duration, default=86400.0, help="compliance bucket, e.g. 1h, 1d, 1w")
+    ap.add_argument("--top", type=int, default=10)
+    ap.add_argument("--chunk", type=int, default=CHUNK_RECORDS, help="records per columnar chunk (on unsorted input, reports are only reordered within one)")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    result = analyze(args.path, args.bucket, args.top, args.chunk)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"{result['reports']} reports from {result['machines']} machines"
+          + (f" ({result['outOfOrder']} out of order, skipped for timelines)" if result["outOfOrder"] else ""))
+    print("\ncompliance")
+    for row in result["compliance"]:
+        print(f"  {row['start']}  {row['pct']:5.1f}%  {row['compliant']}/{row['machines']}"
+              f"  ({row['reporting']} reporting)")
+    print("\nremediation")
+    for name, r in result["remediation"].items():
+        mean = f"{r['meanHours']:.2f} h" if r["meanHours"] is not None else "-"
+        print(f"  {name:24s} {r['remediated']:7d} fixed  mean {mean:>10s}  {r['stillOpen']} open")
+    print("\nworst offenders")
+    for o in result["offenders"]:
+        print(f"  {o['machineId']}  {o['hostname'] or '-':20s} {o['hoursWithIssues']:8.1f} h  "
+              f"{', '.join(o['openNow']) or 'ok now'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import asyncio
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+# Minimal HTTP/1.1 over asyncio streams, enough for the relay and the fleet
+# simulator: Content-Length bodies, keep-alive, no chunked encoding.
+
+MAX_BODY = 4 * 1024 * 1024
+
+REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+           409: "Conflict", 413: "Payload Too Large", 429: "Too Many Requests",
+           500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class HttpError(Exception):
+    pass
+
+
+async def _read_head(reader: asyncio.StreamReader) -> Optional[Tuple[str, Dict[str, str]]]:
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None  # clean close between messages
+        raise HttpError("truncated message")
+    lines = head.decode("latin-1").split("\r\n")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            k, v = line.split(":", 1)
+            headers[k.strip().lower()] = v.strip()
+    return lines[0], headers
+
+
+async def _read_body(reader: asyncio.StreamReader, headers: Dict[str, str]) -> bytes:
+    n = int(headers.get("content-length") or 0)
+    if n > MAX_BODY:
+        raise HttpError("body too large")
+    return await reader.readexactly(n) if n else b""
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    """Read one request. Returns (method, path, headers, body), or None on EOF."""
+    head = await _read_head(reader)
+    if head is None:
+        return None
+    parts = head[0].split()
+    if len(parts) != 3:
+        raise HttpError("bad request line")
+    return parts[0], parts[1], head[1], await _read_body(reader, head[1])
+
+
+def write_response(writer: asyncio.StreamWriter, status: int, body: bytes,
+                   headers: Optional[Dict[str, str]] = None) -> None:
+    lines = [f"HTTP/1.1 {status} {REASONS.get(status, 'Unknown')}",
+             f"Content-Length: {len(body)}", "Content-Type: application/json"]
+    lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+
+
+class Client:
+    """One keep-alive connection to a base URL; reconnects when the server closes it."""
+
+    def __init__(self, url: str, timeout: float = 10.0):
+        u = urlsplit(url)
+        self.host = u.hostname or "127.0.0.1"
+        self.port = u.port or 80
+        self.timeout = timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout)
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+            self._reader = self._writer = None
+
+    async def post(self, path: str, body: bytes, headers: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, str], bytes]:
+        """POST and return (status, headers, body). Raises on connection errors."""
+        for attempt in (0, 1):
+            if self._writer is None:
+                await self._connect()
+            lines = [f"POST {path} HTTP/1.1", f"Host: {self.host}:{self.port}",
+                     f"Content-Length: {len(body)}"]
+            lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+            try:
+                self._writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+                await self._writer.drain()
+                head = await asyncio.wait_for(_read_head(self._reader), self.timeout)
+                if head is None:
+                    raise ConnectionResetError("server closed keep-alive connection")
+                data = await asyncio.wait_for(_read_body(self._reader, head[1]), self.timeout)
+            except (ConnectionError, HttpError, asyncio.IncompleteReadError):
+                await self.close()
+                if attempt:
+                    raise
+                continue  # stale keep-alive connection: retry once on a new one
+            except BaseException:
+                await self.close()
+                raise
+            status = int(head[0].split()[1])
+            if head[1].get("connection", "").lower() == "close":
+                await self.close()
+            return status, head[1], data
+        raise ConnectionError("unreachable")
@@ -0,0 +1,469 @@
+"""
+Benchmarks for the agent's hot paths.
+
+    python bench.py apt [--packages N] [--upgradable FRACTION]
+    python bench.py relay [--clients N] [--machines N] [--seconds S] [--window S]
+    python bench.py checks [--os Linux,Darwin,Windows] [--repeat N] [--fixtures PATH]
+    python bench.py once [--runs N] [--budget SECONDS]
+    python bench.py scan [--roots N] [--list-sets N] [--packages N]
+
+Fleet-scale ingest (simulated agents over days of compressed time) lives in
+fleetsim.py.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import debpkg
+import standin
+from asynchttp import Client
+
+FIXTURE_SOURCE = "fixture.invalid_debian_dists_stable_main_binary-amd64_Packages"
+FIXTURE_BACKPORTS = "fixture.invalid_debian_dists_stable-backports_main_binary-amd64_Packages"
+
+
+def _timed(fn, repeat: int = 1) -> tuple:
+    best, result = None, None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return result, best
+
+
+# ---------------- apt: native counter vs apt-get -s upgrade ----------------
+
+def make_apt_fixture(root: str, packages: int, upgradable: float, seed: int = 1) -> int:
+    """
+    Write a dpkg status and apt lists under root: a stable archive and a
+    backports archive (NotAutomatic, ButAutomaticUpgrades) offering newer
+    versions of every tenth package, which apt must not count. Some updates
+    are phased (Phased-Update-Percentage) and a kernel meta-package's update
+    needs a package that is not installed; apt-get upgrade holds back both.
+    Returns the expected pending count.
+    """
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(root, "var/lib/dpkg"), exist_ok=True)
+    os.makedirs(os.path.join(root, "var/lib/apt/lists"), exist_ok=True)
+    os.makedirs(os.path.join(root, "etc/apt"), exist_ok=True)
+    expected = 0
+    lists_dir = os.path.join(root, debpkg.LISTS_DIR)
+    for suite, extra in (("stable", ""), ("stable-backports", "NotAutomatic: yes\nButAutomaticUpgrades: yes\n")):
+        with open(os.path.join(lists_dir, f"fixture.invalid_debian_dists_{suite}_Release"), "w") as f:
+            f.write(f"Origin: Fixture\nSuite: {suite}\nCodename: {suite}\n{extra}"
+                    f"Architectures: amd64\nComponents: main\n")
+    with open(os.path.join(root, debpkg.STATUS_FILE), "w") as status, \
+            open(os.path.join(lists_dir, FIXTURE_SOURCE), "w") as lists, \
+            open(os.path.join(lists_dir, FIXTURE_BACKPORTS), "w") as backports:
+        for f, extra in ((status, "Status: install ok installed\n"), (lists, "")):
+            # the one dependency every fixture package declares
+            f.write(f"Package: libc6\n{extra}Architecture: amd64\nVersion: 2.36-9\n\n")
+        for i in range(packages):
+            name = f"pkg{i:05d}"
+            installed = f"1.{rng.randint(0, 20)}-{rng.randint(1, 5)}"
+            newer = rng.random() < upgradable
+            candidate = installed + "+deb12u1" if newer else installed
+            phased = f"Phased-Update-Percentage: {rng.randint(0, 90)}\n" if newer and i % 50 == 25 else ""
+            expected += newer and not phased
+            size = rng.randint(10, 9000)
+            pool = (f"Filename: pool/main/p/{name}/{name}_{candidate}_amd64.deb\n"
+                    f"Size: {rng.randint(1000, 900000)}\nSHA256: {'0' * 64}\n")
+            for f, ver, extra in ((status, installed, "Status: install ok installed\n"), (lists, candidate, pool + phased)):
+                f.write(
+                    f"Package: {name}\n{extra}Priority: optional\nSection: misc\n"
+                    f"Installed-Size: {size}\nMaintainer: Fixture <fixture@invalid>\n"
+                    f"Architecture: amd64\nVersion: {ver}\nDepends: libc6 (>= 2.36)\n"
+                    f"Description: fixture package {i}\n\n"
+                )
+            if i % 10 == 0:
+                bpo = candidate + "~bpo12+1" if newer else installed + "+bpo12+1"
+                backports.write(f"Package: {name}\nArchitecture: amd64\nVersion: {bpo}\n"
+                                f"Filename: pool/main/p/{name}/{name}_{bpo}_amd64.deb\n"
+                                f"Size: 1000\nSHA256: {'0' * 64}\n\n")
+        expected += _write_kernel(status, lists)
+    with open(os.path.join(root, "etc/apt/sources.list"), "w") as f:
+        f.write("deb [trusted=yes] http://fixture.invalid/debian stable main\n"
+                "deb [trusted=yes] http://fixture.invalid/debian stable-backports main\n")
+    return expected
+
+
+def _stanza(f, name: str, version: str, extra: str = "", installed: bool = False) -> None:
+    if installed:
+        extra = "Status: install ok installed\n" + extra
+    else:
+        extra += f"Filename: pool/main/l/{name}/{name}_{version}_amd64.deb\nSize: 1000\nSHA256: {'0' * 64}\n"
+    f.write(f"Package: {name}\n{extra}Architecture: amd64\nVersion: {version}\n\n")
+
+
+def _write_kernel(status, lists) -> int:
+    """Kernel packages the way Ubuntu ships them. Returns how many apt-get upgrade upgrades."""
+    old, new = "6.8.0-45", "6.8.0-47"
+    for abi, installed in ((old, True), (new, False)):
+        for f in (status, lists) if installed else (lists,):
+            _stanza(f, f"linux-image-{abi}-generic", f"{abi}.{abi[-2:]}", "Depends: libc6\n", installed=f is status)
+    # the meta-package's update pulls in the next ABI: kept back
+    _stanza(status, "linux-image-generic", f"{old}.45", f"Depends: linux-image-{old}-generic\n", installed=True)
+    _stanza(lists, "linux-image-generic", f"{new}.47", f"Depends: linux-image-{new}-generic\n")
+    # new dependencies that are already satisfied, by an alternative or a Provides: upgraded
+    _stanza(status, "linux-firmware", "20240318.git3b128b60-0ubuntu2", "Provides: firmware-any\n", installed=True)
+    _stanza(lists, "linux-firmware", "20240318.git3b128b60-0ubuntu2.5", "Provides: firmware-any\n")
+    _stanza(status, "linux-base", "4.5ubuntu9", "", installed=True)
+    _stanza(lists, "linux-base", "4.5ubuntu9+24.04.1",
+            "Pre-Depends: firmware-any\nDepends: linux-tools-common | linux-firmware, libc6 (>= 2.36)\n")
+    return 2
+
+
+def apt_get_pending(root: str) -> int:
+    """apt-get -s upgrade pointed at the fixture instead of the live system."""
+    opts = []
+    for k, v in (
+        ("Dir::State::status", os.path.join(root, debpkg.STATUS_FILE)),
+        ("Dir::State::Lists", os.path.join(root, debpkg.LISTS_DIR)),
+        ("Dir::Etc::sourcelist", os.path.join(root, "etc/apt/sources.list")),
+        ("Dir::Etc::sourceparts", "/nonexistent"),
+        ("Dir::Etc::preferences", "/nonexistent"),
+        ("Dir::Etc::preferencesparts", "/nonexistent"),
+        ("Dir::Cache::pkgcache", ""),
+        ("Dir::Cache::srcpkgcache", ""),
+        ("APT::Architecture", "amd64"),
+        # the native counter leaves out every phased update; apt would draw per machine
+        ("APT::Get::Never-Include-Phased-Updates", "true"),
+    ):
+        opts += ["-o", f"{k}={v}"]
+    out = subprocess.run(["apt-get", *opts, "-s", "upgrade"], text=True,
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+    return sum(1 for line in out.splitlines() if line.startswith("Inst "))
+
+
+def bench_apt(args) -> None:
+    root = tempfile.mkdtemp(prefix="syshealth-apt-")
+    try:
+        expected = make_apt_fixture(root, args.packages, args.upgradable)
+        print(f"fixture: {args.packages} packages, {expected} upgradable")
+
+        debpkg._cache.clear()
+        debpkg._counts.clear()
+        n, cold = _timed(lambda: debpkg.pending_upgrades(root))
+        _, warm = _timed(lambda: debpkg.pending_upgrades(root), repeat=5)
+        print(f"native   cold {cold * 1000:8.1f} ms  warm {warm * 1000:8.2f} ms  pending={n}")
+
+        if shutil.which("apt-get"):
+            m, shell = _timed(lambda: apt_get_pending(root), repeat=3)
+            print(f"apt-get       {shell * 1000:8.1f} ms                   pending={m}")
+        else:
+            print("apt-get not found; skipping shell-out comparison")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+# ---------------- relay: ingest throughput against a stand-in upstream ----------------
+
+def _percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def random_snapshot(rng: random.Random, machine_id: str) -> dict:
+    """A report shaped like main.collect_snapshot with randomized values."""
+    tri = lambda: rng.choice([True, True, True, False, None])
+    pending = rng.choice([0, 0, 0, rng.randint(1, 40), None])
+    timeout = rng.choice([5, 10, 15, 30, None])
+    return {
+        "machineId": machine_id,
+        "hostname": f"host-{machine_id[:6]}",
+        "os": rng.choice(["Linux", "Darwin", "Windows"]),
+        "osVersion": rng.choice(["Ubuntu 24.04.1 LTS", "14.6.1", "10.0.22631"]),
+        "diskEncrypted": tri(),
+        "osUpdated": None if pending is None else pending == 0,
+        "updatesPending": pending,
+        "antivirusInstalled": tri(),
+        "antivirusRunning": tri(),
+        "antivirusName": rng.choice(["clamd", "falcond", "Windows Defender", None]),
+        "sleepPolicyOk": None if timeout is None else timeout <= 10,
+        "sleepTimeoutMinutes": timeout,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def bench_relay(args) -> None:
+    import threading
+    from pathlib import Path
+
+    import relay
+
+    upstream = standin.start(keep=False)
+    state_dir = Path(tempfile.mkdtemp(prefix="syshealth-relay-"))
+    ready = {}
+
+    def run_relay():
+        async def go():
+            r = relay.Relay(upstream.url + "/batch", state_dir, {"dev-agent-token"}, window=args.window)
+            ready["relay"] = r
+            started = asyncio.get_running_loop().create_future()
+            task = asyncio.ensure_future(relay.serve(r, "127.0.0.1", 0, started))
+            ready["port"] = await started
+            await task
+        asyncio.run(go())
+
+    threading.Thread(target=run_relay, daemon=True).start()
+    while "port" not in ready:
+        time.sleep(0.01)
+    url = f"http://127.0.0.1:{ready['port']}"
+    headers = {"Authorization": "Bearer dev-agent-token", "Content-Type": "application/json"}
+    latencies, errors = [], [0]
+
+    async def agent(i: int, stop_at: float):
+        rng = random.Random(i)
+        client = Client(url)
+        while time.monotonic() < stop_at:
+            mid = f"{rng.randrange(args.machines):016x}"
+            body = json.dumps(random_snapshot(rng, mid)).encode()
+            t0 = time.perf_counter()
+            try:
+                status, _, _ = await client.post("/api/report", body, headers)
+            except Exception:
+                status = 0
+            if status == 200:
+                latencies.append(time.perf_counter() - t0)
+            else:
+                errors[0] += 1
+        await client.close()
+
+    async def drive():
+        stop_at = time.monotonic() + args.seconds
+        await asyncio.gather(*(agent(i, stop_at) for i in range(args.clients)))
+
+    t0 = time.perf_counter()
+    asyncio.run(drive())
+    elapsed = time.perf_counter() - t0
+    r = ready["relay"]
+    deadline = time.monotonic() + 30
+    while len(r.queue) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    print(f"{args.clients} clients, {args.machines} machines, window {args.window}s, {elapsed:.1f}s")
+    print(f"ingested   {len(latencies) / elapsed:10.0f} reports/s   errors={errors[0]}")
+    print(f"latency    p50 {_percentile(latencies, 50) * 1000:.1f} ms  p99 {_percentile(latencies, 99) * 1000:.1f} ms")
+    print(f"relay      {json.dumps(r.stats)}")
+    print(f"upstream   {upstream.stats['requests']} requests, {upstream.stats['reports']} reports, "
+          f"{upstream.stats['bytes'] / max(1, upstream.stats['reports']):.0f} B/report gzip")
+    upstream.shutdown()
+    shutil.rmtree(state_dir, ignore_errors=True)
+
+
+# ---------------- checks: per-check cost on recorded command output ----------------
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "commands.json"
+
+
+@contextmanager
+def replay(os_name: str, recorded: dict):
+    """
+    Make checks.py behave as on `os_name`, answering commands from recorded
+    output instead of running them, and platform.version() and files such as
+    /etc/os-release from the recording too. Native /proc probes and the dpkg
+    reader are switched off so the command parsing paths are what gets measured.
+    """
+    import checks
+    import procs
+
+    root = tempfile.mkdtemp(prefix="syshealth-replay-")
+    for rel, content in recorded.get("files", {}).items():
+        os.makedirs(os.path.dirname(os.path.join(root, rel)), exist_ok=True)
+        with open(os.path.join(root, rel), "w") as f:
+            f.write(content)
+    os_release_name = checks.os_release_name
+
+    def fake_run(cmd, shell=False, timeout=None):
+        line = cmd if isinstance(cmd, str) else " ".join(cmd)
+        for needle, code, out in recorded["commands"]:
+            if needle in line:
+                return code, out
+        return 127, f"ERROR: no fixture for {line!r}"
+
+    table = [tuple(p) for p in recorded["processes"]]
+    patched = {
+        (checks.platform, "system"): lambda: os_name,
+        (checks.platform, "version"): lambda: recorded["version"],
+        (checks, "os_release_name"): lambda r="/": os_release_name(root),
+        (checks, "run_command"): fake_run,
+        (checks, "has_command"): lambda name: name in recorded["tools"],
+        (checks, "process_index"): lambda: procs.ProcessIndex(table, procs.AV_PROCESSES.get(os_name, [])),
+        (checks.native, "available"): lambda *a: False,
+        (checks.debpkg, "pending_upgrades"): lambda *a: None,
+    }
+    saved = {k: getattr(*k) for k in patched}
+    try:
+        for (obj, attr), value in patched.items():
+            setattr(obj, attr, value)
+        yield
+    finally:
+        for (obj, attr), value in saved.items():
+            setattr(obj, attr, value)
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def bench_checks(args) -> None:
+    import checks
+
+    fixtures = json.loads(Path(args.fixtures).read_text())
+    fns = [checks.get_os_summary, checks.check_disk_encryption, checks.check_updates,
+           checks.check_antivirus, checks.check_sleep_policy]
+    for os_name in args.os.split(","):
+        print(f"{os_name}")
+        with replay(os_name, fixtures[os_name]):
+            for fn in fns:
+                raw = fn.__wrapped__  # bypass the result cache
+                result = raw()
+                t0 = time.perf_counter()
+                for _ in range(args.repeat):
+                    raw()
+                per_call = (time.perf_counter() - t0) / args.repeat
+                print(f"  {fn.__name__:24s} {per_call * 1e6:9.1f} µs  {json.dumps(result)}")
+
+
+# ---------------- once: cold start to exit of main.py --once ----------------
+
+HERE = Path(__file__).resolve().parent
+
+
+def bench_once(args) -> None:
+    """
+    Time `main.py --once` from process start to exit with a warm check cache,
+    so what is measured is interpreter start, imports and the send path, not
+    the checks themselves. Exits 1 when the median is over --budget;
+    tests/test_once.py asserts the same budget.
+    """
+    srv = standin.start(keep=False)
+    state = tempfile.mkdtemp(prefix="syshealth-once-")
+    env = dict(os.environ, SYSHEALTH_STATE_DIR=state, SYSHEALTH_API_URL=srv.url)
+
+    def run(*argv) -> float:
+        t0 = time.perf_counter()
+        p = subprocess.run([sys.executable, *argv], cwd=HERE, env=env,
+                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        dt = time.perf_counter() - t0
+        if p.returncode not in (0, 2):
+            raise SystemExit(f"{' '.join(argv)} exited {p.returncode}:\n{p.stdout}")
+        return dt
+
+    try:
+        run("main.py", "--once", "--force")  # fill the check cache
+        heavy = subprocess.run(
+            [sys.executable, "-c", "import sys, main; print(','.join(m for m in ('requests', 'urllib3', 'http.server') if m in sys.modules))"],
+            cwd=HERE, env=env, stdout=subprocess.PIPE, text=True).stdout.strip()
+        rows = [
+            ("python -c pass", ["-c", "pass"]),
+            ("import main", ["-c", "import main"]),
+            ("--once, unchanged", ["main.py", "--once"]),
+            ("--once --force (sends)", ["main.py", "--once", "--force"]),
+        ]
+        medians = {}
+        for label, argv in rows:
+            times = [run(*argv) for _ in range(args.runs)]
+            medians[label] = statistics.median(times)
+            print(f"{label:24s} median {medians[label] * 1000:7.1f} ms  max {max(times) * 1000:7.1f} ms")
+        print(f"heavy modules on import: {heavy or 'none'}")
+        worst = max(medians["--once, unchanged"], medians["--once --force (sends)"])
+        verdict = "ok" if worst <= args.budget else "OVER BUDGET"
+        print(f"cold start to exit {worst * 1000:.0f} ms, budget {args.budget * 1000:.0f} ms: {verdict}")
+        if worst > args.budget:
+            raise SystemExit(1)
+    finally:
+        srv.shutdown()
+        shutil.rmtree(state, ignore_errors=True)
+
+
+# ---------------- scan: offline image scan over fixture root trees ----------------
+
+def make_rootfs(root: str, list_set: int, packages: int, upgradable: float) -> int:
+    """A minimal Debian-like root: os-release, hostname and a dpkg/apt fixture. Returns expected pending."""
+    expected = make_apt_fixture(root, packages, upgradable, seed=list_set)
+    os.makedirs(os.path.join(root, "usr/lib"), exist_ok=True)
+    with open(os.path.join(root, "usr/lib/os-release"), "w") as f:
+        f.write(f'PRETTY_NAME="Debian GNU/Linux 12 (bookworm) fixture {list_set}"\nID=debian\n')
+    os.symlink("../usr/lib/os-release", os.path.join(root, "etc/os-release"))
+    with open(os.path.join(root, "etc/hostname"), "w") as f:
+        f.write(os.path.basename(root) + "\n")
+    return expected
+
+
+def bench_scan(args) -> None:
+    import scan
+
+    base = tempfile.mkdtemp(prefix="syshealth-scan-")
+    try:
+        roots, expected = [], {}
+        for i in range(args.roots):
+            root = os.path.join(base, f"image{i:03d}")
+            expected[root] = make_rootfs(root, i % args.list_sets, args.packages, args.upgradable)
+            roots.append(root)
+        print(f"{args.roots} roots, {args.list_sets} distinct apt list sets, {args.packages} packages each")
+        cores = os.cpu_count() or 1
+        workers = sorted({1, 2, 4, 8, cores} & set(range(1, cores + 1)))
+        base_rate = None
+        for w in workers:
+            results, dt = _timed(lambda: scan.scan(roots, w))
+            wrong = [r["root"] for r in results if r["payload"]["updatesPending"] != expected[r["root"]]]
+            rate = len(roots) / dt
+            base_rate = base_rate or rate
+            print(f"workers {w:2d}  {dt * 1000:8.0f} ms  {rate:7.1f} roots/s  x{rate / base_rate:4.2f}"
+                  f"  {'ok' if not wrong else f'{len(wrong)} WRONG'}")
+        if cores == 1:
+            print("one core available: scaling across workers not measurable here")
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("apt", help="native pending-update count vs apt-get -s upgrade")
+    p.add_argument("--packages", type=int, default=3000)
+    p.add_argument("--upgradable", type=float, default=0.05)
+    p.set_defaults(fn=bench_apt)
+
+    p = sub.add_parser("relay", help="relay ingest throughput with a stand-in upstream")
+    p.add_argument("--clients", type=int, default=500)
+    p.add_argument("--machines", type=int, default=5000)
+    p.add_argument("--seconds", type=float, default=10)
+    p.add_argument("--window", type=float, default=0.25)
+    p.set_defaults(fn=bench_relay)
+
+    p = sub.add_parser("checks", help="per-check cost, replaying recorded command output")
+    p.add_argument("--os", default="Linux,Darwin,Windows")
+    p.add_argument("--repeat", type=int, default=2000)
+    p.add_argument("--fixtures", default=str(FIXTURES))
+    p.set_defaults(fn=bench_checks)
+
+    p = sub.add_parser("once", help="cold start to exit of main.py --once, checks cached")
+    p.add_argument("--runs", type=int, default=10)
+    p.add_argument("--budget", type=float, default=1.0, help="seconds; exit 1 when over")
+    p.set_defaults(fn=bench_once)
+
+    p = sub.add_parser("scan", help="offline image scan over generated root trees, per worker count")
+    p.add_argument("--roots", type=int, default=32)
+    p.add_argument("--list-sets", type=int, default=4, help="distinct apt list sets among the roots")
+    p.add_argument("--packages", type=int, default=3000)
+    p.add_argument("--upgradable", type=float, default=0.05)
+    p.set_defaults(fn=bench_scan)
+
+    args = ap.parse_args()
+    args.fn(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import functools
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from config import CHECK_CACHE_FILE, ensure_state_dir
+
+# Result cache for checks.py. Each check declares a TTL and the files whose
+# change invalidates its result; entries persist under STATE_DIR so a
+# restarted agent does not re-run checks that are still fresh.
+
+_lock = threading.Lock()
+_entries: Optional[Dict[str, Dict[str, Any]]] = None
+stats = {"hits": 0, "misses": 0}
+
+
+def _signature(paths: List[str]) -> List[list]:
+    sig = []
+    for p in paths:
+        try:
+            st = os.stat(p)
+            sig.append([p, st.st_mtime_ns, st.st_size])
+        except OSError:
+            sig.append([p, None, None])
+    return sig
+
+
+def _load() -> Dict[str, Dict[str, Any]]:
+    global _entries
+    if _entries is None:
+        try:
+            _entries = json.loads(CHECK_CACHE_FILE.read_text())
+        except Exception:
+            _entries = {}
+    return _entries
+
+
+def _save() -> None:
+    ensure_state_dir()
+    tmp = CHECK_CACHE_FILE.with_suffix(".tmp")
+    tmp.write_text(json.dumps(_entries, separators=(",", ":")))
+    os.replace(tmp, CHECK_CACHE_FILE)
+
+
+def cached(ttl: float, watch: Optional[List[str]] = None):
+    """
+    Cache a check's result for `ttl` seconds, or until any file in `watch`
+    changes (mtime/size, appearing or disappearing).
+    The wrapped function gains .refresh() to bypass the cache and store a new result.
+    """
+    watch = list(watch or [])
+
+    def deco(fn: Callable[[], Any]):
+        name = fn.__name__
+
+        def refresh():
+            value = fn()
+            with _lock:
+                _load()[name] = {"value": value, "at": time.time(), "files": _signature(watch)}
+                _save()
+            return value
+
+        @functools.wraps(fn)
+        def wrapper():
+            with _lock:
+                entry = _load().get(name)
+                fresh = (
+                    entry is not None
+                    and time.time() - entry["at"] < ttl
+                    and entry["files"] == _signature(watch)
+                )
+                stats["hits" if fresh else "misses"] += 1
+            if fresh:
+                return entry["value"]
+            return refresh()
+
+        wrapper.refresh = refresh
+        wrapper.ttl = ttl
+        wrapper.watch = watch
+        return wrapper
+
+    return deco
+
+
+def signature(fn: Callable[[], Any]) -> Optional[List[list]]:
+    """Current state of the files a cached check watches; None when it watches none."""
+    watch = getattr(fn, "watch", None)
+    return _signature(watch) if watch else None
+
+
+def take_stats() -> Dict[str, int]:
+    """Return hit/miss counts since the last call and reset them."""
+    with _lock:
+        out = dict(stats)
+        stats["hits"] = stats["misses"] = 0
+    return out
@@ -1,20 +1,45 @@
 import json
+import os
 import platform
 import re
 from typing import Optional, Dict, Any
 
-from utils import run_command
+import debpkg
+import native
+from cache import cached
+from procs import AV_PROCESSES, AV_SERVICES, process_index
+from utils import run_command, has_command
 
 
+HOUR = 3600
+
+# TTLs and invalidating files per check; see cache.py
+
+def os_release_name(root: str = "/") -> Optional[str]:
+    """PRETTY_NAME from os-release under root (an image tree or "/")."""
+    for rel in ("etc/os-release", "usr/lib/os-release"):
+        path = os.path.join(root, rel)
+        if root != "/" and os.path.islink(path):
+            target = os.readlink(path)
+            if os.path.isabs(target):  # absolute links point into the image, not the host
+                path = os.path.join(root, target.lstrip("/"))
+        try:
+            with open(path, "r") as f:
+                kv = dict(line.strip().split("=", 1) for line in f if "=" in line)
+        except OSError:
+            continue
+        return kv.get("PRETTY_NAME", "").strip('"\'') or None
+    return None
+
+
+@cached(ttl=24 * HOUR, watch=["/etc/os-release", "/usr/lib/os-release"])
 def get_os_summary() -> Dict[str, str]:
     os_name = platform.system()
     version = platform.version()
     pretty = version
     if os_name == "Linux":
         try:
-            with open("/etc/os-release", "r") as f:
-                kv = dict(line.strip().split("=", 1) for line in f if "=" in line)
-            pretty = kv.get("PRETTY_NAME", "").strip('"') or version
+            pretty = os_release_name() or version
         except Exception:
             pretty = version
     elif os_name == "Darwin":
@@ -26,6 +51,7 @@ def get_os_summary() -> Dict[str, str]:
 
 # ---------------- Disk Encryption ----------------
 
+@cached(ttl=6 * HOUR, watch=["/etc/crypttab"])
 def check_disk_encryption() -> Optional[bool]:
     os_name = platform.system()
     try:
@@ -51,6 +77,8 @@ def check_disk_encryption() -> Optional[bool]:
             return None
 
         if os_name == "Linux":
+            if native.available():
+                return native.disk_encryption()
             # Heuristics: root on /dev/mapper/* or any 'crypt' type in lsblk
             code, src = run_command("findmnt -n -o SOURCE /")
             if code == 0 and ("/dev/mapper/" in src or "crypt" in src):
@@ -74,6 +102,11 @@ def check_disk_encryption() -> Optional[bool]:
 
 # ---------------- Update Status ----------------
 
+@cached(ttl=2 * HOUR, watch=[
+    "/var/lib/dpkg/status", "/var/lib/apt/lists", "/etc/apt/preferences", "/etc/apt/preferences.d",
+    "/var/log/pacman.log", "/var/lib/pacman/local",
+    "/var/lib/rpm", "/var/log/dnf.rpm.log",
+])
 def check_updates() -> Dict[str, Any]:
     """
     Returns {"pending": <int|None>, "upToDate": <bool|None>}
@@ -102,28 +135,28 @@ def check_updates() -> Dict[str, Any]:
             return {"pending": (pending if pending > 0 else None), "upToDate": (pending == 0)}
 
         if os_name == "Linux":
+            # Debian family: count natively from dpkg status + apt lists
+            pending = debpkg.pending_upgrades()
+            if pending is not None:
+                return {"pending": pending, "upToDate": pending == 0}
             # apt-based
-            c, _ = run_command("bash -lc 'command -v apt-get >/dev/null 2>&1'")
-            if c == 0:
-                c2, out = run_command("bash -lc 'apt-get -s upgrade | grep -E \"^Inst\\s\" -c || true'")
+            if has_command("apt-get"):
+                c2, out = run_command("apt-get -s upgrade | grep -E '^Inst\\s' -c || true", shell=True)
                 if c2 == 0 and out.strip().isdigit():
                     pending = int(out.strip())
                     return {"pending": pending, "upToDate": pending == 0}
             # dnf / yum: exit 100 indicates updates available (we can’t easily count)
-            c, _ = run_command("bash -lc 'command -v dnf >/dev/null 2>&1'")
-            if c == 0:
-                c2, out = run_command("bash -lc 'dnf -q check-update >/dev/null 2>&1; echo $?'", shell=True)
+            if has_command("dnf"):
+                c2, out = run_command("dnf -q check-update >/dev/null 2>&1; echo $?", shell=True)
                 has_updates = out.strip().endswith("100")
                 return {"pending": None, "upToDate": (not has_updates)}
-            c, _ = run_command("bash -lc 'command -v yum >/dev/null 2>&1'")
-            if c == 0:
-                c2, out = run_command("bash -lc 'yum -q check-update >/dev/null 2>&1; echo $?'", shell=True)
+            if has_command("yum"):
+                c2, out = run_command("yum -q check-update >/dev/null 2>&1; echo $?", shell=True)
                 has_updates = out.strip().endswith("100")
                 return {"pending": None, "upToDate": (not has_updates)}
             # pacman
-            c, _ = run_command("bash -lc 'command -v pacman >/dev/null 2>&1'")
-            if c == 0:
-                c2, out = run_command("bash -lc 'pacman -Qu 2>/dev/null | wc -l'")
+            if has_command("pacman"):
+                c2, out = run_command("pacman -Qu 2>/dev/null | wc -l", shell=True)
                 if c2 == 0 and out.strip().isdigit():
                     pending = int(out.strip())
                     return {"pending": pending, "upToDate": pending == 0}
@@ -136,6 +169,7 @@ def check_updates() -> Dict[str, Any]:
 
 # ---------------- Antivirus ----------------
 
+@cached(ttl=10 * 60)
 def check_antivirus() -> Dict[str, Any]:
     """
     Returns {"installed": <bool|None>, "running": <bool|None>, "name": <str|None>}
@@ -167,33 +201,26 @@ def check_antivirus() -> Dict[str, Any]:
             return {"installed": None, "running": None, "name": None}
 
         if os_name == "Darwin":
-            candidates = [
-                "falcond", "SophosScanD", "SophosServiceManager",
-                "symantec", "NortonSecurity", "McAfee", "masvc", "mfemactl",
-                "bdredline"
-            ]
-            found = []
-            for p in candidates:
-                c, out = run_command(f"pgrep -lf {p}", shell=True)
-                if c == 0 and out:
-                    found.append(p)
+            found = process_index().running(AV_PROCESSES["Darwin"])
             installed = len(found) > 0
             return {"installed": installed, "running": installed, "name": (", ".join(found) if installed else None)}
 
         if os_name == "Linux":
-            services = ["clamav-daemon", "clamd", "sophosav", "bdscan", "bdredline"]
+            services = AV_SERVICES["Linux"]
+            use_native = native.available()
             found = []
             running_any = False
             for s in services:
-                c, out = run_command(f"systemctl is-active {s}")
-                if c == 0 and out.strip() == "active":
+                if use_native:
+                    active = native.unit_active(s)
+                else:
+                    c, out = run_command(f"systemctl is-active {s}")
+                    active = c == 0 and out.strip() == "active"
+                if active:
                     running_any = True
                     found.append(s)
             if not found:
-                for p in ["clamd", "freshclam", "savd", "bdscan"]:
-                    c, out = run_command(f"pgrep -lf {p}", shell=True)
-                    if c == 0 and out:
-                        found.append(p)
+                found = process_index().running(AV_PROCESSES["Linux"])
             installed = len(found) > 0
             return {"installed": installed, "running": installed or running_any, "name": (", ".join(found) if installed else None)}
 
@@ -204,6 +231,7 @@ def check_antivirus() -> Dict[str, Any]:
 
 # ---------------- Sleep Policy ----------------
 
+@cached(ttl=HOUR, watch=[os.path.expanduser("~/.config/dconf/user")])
 def check_sleep_policy() -> Dict[str, Any]:
     """
     Returns {"timeoutMinutes": <int|None>, "ok": <bool|None>}
@@ -239,17 +267,14 @@ def check_sleep_policy() -> Dict[str, Any]:
 
         if os_name == "Linux":
             # GNOME settings (seconds)
-            c, _ = run_command("bash -lc 'command -v gsettings >/dev/null 2>&1'")
-            if c == 0:
+            if has_command("gsettings"):
                 c1, ttype = run_command("gsettings get org.gnome.settings-daemon.plugins.power sleep-inactive-ac-type")
                 c2, tout = run_command("gsettings get org.gnome.settings-daemon.plugins.power sleep-inactive-ac-timeout")
                 if c1 == 0 and c2 == 0 and ttype:
                     ttype = ttype.strip().strip("'\"")
-                    seconds = None
-                    try:
-                        seconds = int(re.sub(r"[^0-9]", "", tout))
-                    except Exception:
-                        seconds = None
+                    # gsettings prints "uint32 900": take the value, not the type's digits
+                    nums = re.findall(r"\d+", tout)
+                    seconds = int(nums[-1]) if nums else None
                     if seconds is not None:
                         minutes = seconds // 60
                         ok = (ttype != "nothing") and (minutes != 0 and minutes <= 10)
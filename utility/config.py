@@ -4,15 +4,50 @@ from pathlib import Path
 # ---- Editable defaults (or override via environment variables) ----
 API_URL = os.getenv("SYSHEALTH_API_URL", "https://system-health-monitor-arqh.onrender.com/api/reports")
 API_KEY = os.getenv("SYSHEALTH_API_KEY", "dev-agent-token")
+BATCH_URL = os.getenv("SYSHEALTH_BATCH_URL", API_URL.rstrip("/") + "/batch")
 INTERVAL_MINUTES = int(os.getenv("SYSHEALTH_INTERVAL_MINUTES", "30"))  # clamp 15–60 in main
 JITTER_SECONDS = int(os.getenv("SYSHEALTH_JITTER_SECONDS", "30"))
+# Upload pacing (see pacing.py). The start-up report waits a per-machine
+# offset within this window (empty = one interval) so a fleet that reboots
+# together reports spread out; change reports are capped at a burst of
+# REPORT_BURST, refilled at REPORTS_PER_HOUR.
+STARTUP_SPLAY_SECONDS = os.getenv("SYSHEALTH_STARTUP_SPLAY_SECONDS", "")
+STARTUP_SPLAY_SECONDS = int(STARTUP_SPLAY_SECONDS) if STARTUP_SPLAY_SECONDS else None
+REPORT_BURST = int(os.getenv("SYSHEALTH_REPORT_BURST", "4"))
+REPORTS_PER_HOUR = float(os.getenv("SYSHEALTH_REPORTS_PER_HOUR", "6"))
 
 # Where the agent stores its state (machine id, last payload)
 STATE_DIR = Path(os.getenv("SYSHEALTH_STATE_DIR", Path.home() / ".syshealth-utility"))
-STATE_DIR.mkdir(parents=True, exist_ok=True)
 
 MACHINE_ID_FILE = STATE_DIR / "machine_id"
 LAST_STATE_FILE = STATE_DIR / "last_state.json"
+CHECK_CACHE_FILE = STATE_DIR / "check_cache.json"
+OUTBOX_FILE = STATE_DIR / "outbox.log"
+OUTBOX_ACK_FILE = STATE_DIR / "outbox.ack"
+PROFILE_DIR = STATE_DIR / "profile"
+# Local state history (see history.py): fixed-size ring of packed records.
+# 16384 records of 18 bytes ≈ 300 KB, years of change-only history.
+HISTORY_FILE = STATE_DIR / "history.bin"
+HISTORY_RECORDS = int(os.getenv("SYSHEALTH_HISTORY_RECORDS", "16384"))
+
+# Agent self-metrics (see metrics.py): Prometheus textfile, rewritten every
+# cycle (empty = off), and an optional localhost /metrics endpoint (0 = off)
+METRICS_FILE = os.getenv("SYSHEALTH_METRICS_FILE", str(STATE_DIR / "syshealth.prom")) or None
+METRICS_FILE = Path(METRICS_FILE) if METRICS_FILE else None
+METRICS_PORT = int(os.getenv("SYSHEALTH_METRICS_PORT", "0"))
 
 REQUEST_TIMEOUT_SECONDS = 8
+OUTBOX_BATCH_SIZE = 50
 COMMAND_TIMEOUT_SECONDS = 20
+# Persistent bash workers shared by all shell commands (see utils.ShellPool)
+SHELL_WORKERS = int(os.getenv("SYSHEALTH_SHELL_WORKERS", "2"))
+# Each check in collect_snapshot runs concurrently against its own deadline
+CHECK_DEADLINE_SECONDS = int(os.getenv("SYSHEALTH_CHECK_DEADLINE_SECONDS", "30"))
+# Share of one core a single check may use; slow checks are scheduled less often
+CHECK_CPU_BUDGET = float(os.getenv("SYSHEALTH_CHECK_CPU_BUDGET", "0.002"))
+
+
+def ensure_state_dir() -> Path:
+    """Create STATE_DIR before the first write; importing config touches nothing."""
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    return STATE_DIR
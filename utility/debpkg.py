@@ -0,0 +1,355 @@
+import glob
+import gzip
+import hashlib
+import os
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+# Native pending-update counter for Debian-family systems: installed versions
+# from /var/lib/dpkg/status against the candidates in /var/lib/apt/lists,
+# compared with dpkg's version ordering. Candidates follow apt's default
+# archive priorities (see "Priorities" below), and like `apt-get upgrade` it
+# leaves out phased updates and candidates that depend on a package that is
+# not installed (kept back). With apt pinning configured the counter
+# declines and the caller asks apt-get. Parsed files are cached per
+# path and reused until their mtime or size changes. Every function takes the
+# root of the filesystem so image trees and fixtures can be used.
+
+STATUS_FILE = "var/lib/dpkg/status"
+LISTS_DIR = "var/lib/apt/lists"
+PREFERENCES = ["etc/apt/preferences", "etc/apt/preferences.d"]
+APT_CONF = ["etc/apt/apt.conf", "etc/apt/apt.conf.d"]
+
+Key = Tuple[str, str]  # (package, architecture)
+Deps = Tuple[Tuple[str, ...], ...]  # Depends + Pre-Depends: groups of alternative package names
+
+
+# ---------------- Version comparison ----------------
+
+def _order(c: str) -> int:
+    # dpkg: '~' sorts before everything, even the end of the string;
+    # letters sort before non-letters.
+    if c == "~":
+        return -1
+    if c.isdigit():
+        return 0
+    if c.isalpha():
+        return ord(c)
+    return ord(c) + 256
+
+
+def _compare_part(a: str, b: str) -> int:
+    i = j = 0
+    while i < len(a) or j < len(b):
+        first_diff = 0
+        while (i < len(a) and not a[i].isdigit()) or (j < len(b) and not b[j].isdigit()):
+            ac = _order(a[i]) if i < len(a) and not a[i].isdigit() else 0
+            bc = _order(b[j]) if j < len(b) and not b[j].isdigit() else 0
+            if ac != bc:
+                return ac - bc
+            i += 1
+            j += 1
+        while i < len(a) and a[i] == "0":
+            i += 1
+        while j < len(b) and b[j] == "0":
+            j += 1
+        while i < len(a) and a[i].isdigit() and j < len(b) and b[j].isdigit():
+            if not first_diff:
+                first_diff = ord(a[i]) - ord(b[j])
+            i += 1
+            j += 1
+        if i < len(a) and a[i].isdigit():
+            return 1
+        if j < len(b) and b[j].isdigit():
+            return -1
+        if first_diff:
+            return first_diff
+    return 0
+
+
+def _split_version(v: str) -> Tuple[int, str, str]:
+    epoch = 0
+    if ":" in v:
+        e, v = v.split(":", 1)
+        epoch = int(e) if e.isdigit() else 0
+    upstream, _, revision = v.rpartition("-")
+    if not upstream:
+        upstream, revision = revision, ""
+    return epoch, upstream, revision
+
+
+def compare_versions(a: str, b: str) -> int:
+    """Compare two Debian versions like `dpkg --compare-versions`. <0, 0 or >0."""
+    ea, ua, ra = _split_version(a)
+    eb, ub, rb = _split_version(b)
+    if ea != eb:
+        return ea - eb
+    return _compare_part(ua, ub) or _compare_part(ra, rb)
+
+
+# ---------------- Parsing ----------------
+
+_FIELDS = ("Package:", "Version:", "Architecture:", "Status:", "Provides:",
+           "Depends:", "Pre-Depends:", "Phased-Update-Percentage:")
+
+
+def _stanzas(path: str) -> Iterator[Dict[str, str]]:
+    """Yield the fields of each stanza that the counter uses (_FIELDS)."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", errors="replace") as f:
+        cur: Dict[str, str] = {}
+        for line in f:
+            if line == "\n":
+                if cur:
+                    yield cur
+                    cur = {}
+            elif line.startswith(_FIELDS):
+                k, _, v = line.partition(":")
+                cur[k] = v.strip()
+        if cur:
+            yield cur
+
+
+def _names(field: str) -> Deps:
+    """"a (>= 1), b:any | c [amd64]" -> (("a",), ("b", "c")): names only, versions ignored."""
+    groups = []
+    for group in field.split(","):
+        alts = tuple(alt.split("(")[0].split("[")[0].split(":")[0].strip() for alt in group.split("|"))
+        if any(alts):
+            groups.append(tuple(a for a in alts if a))
+    return tuple(groups)
+
+
+def _parse_status(path: str) -> Tuple[Dict[Key, str], Set[str]]:
+    """
+    (installed versions, names that satisfy a dependency: installed packages
+    and what they provide).
+    """
+    installed, provided = {}, set()
+    for st in _stanzas(path):
+        if "Package" not in st or not st.get("Status", "").endswith(" ok installed"):
+            continue
+        provided.add(st["Package"])
+        provided.update(alt for group in _names(st.get("Provides", "")) for alt in group)
+        # held packages ("hold ok installed") are not offered by apt-get upgrade
+        if st["Status"] == "install ok installed" and "Version" in st:
+            installed[(st["Package"], st.get("Architecture", ""))] = st["Version"]
+    return installed, provided
+
+
+def _phased(st: Dict[str, str]) -> bool:
+    try:
+        return int(st.get("Phased-Update-Percentage", "100")) < 100
+    except ValueError:
+        return False
+
+
+def _parse_packages(path: str) -> Dict[Key, Tuple[str, Deps, bool]]:
+    """The newest version of each package in a list: (version, dependencies, phased)."""
+    best: Dict[Key, Tuple[str, Deps, bool]] = {}
+    for st in _stanzas(path):
+        if "Package" not in st or "Version" not in st:
+            continue
+        key = (st["Package"], st.get("Architecture", ""))
+        cur = best.get(key)
+        if cur is None or compare_versions(st["Version"], cur[0]) > 0:
+            deps = _names(st.get("Pre-Depends", "")) + _names(st.get("Depends", ""))
+            best[key] = (st["Version"], deps, _phased(st))
+    return best
+
+
+_cache: Dict[str, Tuple[int, int, Any]] = {}
+_counts: Dict[str, tuple] = {}  # root -> (signature of its input files, count)
+
+
+def _cached(path: str, parser) -> Any:
+    st = os.stat(path)
+    hit = _cache.get(path)
+    if hit and hit[0] == st.st_mtime_ns and hit[1] == st.st_size:
+        return hit[2]
+    parsed = parser(path)
+    _cache[path] = (st.st_mtime_ns, st.st_size, parsed)
+    return parsed
+
+
+def _signature(paths: list) -> tuple:
+    stats = [(p, os.stat(p)) for p in paths]
+    return tuple((p, st.st_mtime_ns, st.st_size) for p, st in stats)
+
+
+def package_lists(root: str = "/") -> list:
+    lists = os.path.join(root, LISTS_DIR)
+    return sorted(glob.glob(os.path.join(lists, "*_Packages")) + glob.glob(os.path.join(lists, "*_Packages.gz")))
+
+
+# ---------------- Priorities ----------------
+#
+# apt's default policy without pins: an archive has priority 500, 100 when its
+# Release file says "NotAutomatic: yes" and "ButAutomaticUpgrades: yes"
+# (backports), 1 with NotAutomatic alone (experimental, -proposed on some
+# distributions). The installed version has at least 100. The candidate is the
+# version with the highest priority, the newest on a tie; versions older than
+# the installed one are never candidates (no downgrades below priority 1000).
+
+DEFAULT_PRIORITY = 500
+INSTALLED_PRIORITY = 100
+
+
+def _release_fields(path: str) -> Dict[str, str]:
+    """Header fields of a Release/InRelease file, up to the checksum lists."""
+    fields = {}
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if line.startswith(("MD5Sum:", "SHA1:", "SHA256:", "SHA512:", "-----BEGIN PGP SIGNATURE")):
+                break
+            k, sep, v = line.partition(":")
+            if sep and not line[0].isspace():
+                fields[k.strip()] = v.strip()
+    return fields
+
+
+def _release_priority(path: str) -> int:
+    fields = _cached(path, _release_fields)
+    if fields.get("NotAutomatic", "").lower() == "yes":
+        return 100 if fields.get("ButAutomaticUpgrades", "").lower() == "yes" else 1
+    return DEFAULT_PRIORITY
+
+
+def has_pinning(root: str = "/") -> bool:
+    """True when apt preferences or a default release change the priorities above."""
+    for rel in PREFERENCES:
+        path = os.path.join(root, rel)
+        files = [os.path.join(path, n) for n in os.listdir(path)] if os.path.isdir(path) else [path]
+        for f in files:
+            name = os.path.basename(f)
+            # apt ignores preferences.d entries other than *.pref or extension-less names
+            if os.path.isdir(path) and ("." in name and not name.endswith(".pref")):
+                continue
+            if os.path.isfile(f) and os.path.getsize(f) > 0:
+                return True
+    for rel in APT_CONF:
+        path = os.path.join(root, rel)
+        files = [os.path.join(path, n) for n in sorted(os.listdir(path))] if os.path.isdir(path) else [path]
+        for f in files:
+            try:
+                with open(f, "r", encoding="utf-8", errors="replace") as fh:
+                    if "default-release" in fh.read().lower():
+                        return True
+            except OSError:
+                continue
+    return False
+
+
+def list_priorities(lists: list) -> Dict[str, int]:
+    """Priority of each package list, from the Release file of its archive."""
+    lists_dir = os.path.dirname(lists[0]) if lists else ""
+    releases = [p for p in glob.glob(os.path.join(lists_dir, "*Release"))
+                if p.endswith(("_InRelease", "_Release"))]
+    stems = sorted(((os.path.basename(p).rsplit("_", 1)[0] + "_", p) for p in releases),
+                   key=lambda sp: len(sp[0]), reverse=True)
+    out = {}
+    for path in lists:
+        name = os.path.basename(path)
+        release = next((p for stem, p in stems if name.startswith(stem)), None)
+        out[path] = _release_priority(release) if release else DEFAULT_PRIORITY
+    return out
+
+
+Offer = Tuple[str, int, Deps, bool]  # (version, priority, dependencies, phased)
+
+
+def _candidate(installed: str, offers: List[Offer]) -> Optional[Offer]:
+    """apt's candidate among offers when it is newer than installed, else None."""
+    best, best_p = None, max([INSTALLED_PRIORITY] + [o[1] for o in offers if compare_versions(o[0], installed) == 0])
+    for o in offers:
+        if compare_versions(o[0], installed) <= 0:
+            continue
+        if o[1] > best_p or (o[1] == best_p and compare_versions(o[0], best[0] if best else installed) > 0):
+            best, best_p = o, o[1]
+    return best
+
+
+def _is_upgrade(installed: str, offers: List[Offer], provided: Set[str]) -> bool:
+    """
+    Whether `apt-get upgrade` would upgrade: the candidate is newer, is not a
+    phased update, and needs no package that is not installed (apt keeps
+    those back, e.g. kernel meta-packages pulling in a new ABI).
+    """
+    c = _candidate(installed, offers)
+    return c is not None and not c[3] and all(any(alt in provided for alt in group) for group in c[2])
+
+
+# ---------------- Shared indexes (image scans) ----------------
+
+Offers = Dict[Key, List[Offer]]
+_indexes: Dict[str, Offers] = {}  # lists fingerprint -> candidate index
+
+
+def lists_fingerprint(lists: list, priorities: Optional[Dict[str, int]] = None) -> str:
+    """Content hash of a set of package lists (and their priorities); equal for images with the same apt lists."""
+    h = hashlib.sha256()
+    for path in lists:
+        h.update(f"{os.path.basename(path)}\0{(priorities or {}).get(path, DEFAULT_PRIORITY)}\0".encode())
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def candidate_index(lists: list) -> Tuple[str, Offers]:
+    """
+    Every package's versions in the lists, with their archive's priority,
+    parsed once per distinct set of list contents in this process.
+    Returns (fingerprint, index).
+    """
+    priorities = list_priorities(lists)
+    fp = lists_fingerprint(lists, priorities)
+    index = _indexes.get(fp)
+    if index is None:
+        index = {}
+        for path in lists:
+            for key, (ver, deps, phased) in _parse_packages(path).items():
+                index.setdefault(key, []).append((ver, priorities[path], deps, phased))
+        _indexes[fp] = index
+    return fp, index
+
+
+def count_pending(status: str, index: Offers) -> int:
+    """Installed packages in a dpkg status file whose apt candidate in index is newer."""
+    installed, provided = _parse_status(status)
+    return sum(1 for key, ver in installed.items()
+               if key in index and _is_upgrade(ver, index[key], provided))
+
+
+# ---------------- Counting ----------------
+
+def pending_upgrades(root: str = "/") -> Optional[int]:
+    """
+    Number of installed packages `apt-get upgrade` would upgrade: the apt
+    candidate is newer than the installed version, is not a phased update
+    (Phased-Update-Percentage below 100; apt's per-machine draw is not
+    reproduced, so a machine already inside the phase counts it later than
+    apt) and depends on nothing uninstalled. Version constraints and
+    Breaks/Conflicts that would force a removal are not evaluated. None when
+    there is no dpkg database or no package index to compare with, or when
+    apt pinning is configured.
+    """
+    status = os.path.join(root, STATUS_FILE)
+    lists = package_lists(root)
+    if not os.path.isfile(status) or not lists or has_pinning(root):
+        return None
+    releases = sorted(glob.glob(os.path.join(root, LISTS_DIR, "*Release")))
+    signature = _signature([status] + lists + releases)
+    hit = _counts.get(root)
+    if hit and hit[0] == signature:
+        return hit[1]
+    installed, provided = _cached(status, _parse_status)
+    priorities = list_priorities(lists)
+    offers: Offers = {}
+    for path in lists:
+        for key, (ver, deps, phased) in _cached(path, _parse_packages).items():
+            if key in installed:
+                offers.setdefault(key, []).append((ver, priorities[path], deps, phased))
+    pending = sum(1 for key, vers in offers.items() if _is_upgrade(installed[key], vers, provided))
+    _counts[root] = (signature, pending)
+    return pending
@@ -0,0 +1,328 @@
+"""
+Fleet simulator: thousands of agents reporting to one ingest endpoint, with
+simulated time compressed so days of traffic play out in minutes.
+
+Agents speak the outbox protocol (outbox.py): gzip {"reports": [...]}
+batches to <url>/reports/batch, field-level deltas against the last
+acknowledged state, a full snapshot after a 409. Each simulated agent
+behaves like main.loop(): its start-up report is uploaded at its splay
+offset (pacing.splay over its machine id), while its checks wake up every
+interval ± jitter from start-up, reporting only when its state changed.
+Failed sends are retried with the outbox's backoff (Retry-After honoured) and
+dropped after --max-retries; a nextReportSeconds hint holds the agent's next
+upload. --flapping agents change state at every --flap-every wake-up and are
+capped by the agent's token bucket. Agents share a pool of keep-alive
+connections.
+
+The receiver is a local stand-in (default) or any base API URL, e.g. the
+real backend:
+
+    python fleetsim.py --agents 5000 --days 2 --compress 2880
+    python fleetsim.py --url http://127.0.0.1:5000/api --agents 2000 --hours 6
+    python fleetsim.py --start-spread 0 --fail-rate 0.05     # synchronized restart, flaky backend
+
+Patch-day check: the whole fleet restarts at t=0 and the ingest curve over
+the first interval must stay flat (exits 1 otherwise); --splay 0 shows the
+spike it replaces:
+
+    python fleetsim.py --agents 3000 --hours 1 --compress 60 --flapping 0.02 --max-peak-to-mean 2
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import random
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import standin
+from asynchttp import Client
+from bench import random_snapshot, _percentile
+from config import REPORT_BURST, REPORTS_PER_HOUR
+from outbox import backoff_delay, encode_deltas, mismatch_index, HINT_CAP_SECONDS
+from pacing import splay, retry_after_seconds, TokenBucket
+from utils import FieldHasher, META_KEYS
+
+DEFAULT_TOKEN = "dev-agent-token"
+
+
+class Clock:
+    """Simulated seconds since start; `compress` simulated seconds pass per real second."""
+
+    def __init__(self, compress: float):
+        self.compress = compress
+        self.t0 = time.monotonic()
+
+    def now(self) -> float:
+        return (time.monotonic() - self.t0) * self.compress
+
+    async def sleep(self, sim_seconds: float) -> None:
+        await asyncio.sleep(max(0.0, sim_seconds) / self.compress)
+
+
+class Uplink:
+    """One agent's upload state, like outbox.Sender's: the last acknowledged report."""
+
+    def __init__(self):
+        self.hasher = FieldHasher(META_KEYS)
+        self.base: Optional[Dict[str, Any]] = None
+        self.full_next = True
+
+
+class Fleet:
+    def __init__(self, url: str, agents: int, duration: float, compress: float,
+                 interval_minutes: int = 15, jitter: int = 30, change_rate: float = 0.1,
+                 start_spread: float = 0.0, connections: int = 256, max_retries: int = 5,
+                 token: str = DEFAULT_TOKEN, bucket: float = 60.0, seed: int = 1,
+                 splay: Optional[float] = None, flapping: float = 0.0, flap_every: float = 60.0,
+                 burst: int = REPORT_BURST, per_hour: float = REPORTS_PER_HOUR):
+        u = urlsplit(url)
+        self.url = url
+        self.path = u.path.rstrip("/") + "/reports/batch"
+        self.agents = agents
+        self.duration = duration
+        self.clock = Clock(compress)
+        self.interval = interval_minutes * 60
+        self.jitter = jitter
+        self.change_rate = change_rate
+        self.start_spread = start_spread
+        self.splay = self.interval if splay is None else splay
+        self.flapping = flapping
+        self.flap_every = flap_every
+        self.burst = burst
+        self.per_hour = per_hour
+        self.connections = connections
+        self.max_retries = max_retries
+        self.bucket = bucket
+        self.seed = seed
+        self.headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json",
+                        "Content-Encoding": "gzip"}
+        self.latencies: List[float] = []
+        self.ingest: Dict[int, int] = {}  # simulated bucket -> reports accepted
+        self.stats = {"reports": 0, "sent": 0, "retries": 0, "resyncs": 0, "dropped": 0, "rejected": 0,
+                      "throttled": 0, "bytes": 0}
+        self._pool: Optional[asyncio.Queue] = None
+
+    # ---- one upload, with the agent's retry policy ----
+
+    async def _post(self, body: bytes) -> tuple:
+        client = await self._pool.get()
+        t0 = time.perf_counter()
+        try:
+            status, headers, data = await client.post(self.path, body, self.headers)
+        except Exception:
+            status, headers, data = 0, {}, b""
+        finally:
+            self._pool.put_nowait(client)
+        self.latencies.append(time.perf_counter() - t0)
+        return status, headers, data
+
+    def _ingested(self, n: int) -> None:
+        self.stats["sent"] += n
+        b = int(self.clock.now() // self.bucket)
+        self.ingest[b] = self.ingest.get(b, 0) + n
+
+    async def send(self, link: Uplink, reports: List[Dict[str, Any]]) -> float:
+        """
+        Upload one agent's queued reports as a batch, with the Sender's retry
+        and 409 handling. Returns the server's nextReportSeconds hint (0 when none).
+        """
+        self.stats["reports"] += len(reports)
+        failures = 0
+        while reports:
+            items = encode_deltas(link.hasher, None if link.full_next else link.base, reports)
+            body = gzip.compress(json.dumps({"reports": items}, separators=(",", ":")).encode())
+            self.stats["bytes"] += len(body)
+            status, headers, data = await self._post(body)
+            text = data.decode("utf-8", "replace")
+            if 200 <= status < 300:
+                self._ingested(len(reports))
+                link.base, link.full_next = reports[-1], False
+                try:
+                    hint = float(json.loads(text).get("nextReportSeconds") or 0)
+                except Exception:
+                    hint = 0.0
+                return min(hint, HINT_CAP_SECONDS)
+            if status == 409:
+                n = mismatch_index(text)
+                if n:
+                    self._ingested(n)
+                    link.base, reports = reports[n - 1], reports[n:]
+                if n or not link.full_next:
+                    link.full_next = True
+                    self.stats["resyncs"] += 1
+                    continue
+            elif status == 400:
+                self.stats["rejected"] += len(reports)
+                return 0.0
+            if failures >= self.max_retries:
+                self.stats["dropped"] += len(reports)
+                return 0.0
+            delay = backoff_delay(failures)
+            retry_after = retry_after_seconds(headers.get("retry-after"))
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, HINT_CAP_SECONDS))
+            failures += 1
+            self.stats["retries"] += 1
+            await self.clock.sleep(delay)
+
+    # ---- simulated agent ----
+
+    async def agent(self, i: int) -> None:
+        rng = random.Random(self.seed * 1_000_003 + i)
+        mid = f"{rng.getrandbits(64):016x}"
+        flapping = rng.random() < self.flapping
+        period = lambda: self.flap_every if flapping else self.interval + rng.randint(-self.jitter, self.jitter)
+        await self.clock.sleep(rng.uniform(0, self.start_spread))
+        link = Uplink()
+        now = self.clock.now()
+        bucket = TokenBucket(self.per_hour / 3600, self.burst, now=now)
+        state = random_snapshot(rng, mid)
+        bucket.take(now)
+        queued = [state]                      # the outbox
+        held = None                           # newest change waiting for report budget
+        not_before = now + splay(mid, self.splay)  # only the upload waits for the splay
+        next_wake = now + period()
+        while True:
+            wake = next_wake
+            if queued:
+                wake = min(wake, not_before)
+            if held is not None:
+                wake = min(wake, now + bucket.seconds_until_token(now))
+            await self.clock.sleep(wake - self.clock.now())
+            now = self.clock.now()
+            if now >= self.duration:
+                return
+            if now >= next_wake:
+                next_wake += period()
+                if flapping or rng.random() < self.change_rate:
+                    # keep identity fields, re-roll the checks
+                    fresh = random_snapshot(rng, mid)
+                    state = dict(fresh, hostname=state["hostname"], os=state["os"], osVersion=state["osVersion"])
+                    if held is not None:
+                        self.stats["throttled"] += 1
+                    held = state
+            if held is not None and bucket.take(now):
+                queued.append(held)
+                held = None
+            if queued and now >= not_before:
+                batch, queued = queued, []
+                not_before = self.clock.now() + await self.send(link, batch)
+                now = self.clock.now()
+
+    async def run(self) -> Dict[str, Any]:
+        self._pool = asyncio.Queue()
+        clients = [Client(self.url) for _ in range(self.connections)]
+        for c in clients:
+            self._pool.put_nowait(c)
+        t0 = time.perf_counter()
+        await asyncio.gather(*(self.agent(i) for i in range(self.agents)))
+        elapsed = time.perf_counter() - t0
+        for c in clients:
+            await c.close()
+        return self.summary(elapsed)
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        n = max(1, int(self.duration // self.bucket))
+        counts = [self.ingest.get(b, 0) for b in range(n)]
+        mean = sum(counts) / n
+        # the restart window: every agent's start-up report lands in it
+        w = max(1, min(n, int(-(-max(self.start_spread + self.splay, self.interval) // self.bucket))))
+        window = counts[:w]
+        wmean = sum(window) / w
+        return {
+            "agents": self.agents,
+            "simulatedHours": round(self.duration / 3600, 2),
+            "realSeconds": round(elapsed, 1),
+            **self.stats,
+            "requestsPerSecond": round(len(self.latencies) / elapsed, 1),
+            "bytesPerReport": round(self.stats["bytes"] / max(1, self.stats["sent"]), 1),
+            "p50Ms": round(_percentile(self.latencies, 50) * 1000, 2),
+            "p99Ms": round(_percentile(self.latencies, 99) * 1000, 2),
+            "bucketSeconds": self.bucket,
+            "peakPerBucket": max(counts),
+            "meanPerBucket": round(mean, 1),
+            "peakToMean": round(max(counts) / mean, 1) if mean else None,
+            "restartBuckets": w,
+            "restartPeakToMean": round(max(window) / wmean, 2) if wmean else None,
+            "ingest": counts,
+        }
+
+
+def sparkline(counts: List[int], width: int = 72) -> str:
+    """Ingest curve in one line of block characters (max per column)."""
+    if not counts:
+        return ""
+    step = max(1, -(-len(counts) // width))
+    cols = [max(counts[i:i + step]) for i in range(0, len(counts), step)]
+    top = max(cols) or 1
+    return "".join(" ▁▂▃▄▅▆▇█"[round(c / top * 8)] for c in cols)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", help="base API URL of the receiver (default: start a local stand-in)")
+    ap.add_argument("--token", default=DEFAULT_TOKEN)
+    ap.add_argument("--agents", type=int, default=2000)
+    ap.add_argument("--days", type=float, default=0.0)
+    ap.add_argument("--hours", type=float, default=6.0, help="simulated duration when --days is not given")
+    ap.add_argument("--compress", type=float, default=720.0, help="simulated seconds per real second")
+    ap.add_argument("--interval", type=int, default=15, help="agent interval in minutes")
+    ap.add_argument("--jitter", type=int, default=30, help="agent jitter in seconds")
+    ap.add_argument("--change-rate", type=float, default=0.1, help="chance a wake-up finds a change")
+    ap.add_argument("--start-spread", type=float, default=0.0,
+                    help="agents start uniformly over this many simulated seconds (0 = all at once)")
+    ap.add_argument("--splay", type=float, default=None,
+                    help="agents' start-up splay window in seconds (default: one interval, like the agent)")
+    ap.add_argument("--next-report", type=float, default=0.0,
+                    help="stand-in only: nextReportSeconds hint in every acknowledgement")
+    ap.add_argument("--flapping", type=float, default=0.0, help="share of agents whose state changes constantly")
+    ap.add_argument("--flap-every", type=float, default=60.0, help="seconds between a flapping agent's changes")
+    ap.add_argument("--burst", type=int, default=REPORT_BURST, help="agent report budget: burst")
+    ap.add_argument("--per-hour", type=float, default=REPORTS_PER_HOUR, help="agent report budget: refill per hour")
+    ap.add_argument("--max-peak-to-mean", type=float, default=None,
+                    help="exit 1 if the restart window's ingest peak/mean exceeds this")
+    ap.add_argument("--connections", type=int, default=256)
+    ap.add_argument("--max-retries", type=int, default=5)
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="stand-in only: share of requests answered 503")
+    ap.add_argument("--bucket", type=float, default=60.0, help="simulated seconds per ingest-curve bucket")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", action="store_true", help="print the full summary as JSON")
+    args = ap.parse_args()
+
+    srv = None
+    url = args.url
+    if url is None:
+        srv = standin.start(token=args.token, fail_rate=args.fail_rate, keep=False, next_report=args.next_report)
+        url = srv.url.rsplit("/", 1)[0]  # .../api
+    duration = (args.days * 24 or args.hours) * 3600
+    fleet = Fleet(url, args.agents, duration, args.compress, args.interval, args.jitter,
+                  args.change_rate, args.start_spread, args.connections, args.max_retries,
+                  args.token, args.bucket, args.seed, args.splay, args.flapping, args.flap_every,
+                  args.burst, args.per_hour)
+    print(f"{args.agents} agents → {url}: {duration / 3600:g}h simulated in ~{duration / args.compress:.0f}s")
+    result = asyncio.run(fleet.run())
+    if srv is not None:
+        srv.shutdown()
+    flat = args.max_peak_to_mean is None or (result["restartPeakToMean"] or 0) <= args.max_peak_to_mean
+    if args.json:
+        print(json.dumps(result))
+        raise SystemExit(0 if flat else 1)
+    print(f"reports    {result['reports']} sent={result['sent']} retries={result['retries']} "
+          f"resyncs={result['resyncs']} dropped={result['dropped']} rejected={result['rejected']} "
+          f"throttled={result['throttled']}")
+    print(f"upload     {result['bytesPerReport']} gzip bytes per report")
+    print(f"throughput {result['requestsPerSecond']} req/s   latency p50 {result['p50Ms']} ms  p99 {result['p99Ms']} ms")
+    print(f"ingest     peak {result['peakPerBucket']} / mean {result['meanPerBucket']} per {args.bucket:g}s "
+          f"(peak/mean {result['peakToMean']})")
+    print(f"           {sparkline(result['ingest'])}")
+    print(f"restart    peak/mean {result['restartPeakToMean']} over the first "
+          f"{result['restartBuckets'] * args.bucket:g}s")
+    if not flat:
+        print(f"FAIL: restart ingest peak/mean above {args.max_peak_to_mean}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
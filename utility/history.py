@@ -0,0 +1,299 @@
+"""
+Local history of machine state: a fixed-size, memory-mapped ring buffer of
+packed records under STATE_DIR, appended whenever the reported state changes
+and when the agent starts. Old records are overwritten once the ring is full,
+so disk and memory use never grow.
+
+File layout (little-endian):
+
+    header   64 bytes   magic, format, record size, capacity, head, count
+    strings  16 KB      intern table: u16 count, u16 bytes used, then
+                        [u8 length][utf-8] per string; id n = n-th entry
+    records  capacity × 18 bytes:
+             u32 unix time
+             u16 tri-states, 2 bits each (0 unknown, 1 false, 2 true)
+             u16 updatesPending, u16 sleepTimeoutMinutes (0xFFFF = unknown)
+             u16 × 4 string ids: hostname, os, osVersion, antivirusName (0 = none)
+
+Queries (also as a CLI):
+
+    python history.py at 2026-10-01T09:00:00Z      state at a moment
+    python history.py transitions antivirusRunning --since 7d
+    python history.py noncompliant --since 30d      time with issues, per issue
+    python history.py dump | stats
+
+A record's state holds until the next record; the last one holds until now
+(or --until). Periods where the agent was not running are not visible.
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from config import HISTORY_FILE, HISTORY_RECORDS, ensure_state_dir
+from rules import derive_issues
+
+MAGIC = b"SHHIST\x00\x01"
+HEADER = struct.Struct("<8sHHIII")   # magic, record size, flags, capacity, head, count
+HEADER_SIZE = 64
+STRINGS_SIZE = 16 * 1024
+STRINGS_HEAD = struct.Struct("<HH")  # count, bytes used
+RECORD = struct.Struct("<IHHH4H")
+
+TRI_FIELDS = ["diskEncrypted", "osUpdated", "antivirusInstalled", "antivirusRunning", "sleepPolicyOk"]
+INT_FIELDS = ["updatesPending", "sleepTimeoutMinutes"]
+STR_FIELDS = ["hostname", "os", "osVersion", "antivirusName"]
+FIELDS = TRI_FIELDS + INT_FIELDS + STR_FIELDS
+
+UNKNOWN = 0xFFFF
+_TRI_ENCODE = {None: 0, False: 1, True: 2}
+_TRI_DECODE = {0: None, 1: False, 2: True, 3: None}
+
+
+class History:
+    def __init__(self, path: Path = HISTORY_FILE, capacity: int = HISTORY_RECORDS, create: bool = True):
+        self.path = Path(path)
+        if not self.path.exists():
+            if not create:
+                raise FileNotFoundError(self.path)
+            self._create(capacity)
+        if not self._open():
+            if not create:
+                raise ValueError(f"{self.path}: not a history file")
+            os.replace(self.path, self.path.with_suffix(".corrupt"))
+            self._create(capacity)
+            self._open()
+        self._strings: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self._load_strings()
+
+    def _open(self) -> bool:
+        """Map the file; False (and nothing mapped) when it is not a valid history file."""
+        self._f = open(self.path, "r+b")
+        size = os.fstat(self._f.fileno()).st_size
+        if size >= HEADER_SIZE:
+            self._map = mmap.mmap(self._f.fileno(), 0)
+            magic, rsize, _flags, self.capacity, _head, _count = HEADER.unpack_from(self._map, 0)
+            if magic == MAGIC and rsize == RECORD.size and size == self._size(self.capacity):
+                return True
+            self._map.close()
+        self._f.close()
+        return False
+
+    @staticmethod
+    def _size(capacity: int) -> int:
+        return HEADER_SIZE + STRINGS_SIZE + capacity * RECORD.size
+
+    def _create(self, capacity: int) -> None:
+        ensure_state_dir()
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            f.truncate(self._size(capacity))  # sparse until written
+            f.write(HEADER.pack(MAGIC, RECORD.size, 0, capacity, 0, 0))
+            f.seek(HEADER_SIZE)
+            f.write(STRINGS_HEAD.pack(0, 0))
+        os.replace(tmp, self.path)
+
+    def close(self) -> None:
+        self._map.close()
+        self._f.close()
+
+    # ---- string interning ----
+
+    def _load_strings(self) -> None:
+        count, _used = STRINGS_HEAD.unpack_from(self._map, HEADER_SIZE)
+        off = HEADER_SIZE + STRINGS_HEAD.size
+        for _ in range(count):
+            n = self._map[off]
+            s = self._map[off + 1: off + 1 + n].decode("utf-8", "replace")
+            self._strings.append(s)
+            self._ids.setdefault(s, len(self._strings))
+            off += 1 + n
+
+    def _intern(self, s: Optional[str]) -> int:
+        if s is None:
+            return 0
+        s = str(s)
+        if s in self._ids:
+            return self._ids[s]
+        raw = s.encode("utf-8")[:255]
+        count, used = STRINGS_HEAD.unpack_from(self._map, HEADER_SIZE)
+        off = HEADER_SIZE + STRINGS_HEAD.size + used
+        if off + 1 + len(raw) > HEADER_SIZE + STRINGS_SIZE or count >= UNKNOWN - 1:
+            return UNKNOWN  # table full: stored as unknown
+        self._map[off] = len(raw)
+        self._map[off + 1: off + 1 + len(raw)] = raw
+        STRINGS_HEAD.pack_into(self._map, HEADER_SIZE, count + 1, used + 1 + len(raw))
+        self._strings.append(raw.decode("utf-8", "replace"))
+        self._ids[s] = count + 1
+        return count + 1
+
+    def _string(self, i: int) -> Optional[str]:
+        return self._strings[i - 1] if 0 < i <= len(self._strings) else None
+
+    # ---- records ----
+
+    def append(self, snapshot: Dict[str, Any], at: Optional[float] = None) -> None:
+        """Write one record over the oldest slot and advance the head. O(1)."""
+        tri = 0
+        for i, f in enumerate(TRI_FIELDS):
+            tri |= _TRI_ENCODE.get(snapshot.get(f), 0) << (2 * i)
+        ints = []
+        for f in INT_FIELDS:
+            v = snapshot.get(f)
+            ints.append(UNKNOWN if not isinstance(v, int) or isinstance(v, bool) or v < 0 else min(v, UNKNOWN - 1))
+        strs = [self._intern(snapshot.get(f)) for f in STR_FIELDS]
+        _m, _r, _fl, cap, head, count = HEADER.unpack_from(self._map, 0)
+        t = int(at if at is not None else time.time())
+        RECORD.pack_into(self._map, self._offset(head), t, tri, *ints, *strs)
+        # the record is in place before the header points past it
+        HEADER.pack_into(self._map, 0, MAGIC, RECORD.size, 0, cap, (head + 1) % cap, min(count + 1, cap))
+
+    def flush(self) -> None:
+        self._map.flush()
+
+    def _offset(self, slot: int) -> int:
+        return HEADER_SIZE + STRINGS_SIZE + slot * RECORD.size
+
+    def __len__(self) -> int:
+        return HEADER.unpack_from(self._map, 0)[5]
+
+    def _decode(self, slot: int) -> Tuple[int, Dict[str, Any]]:
+        t, tri, pending, timeout, *strs = RECORD.unpack_from(self._map, self._offset(slot))
+        state: Dict[str, Any] = {f: _TRI_DECODE[(tri >> (2 * i)) & 3] for i, f in enumerate(TRI_FIELDS)}
+        state["updatesPending"] = None if pending == UNKNOWN else pending
+        state["sleepTimeoutMinutes"] = None if timeout == UNKNOWN else timeout
+        for f, i in zip(STR_FIELDS, strs):
+            state[f] = self._string(i)
+        return t, state
+
+    def records(self, since: Optional[float] = None, until: Optional[float] = None) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """(unix time, state) oldest first, optionally limited to [since, until]."""
+        _m, _r, _fl, cap, head, count = HEADER.unpack_from(self._map, 0)
+        for k in range(count):
+            t, state = self._decode((head - count + k) % cap)
+            if since is not None and t < since:
+                continue
+            if until is not None and t > until:
+                return
+            yield t, state
+
+    # ---- queries ----
+
+    def at(self, when: float) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """The record in force at `when`: the last one written at or before it."""
+        found = None
+        for t, state in self.records(until=when):
+            found = (t, state)
+        return found
+
+    def transitions(self, field: str, since: Optional[float] = None,
+                    until: Optional[float] = None) -> List[Tuple[int, Any, Any]]:
+        """[(time, old, new)] for every change of `field`."""
+        if field not in FIELDS:
+            raise KeyError(f"unknown field {field!r}; one of {', '.join(FIELDS)}")
+        out, prev, first = [], None, True
+        start = self.at(since) if since is not None else None
+        if start is not None:
+            prev, first = start[1][field], False
+        for t, state in self.records(since=since, until=until):
+            v = state[field]
+            if not first and v != prev:
+                out.append((t, prev, v))
+            prev, first = v, False
+        return out
+
+    def non_compliant(self, since: Optional[float] = None, until: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Seconds within [since, until] (default: all history up to now) spent
+        with at least one issue, per rules.derive_issues, and per issue.
+        """
+        until = time.time() if until is None else until
+        spans: List[Tuple[float, Dict[str, Any]]] = []
+        start = self.at(since) if since is not None else None
+        if start is not None:
+            spans.append((since, start[1]))
+        spans += [(float(t), s) for t, s in self.records(since=since, until=until)]
+        total, per_issue = 0.0, {}
+        for (t, state), nxt in zip(spans, spans[1:] + [(until, None)]):
+            dt = max(0.0, nxt[0] - t)
+            issues = derive_issues(state)["issues"]
+            if issues:
+                total += dt
+            for issue in issues:
+                per_issue[issue] = per_issue.get(issue, 0.0) + dt
+        covered = until - spans[0][0] if spans else 0.0
+        return {"seconds": round(total), "coveredSeconds": round(covered),
+                "share": round(total / covered, 4) if covered else None,
+                "byIssue": {k: round(v) for k, v in sorted(per_issue.items())}}
+
+    def stats(self) -> Dict[str, Any]:
+        count, used = STRINGS_HEAD.unpack_from(self._map, HEADER_SIZE)
+        first = next(self.records(), None)
+        return {"path": str(self.path), "bytes": len(self._map), "records": len(self),
+                "capacity": self.capacity, "strings": count, "stringBytes": used,
+                "oldest": _iso(first[0]) if first else None}
+
+
+def _iso(t: float) -> str:
+    return datetime.fromtimestamp(t, timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+
+
+def parse_time(s: str) -> float:
+    """ISO 8601, unix seconds, or an age like 90m / 12h / 7d."""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    if s[-1:] in units and s[:-1].replace(".", "", 1).isdigit():
+        return time.time() - float(s[:-1]) * units[s[-1]]
+    try:
+        return float(s)
+    except ValueError:
+        pass
+    dt = datetime.fromisoformat(s.replace("Z", "+00:00"))
+    return (dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)).timestamp()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--file", type=Path, default=HISTORY_FILE)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("at", help="state at a moment")
+    p.add_argument("when", type=parse_time)
+    p = sub.add_parser("transitions", help="changes of one field")
+    p.add_argument("field", choices=FIELDS)
+    p = sub.add_parser("noncompliant", help="time spent with issues")
+    sub.add_parser("dump", help="every record, oldest first (JSON lines)")
+    sub.add_parser("stats")
+    for name in ("transitions", "noncompliant", "dump"):
+        sp = sub.choices[name]
+        sp.add_argument("--since", type=parse_time)
+        sp.add_argument("--until", type=parse_time)
+    args = ap.parse_args()
+
+    try:
+        h = History(args.file, create=False)
+    except (FileNotFoundError, ValueError) as e:
+        sys.exit(f"no history: {e}")
+    if args.cmd == "at":
+        found = h.at(args.when)
+        print(json.dumps(None if found is None else dict(found[1], recordedAt=_iso(found[0]))))
+    elif args.cmd == "transitions":
+        for t, old, new in h.transitions(args.field, args.since, args.until):
+            print(f"{_iso(t)}  {args.field}: {json.dumps(old)} → {json.dumps(new)}")
+    elif args.cmd == "noncompliant":
+        print(json.dumps(h.non_compliant(args.since, args.until), indent=2))
+    elif args.cmd == "dump":
+        for t, state in h.records(args.since, args.until):
+            print(json.dumps(dict(state, recordedAt=_iso(t))))
+    else:
+        print(json.dumps(h.stats(), indent=2))
+    h.close()
+
+
+if __name__ == "__main__":
+    main()
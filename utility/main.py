@@ -1,32 +1,63 @@
-import random
+import argparse
+import gzip
+import json
+import platform
 import time
 from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Callable, Dict, Tuple
 
 from checks import (
     get_os_summary, check_disk_encryption, check_updates,
     check_antivirus, check_sleep_policy
 )
-from config import INTERVAL_MINUTES, JITTER_SECONDS
+import cache
+import metrics
+import procs
+from config import (
+    API_KEY, BATCH_URL, INTERVAL_MINUTES, JITTER_SECONDS, CHECK_DEADLINE_SECONDS,
+    METRICS_PORT, PROFILE_DIR, STARTUP_SPLAY_SECONDS, REPORT_BURST, REPORTS_PER_HOUR
+)
+from pacing import splay, TokenBucket
 from utils import (
     now_iso, stable_machine_id, load_last_state, save_last_state,
-    hash_payload, send_report
+    run_checks, http_post, FieldHasher, META_KEYS
 )
 
+if TYPE_CHECKING:
+    from outbox import Sender
+
 
 def clamp_interval(m: int) -> int:
     return max(15, min(60, int(m)))
 
 
+HOUR = 3600
+
+# name -> (check, deadline seconds). All checks start together; a check that
+# misses its deadline reports None and is listed under "timedOut".
+CHECKS: Dict[str, Tuple[Callable[[], Any], float]] = {
+    "os": (get_os_summary, 10),
+    "diskEncryption": (check_disk_encryption, CHECK_DEADLINE_SECONDS),
+    "updates": (check_updates, CHECK_DEADLINE_SECONDS),
+    "antivirus": (check_antivirus, CHECK_DEADLINE_SECONDS),
+    "sleepPolicy": (check_sleep_policy, CHECK_DEADLINE_SECONDS),
+}
+
 def collect_snapshot() -> dict:
-    os_info = get_os_summary()
-    disk_encrypted = check_disk_encryption()
-    updates = check_updates()
-    av = check_antivirus()
-    sleep = check_sleep_policy()
+    procs.new_cycle()  # one shared process-table scan per snapshot
+    return build_payload(*run_checks(CHECKS))
+
+
+def build_payload(results: Dict[str, Any], timings: Dict[str, float], timed_out: list) -> dict:
+    os_info = results["os"] or {"os": platform.system(), "osVersion": platform.version()}
+    disk_encrypted = results["diskEncryption"]
+    updates = results["updates"] or {}
+    av = results["antivirus"] or {}
+    sleep = results["sleepPolicy"] or {}
 
     payload = {
         "machineId": stable_machine_id(),
-        "hostname": __import__("platform").node(),
+        "hostname": platform.node(),
         "os": os_info["os"],
         "osVersion": os_info["osVersion"],
         "diskEncrypted": disk_encrypted,                # True/False/None
@@ -38,49 +69,273 @@ def collect_snapshot() -> dict:
         "sleepPolicyOk": sleep.get("ok"),
         "sleepTimeoutMinutes": sleep.get("timeoutMinutes"),
         "timestamp": now_iso(),
+        "checkTimings": timings,                        # seconds per check
+        "timedOut": timed_out,                          # names of checks past deadline
+        "agentMetrics": metrics.summary(),              # the agent's own cost, see metrics.py
     }
     return payload
 
 
-def loop():
+def log_cache_stats() -> None:
+    st = cache.take_stats()
+    print(f"[{now_iso()}] check cache: {st['hits']} hit, {st['misses']} miss")
+
+
+def cadence(interval_minutes: int) -> Dict[str, Tuple[float, float]]:
+    """(min, max) seconds between runs of each check. Volatile checks never
+    wait longer than the configured interval; stable ones may wait a day."""
+    interval = interval_minutes * 60
+    return {
+        "os": (HOUR, 24 * HOUR),
+        "diskEncryption": (HOUR, 24 * HOUR),
+        "updates": (15 * 60, 6 * HOUR),
+        "antivirus": (60, interval),
+        "sleepPolicy": (5 * 60, interval),
+    }
+
+
+def safety_net(cadence_: Dict[str, Tuple[float, float]], interval_minutes: int) -> Dict[str, Tuple[float, float]]:
+    """In watch mode events drive re-checks; polling only backs them up, at low frequency."""
+    return {n: (max(hi, interval_minutes * 60),) * 2 for n, (_lo, hi) in cadence_.items()}
+
+
+def start_watcher():
+    if platform.system() != "Linux":
+        print(f"[{now_iso()}] watch mode needs Linux inotify; polling only")
+        return None
+    try:
+        from watch import Watcher
+        w = Watcher()
+    except Exception as e:
+        print(f"[{now_iso()}] inotify unavailable ({e}); polling only")
+        return None
+    print(f"[{now_iso()}] watching {', '.join(sorted(set(w.watched)))}")
+    return w
+
+
+def loop(watch: bool = False, profile: bool = False):
+    # the daemon's upload path pulls in requests; --once does without it
+    from outbox import Outbox, Sender
+    from scheduler import Scheduler
+
     interval = clamp_interval(INTERVAL_MINUTES)
     jitter = int(JITTER_SECONDS)
 
     print(f"[{now_iso()}] syshealth utility starting. interval={interval}m ±{jitter}s  id={stable_machine_id()}")
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT)
+        print(f"[{now_iso()}] metrics on http://127.0.0.1:{METRICS_PORT}/metrics")
+    profiler = metrics.Profiler(PROFILE_DIR) if profile else None
 
-    # send once on start so backend sees this machine
-    snapshot = collect_snapshot()
-    ok, status, text = send_report(snapshot)
-    if ok:
-        save_last_state(snapshot)
-        print(f"[{now_iso()}] initial report sent ✅")
-    else:
-        print(f"[{now_iso()}] initial report failed ({status}): {text[:200]}")
+    watcher = start_watcher() if watch else None
+    plan = cadence(interval)
+    if watcher:
+        plan = safety_net(plan, interval)
+    sched = Scheduler(CHECKS, plan, jitter=jitter)
+    outbox = Outbox()
+    sender = Sender(outbox, base=load_last_state())
+    hasher = FieldHasher(META_KEYS)
+    bucket = TokenBucket(REPORTS_PER_HOUR / HOUR, REPORT_BURST)
+    held = None  # newest change not yet queued: the report budget is spent
+    history = open_history()
+    if len(outbox):
+        print(f"[{now_iso()}] {len(outbox)} report(s) queued from a previous run")
+
+    # report once on start so backend sees this machine, uploaded at this
+    # machine's offset in the start-up window; checks keep running meanwhile
+    begin_cycle(profiler)
+    sched.run_due(force=True)
+    snapshot = build_payload(*sched.latest())
+    log_cache_stats()
+    outbox.append(snapshot)
+    bucket.take()
+    record(history, snapshot)
+    offset = splay(stable_machine_id(), interval * 60 if STARTUP_SPLAY_SECONDS is None else STARTUP_SPLAY_SECONDS)
+    sender.defer(offset)
+    print(f"[{now_iso()}] first report in {offset:.0f}s (start-up splay)")
+    flush(sender)
+    end_cycle(profiler)
 
-    last_hash = hash_payload(snapshot, exclude_keys={"timestamp"})
+    last_version = hasher.version(snapshot)
+    print(f"[{now_iso()}] cadence: {sched.describe()}")
 
     while True:
-        sleep_s = (interval * 60) + random.randint(-jitter, jitter)
-        if sleep_s < 60:
-            sleep_s = 60
-        time.sleep(sleep_s)
-
-        snap = collect_snapshot()
-        h = hash_payload(snap, exclude_keys={"timestamp"})
-        if h != last_hash:
-            ok, status, text = send_report(snap)
-            if ok:
-                save_last_state(snap)
-                last_hash = h
-                print(f"[{now_iso()}] change detected → report sent ✅")
-            else:
-                print(f"[{now_iso()}] send failed ({status}): {text[:200]}")
+        wait = max(1.0, sched.seconds_until_due())
+        retry = sender.seconds_until_retry()
+        if retry is not None:
+            wait = min(wait, max(1.0, retry))
+        if held is not None:
+            wait = min(wait, max(1.0, bucket.seconds_until_token()))
+        if watcher:
+            triggered = watcher.wait(wait)
+            begin_cycle(profiler)
+            changed = sched.run_due(names=triggered) if triggered else sched.run_due()
         else:
-            print(f"[{now_iso()}] no change → not sending")
+            time.sleep(wait)
+            begin_cycle(profiler)
+            changed = sched.run_due()
+        fresh = False
+        if changed:
+            # a check moved: report the latest value of every check
+            snap = build_payload(*sched.latest())
+            version = hasher.version(snap)
+            if version != last_version:
+                record(history, snap)
+                last_version = version
+                held, fresh = snap, True
+                print(f"[{now_iso()}] change detected ({', '.join(changed)})")
+            print(f"[{now_iso()}] cadence: {sched.describe()}")
+        if held is not None:
+            # a flapping machine reports at most REPORTS_PER_HOUR; only its latest state is queued
+            if bucket.take():
+                outbox.append(held)
+                held = None
+                print(f"[{now_iso()}] change queued")
+            elif fresh:
+                metrics.inc("reports_throttled_total")
+                print(f"[{now_iso()}] report budget spent, holding latest state "
+                      f"for {bucket.seconds_until_token():.0f}s")
+        flush(sender)
+        end_cycle(profiler)
+
+
+# ---------------- One-shot mode (cron / MDM) ----------------
+
+EXIT_OK = 0           # reported, or nothing changed since the last acknowledged report
+EXIT_PARTIAL = 2      # as EXIT_OK, but some checks missed their deadline
+EXIT_SEND_FAILED = 3  # backend unreachable, 429 or 5xx; the next run retries
+EXIT_REJECTED = 4     # backend refused the report (auth, validation): fix the configuration
+
+# payload fields each check fills, for carrying values over when it times out
+CHECK_FIELDS = {
+    "os": ["os", "osVersion"],
+    "diskEncryption": ["diskEncrypted"],
+    "updates": ["osUpdated", "updatesPending"],
+    "antivirus": ["antivirusInstalled", "antivirusRunning", "antivirusName"],
+    "sleepPolicy": ["sleepPolicyOk", "sleepTimeoutMinutes"],
+}
+
+
+def _rejected(text: str) -> list:
+    """The "rejected" indexes of a batch reply (outbox.rejected_indexes, without importing requests)."""
+    try:
+        return list(json.loads(text).get("rejected") or [])
+    except Exception:
+        return []
+
+
+def once(force: bool = False) -> int:
+    """
+    One concurrent collection, compared against last_state.json; sent only
+    when it changed (or with force). last_state.json moves only when the
+    backend acknowledges, so a failed run is retried by the next one.
+    """
+    metrics.begin_cycle()
+    snapshot = collect_snapshot()
+    last = load_last_state()
+    if last is not None:
+        # like the scheduler: a check that missed its deadline keeps its last known value
+        for name in snapshot["timedOut"]:
+            for field in CHECK_FIELDS[name]:
+                if field in last:
+                    snapshot[field] = last[field]
+    partial = EXIT_PARTIAL if snapshot["timedOut"] else EXIT_OK
+    if snapshot["timedOut"]:
+        print(f"[{now_iso()}] timed out: {', '.join(snapshot['timedOut'])}")
+
+    version = FieldHasher(META_KEYS).version(snapshot)
+    if not force and last is not None and FieldHasher(META_KEYS).version(last) == version:
+        print(f"[{now_iso()}] no change since last report")
+        metrics.end_cycle()
+        metrics.write_textfile()
+        return partial
+
+    history = open_history()
+    record(history, snapshot)
+    if history:
+        history.close()
+    body = gzip.compress(json.dumps({"reports": [dict(snapshot, version=version)]},
+                                    separators=(",", ":")).encode("utf-8"))
+    t0 = time.monotonic()
+    status, text, _ = http_post(BATCH_URL, body, {
+        "Content-Type": "application/json",
+        "Content-Encoding": "gzip",
+        "Authorization": f"Bearer {API_KEY}",
+        "User-Agent": "syshealth-utility/1.0",
+    })
+    metrics.upload(status, len(body), time.monotonic() - t0)
+    rejected = _rejected(text) if 200 <= status < 300 else []
+    if rejected:
+        metrics.inc("reports_rejected_total", len(rejected))
+    metrics.end_cycle()
+    metrics.write_textfile()
+    if rejected:
+        # acknowledged but refused: last_state.json stays put so the next run resends
+        print(f"[{now_iso()}] report rejected by the server: {text[:200]}")
+        return EXIT_REJECTED
+    if 200 <= status < 300:
+        save_last_state(snapshot)
+        print(f"[{now_iso()}] report sent ✅")
+        return partial
+    print(f"[{now_iso()}] send failed ({status}): {text[:200]}")
+    if 400 <= status < 500 and status != 429:
+        return EXIT_REJECTED
+    return EXIT_SEND_FAILED
+
+
+def open_history():
+    """The local state history (history.py), or None if it cannot be opened."""
+    try:
+        from history import History
+        return History()
+    except Exception as e:
+        print(f"[{now_iso()}] state history disabled: {e}")
+        return None
+
+
+def record(history, snapshot: dict) -> None:
+    if history is not None:
+        history.append(snapshot)
+
+
+def begin_cycle(profiler) -> None:
+    metrics.begin_cycle()
+    if profiler:
+        profiler.start()
+
+
+def end_cycle(profiler) -> None:
+    """Close the cycle's metrics and publish them; with --profile, write its folded stacks."""
+    if profiler:
+        path = profiler.stop()
+        if path:
+            print(f"[{now_iso()}] profile → {path}")
+    metrics.end_cycle()
+    metrics.write_textfile()
+
+
+def flush(sender: "Sender") -> None:
+    """Upload what is queued; remember the newest state the backend confirmed."""
+    acked = sender.drain()
+    if acked is not None:
+        save_last_state(acked)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="syshealth utility")
+    parser.add_argument("--watch", action="store_true",
+                        help="re-check on file-system events (Linux inotify); polling becomes a slow safety net")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"sample every cycle's stacks to folded-stack files under {PROFILE_DIR}")
+    parser.add_argument("--once", action="store_true",
+                        help="collect once, send if changed, and exit "
+                             f"({EXIT_OK} ok, {EXIT_PARTIAL} checks timed out, "
+                             f"{EXIT_SEND_FAILED} send failed, {EXIT_REJECTED} rejected)")
+    parser.add_argument("--force", action="store_true", help="with --once: send even if nothing changed")
+    args = parser.parse_args()
+    if args.once:
+        raise SystemExit(once(force=args.force))
     try:
-        loop()
+        loop(watch=args.watch, profile=args.profile)
     except KeyboardInterrupt:
         print(f"[{now_iso()}] exiting on user interrupt")
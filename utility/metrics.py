@@ -0,0 +1,259 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from config import METRICS_FILE, ensure_state_dir
+
+# Self-instrumentation of the agent: counters and timings recorded on the hot
+# paths (checks, commands, uploads), the agent's own CPU and RSS, exported in
+# Prometheus text format to a textfile-collector file and, optionally, over
+# HTTP. A compact summary travels with every report (see main.build_payload).
+
+PREFIX = "syshealth_"
+
+# name -> (type, help). Timings are exported as summaries (_sum/_count).
+METRICS: Dict[str, Tuple[str, str]] = {
+    "check_wall_seconds": ("summary", "Wall time per check run"),
+    "check_cpu_seconds": ("summary", "CPU time of the check's own thread per run"),
+    "check_timeouts_total": ("counter", "Check runs that missed their deadline"),
+    "subprocesses_total": ("counter", "Processes started (exec: a command, shell: a subshell in a bash worker, worker: a new bash worker)"),
+    "command_seconds": ("summary", "Wall time per command"),
+    "command_timeouts_total": ("counter", "Commands killed at their timeout"),
+    "command_errors_total": ("counter", "Commands that failed to run"),
+    "upload_bytes_total": ("counter", "Compressed request bytes sent to the backend"),
+    "upload_seconds": ("summary", "Upload round-trip time"),
+    "uploads_total": ("counter", "Upload attempts by HTTP status (0 = network error)"),
+    "reports_rejected_total": ("counter", "Reports the backend refused as invalid and that were dropped"),
+    "reports_throttled_total": ("counter", "Changes held back because the report budget was spent"),
+    "cycles_total": ("counter", "Collection cycles run"),
+    "cycle_subprocesses": ("gauge", "Processes started in the last cycle"),
+    "cycle_cpu_seconds": ("gauge", "Agent CPU, children included, used by the last cycle"),
+    "cpu_seconds_total": ("counter", "Agent CPU time, children included"),
+    "cpu_core_ratio": ("gauge", "Agent CPU time, children included, per wall second since start (interpreter start-up excluded)"),
+    "resident_memory_bytes": ("gauge", "Agent resident set size"),
+}
+
+_lock = threading.Lock()
+_values: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+_started = time.monotonic()
+_cycle: Optional[Tuple[float, float]] = None  # (subprocesses, cpu) at cycle start
+_last_upload: Optional[float] = None
+
+
+def _key(name: str, labels: Dict[str, str]) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    k = _key(name, labels)
+    with _lock:
+        _values[k] = _values.get(k, 0) + value
+
+
+def observe(name: str, seconds: float, **labels) -> None:
+    ks, kc = _key(name + "_sum", labels), _key(name + "_count", labels)
+    with _lock:
+        _values[ks] = _values.get(ks, 0) + seconds
+        _values[kc] = _values.get(kc, 0) + 1
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    with _lock:
+        _values[_key(name, labels)] = value
+
+
+def total(name: str) -> float:
+    """Sum of a metric over all label sets."""
+    with _lock:
+        return sum(v for (n, _), v in _values.items() if n == name)
+
+
+def upload(status: int, nbytes: int, seconds: float) -> None:
+    global _last_upload
+    inc("uploads_total", status=status)
+    inc("upload_bytes_total", nbytes)
+    observe("upload_seconds", seconds)
+    _last_upload = seconds
+
+
+# ---------------- process ----------------
+
+def cpu_seconds() -> float:
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+_cpu_at_start = cpu_seconds()
+
+
+def rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024  # peak, not current
+    except Exception:
+        return None
+
+
+def _sample_process() -> None:
+    cpu = cpu_seconds()
+    set_gauge("cpu_seconds_total", cpu)
+    # both sides from import time: CPU spent starting the interpreter has no wall time to share
+    set_gauge("cpu_core_ratio", (cpu - _cpu_at_start) / max(1e-9, time.monotonic() - _started))
+    rss = rss_bytes()
+    if rss is not None:
+        set_gauge("resident_memory_bytes", rss)
+
+
+# ---------------- cycles ----------------
+
+def begin_cycle() -> None:
+    global _cycle
+    _cycle = (total("subprocesses_total"), cpu_seconds())
+
+
+def end_cycle() -> None:
+    if _cycle is None:
+        return
+    subprocesses, cpu = _cycle
+    inc("cycles_total")
+    set_gauge("cycle_subprocesses", total("subprocesses_total") - subprocesses)
+    set_gauge("cycle_cpu_seconds", round(cpu_seconds() - cpu, 6))
+    _sample_process()
+
+
+def summary() -> Dict[str, Optional[float]]:
+    """Compact figures for the report payload; ratios are over the agent's lifetime."""
+    _sample_process()
+    cycles = total("cycles_total")
+    rss = total("resident_memory_bytes")
+    return {
+        "cpuPct": round(total("cpu_core_ratio") * 100, 3),       # % of one core
+        "rssMb": round(rss / 2 ** 20, 1) if rss else None,
+        "cycles": int(cycles),
+        "subprocPerCycle": round(total("subprocesses_total") / cycles, 1) if cycles else None,
+        "timeouts": int(total("check_timeouts_total") + total("command_timeouts_total")),
+        "sendMs": round(_last_upload * 1000) if _last_upload is not None else None,
+        "bytesSent": int(total("upload_bytes_total")),
+        "rejected": int(total("reports_rejected_total")),
+    }
+
+
+# ---------------- export ----------------
+
+def render() -> str:
+    """All metrics in Prometheus text exposition format."""
+    with _lock:
+        values = sorted(_values.items())
+    lines, seen = [], set()
+    for (name, labels), value in values:
+        base = name[:-4] if name.endswith("_sum") else name[:-6] if name.endswith("_count") else name
+        if base not in seen:
+            seen.add(base)
+            kind, help_ = METRICS.get(base, ("untyped", base))
+            lines += [f"# HELP {PREFIX}{base} {help_}", f"# TYPE {PREFIX}{base} {kind}"]
+        lbl = "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}" if labels else ""
+        lines.append(f"{PREFIX}{name}{lbl} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path: Optional[Path] = METRICS_FILE) -> None:
+    """Atomically replace the node_exporter textfile-collector file."""
+    if not path:
+        return
+    tmp = Path(str(path) + ".tmp")
+    try:
+        ensure_state_dir()
+        tmp.write_text(render())
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def serve(port: int, host: str = "127.0.0.1"):
+    """Serve GET /metrics from a daemon thread."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            data = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    srv = ThreadingHTTPServer((host, port), Handler)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, name="metrics", daemon=True).start()
+    return srv
+
+
+# ---------------- profiling ----------------
+
+class Profiler:
+    """
+    Wall-clock sampler for --profile. While a cycle runs, every thread's stack
+    is sampled every `interval` seconds; stop() writes the samples as folded
+    stacks ("thread;file:func;... count"), the input format of flamegraph.pl,
+    speedscope and inferno.
+    """
+
+    def __init__(self, out_dir: Path, interval: float = 0.005):
+        self.out_dir = Path(out_dir)
+        self.interval = interval
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._cycles = 0
+
+    def start(self) -> None:
+        self._stacks = Counter()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me or names.get(ident) == "metrics":  # our own idle server
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self._stacks[";".join(reversed(stack))] += 1
+
+    def stop(self) -> Optional[Path]:
+        """End the cycle's sampling; returns the folded-stack file, if anything was sampled."""
+        if self._thread is None:
+            return None
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        if not self._stacks:
+            return None
+        self._cycles += 1
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        path = self.out_dir / f"cycle-{time.strftime('%Y%m%dT%H%M%S')}-{self._cycles}.folded"
+        path.write_text("".join(f"{s} {n}\n" for s, n in self._stacks.most_common()))
+        return path
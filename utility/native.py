@@ -0,0 +1,158 @@
+import os
+import re
+from typing import List, Optional
+
+# Native Linux probes: the same answers as the findmnt / lsblk / systemctl /
+# pgrep heuristics in checks.py, read straight from /proc and /sys without
+# forking. Every function takes the proc/sys roots so fake trees can be used.
+
+PROC = "/proc"
+SYS = "/sys"
+
+
+def available(proc: str = PROC, sys: str = SYS) -> bool:
+    """True when the /proc and /sys trees this module reads are present."""
+    return os.path.isfile(os.path.join(proc, "self", "mountinfo")) and os.path.isdir(os.path.join(sys, "block"))
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+# ---------------- Disk Encryption ----------------
+
+def _unescape(field: str) -> str:
+    # mountinfo escapes space, tab, newline and backslash as \ooo
+    return re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), field)
+
+
+def root_mount_source(proc: str = PROC) -> Optional[str]:
+    """Source device of the / mount (the topmost one), like `findmnt -n -o SOURCE /`."""
+    text = _read(os.path.join(proc, "self", "mountinfo"))
+    if not text:
+        return None
+    source = None
+    for line in text.splitlines():
+        pre, sep, post = line.partition(" - ")
+        fields = pre.split()
+        if not sep or len(fields) < 5:
+            continue
+        if _unescape(fields[4]) == "/":
+            tail = post.split()
+            if len(tail) >= 2:
+                source = _unescape(tail[1])
+    return source
+
+
+def _dm_names(sys: str) -> dict:
+    """Map device-mapper names to their kernel block names (vg-root -> dm-0)."""
+    names = {}
+    block = os.path.join(sys, "block")
+    try:
+        entries = os.listdir(block)
+    except OSError:
+        return names
+    for blk in entries:
+        if blk.startswith("dm-"):
+            name = _read(os.path.join(block, blk, "dm", "name"))
+            if name:
+                names[name] = blk
+    return names
+
+
+def _is_crypt(blk: str, sys: str) -> bool:
+    uuid = _read(os.path.join(sys, "class", "block", blk, "dm", "uuid")) \
+        or _read(os.path.join(sys, "block", blk, "dm", "uuid"))
+    return bool(uuid and uuid.startswith("CRYPT-"))
+
+
+def _stack_has_crypt(blk: str, sys: str, seen: Optional[set] = None) -> bool:
+    """Walk slaves/ links below a block device looking for a crypt layer."""
+    seen = seen if seen is not None else set()
+    if blk in seen:
+        return False
+    seen.add(blk)
+    if _is_crypt(blk, sys):
+        return True
+    for base in (os.path.join(sys, "class", "block", blk), os.path.join(sys, "block", blk)):
+        try:
+            slaves = os.listdir(os.path.join(base, "slaves"))
+        except OSError:
+            continue
+        return any(_stack_has_crypt(s, sys, seen) for s in slaves)
+    return False
+
+
+def disk_encryption(proc: str = PROC, sys: str = SYS) -> Optional[bool]:
+    """
+    Same heuristics as the command path: root on /dev/mapper/* (or anything
+    named crypt), root stacked on a crypt layer, or any crypt device at all.
+    Returns True or None, never False.
+    """
+    dm = _dm_names(sys)
+    src = root_mount_source(proc) or ""
+    blk = None
+    m = re.match(r"/dev/(dm-\d+)$", src)
+    if m:
+        blk = m.group(1)
+        # findmnt reports dm devices by their mapper name
+        for name, b in dm.items():
+            if b == blk:
+                src = f"/dev/mapper/{name}"
+    elif src.startswith("/dev/mapper/"):
+        blk = dm.get(src[len("/dev/mapper/"):])
+    elif src.startswith("/dev/"):
+        blk = os.path.basename(src)
+
+    if "/dev/mapper/" in src or "crypt" in src:
+        return True
+    if blk and _stack_has_crypt(blk, sys):
+        return True
+    if any(_is_crypt(b, sys) for b in dm.values()):
+        return True
+    return None
+
+
+# ---------------- Services / Processes ----------------
+
+_CGROUP_UNIT_DIRS = (
+    ("fs", "cgroup", "system.slice"),             # cgroup v2
+    ("fs", "cgroup", "unified", "system.slice"),  # hybrid
+    ("fs", "cgroup", "systemd", "system.slice"),  # cgroup v1
+)
+
+
+def unit_active(service: str, sys: str = SYS) -> bool:
+    """Like `systemctl is-active`: an active service unit owns a non-empty cgroup."""
+    for parts in _CGROUP_UNIT_DIRS:
+        procs = _read(os.path.join(sys, *parts, f"{service}.service", "cgroup.procs"))
+        if procs:
+            return True
+    return False
+
+
+def process_table(proc: str = PROC) -> List[tuple]:
+    """Return [(pid, comm, cmdline)] for every process, skipping this one."""
+    me = str(os.getpid())
+    table = []
+    try:
+        pids = [p for p in os.listdir(proc) if p.isdigit() and p != me]
+    except OSError:
+        return table
+    for pid in pids:
+        comm = _read(os.path.join(proc, pid, "comm"))
+        if comm is None:
+            continue  # exited while scanning
+        try:
+            with open(os.path.join(proc, pid, "cmdline"), "rb") as f:
+                raw = f.read()
+        except OSError:
+            raw = b""
+        cmdline = raw.replace(b"\0", b" ").decode("utf-8", "replace").strip()
+        table.append((int(pid), comm, cmdline))
+    return table
+
@@ -0,0 +1,349 @@
+"""
+Durable outbox for reports, drained to the backend in gzip batches.
+
+Every report is appended to STATE_DIR/outbox.log (one JSON record per line,
+fsync'd) before any upload is attempted, so transitions that happen while the
+backend is unreachable are kept across restarts. The highest acknowledged
+sequence number lives in STATE_DIR/outbox.ack; acknowledged records are
+dropped by compaction.
+
+Batch upload protocol (served by backend/src/routes/report.routes.js and by
+standin.py for local testing):
+
+    POST <BATCH_URL>                    default: <API_URL>/batch
+    Authorization: Bearer <API_KEY>
+    Content-Type: application/json
+    Content-Encoding: gzip
+    body: {"reports": [<item>, ...]}            items in send order
+
+    item: a full snapshot plus its "version", or a delta against the
+    state the server holds for the machine:
+        {"machineId", "baseVersion", "version", "delta": {<changed fields>},
+         "timestamp", "checkTimings", "timedOut", "agentMetrics"}
+    A version is utils.state_version() over the per-field digests of a
+    snapshot, excluding META_KEYS; those describe the collection, not the
+    state, and travel next to the delta rather than in it. The first item of a batch is a delta
+    against the last acknowledged state (last_state.json); each later item
+    is a delta against the item before it.
+
+    200 {"ok": true, "accepted": <n>, "rejected": [<index>, ...]}
+        the whole batch is acknowledged; rejected items failed validation
+        and are dropped, logged and counted (reports_rejected_total).
+        An optional "nextReportSeconds" asks the agent not to upload again
+        for that long; reports queued meanwhile go in the next batch.
+    409 {"error": "version mismatch", "accepted": <n>, "rejected": [...], "index": <i>}
+        the items before <i> were applied or rejected; item <i> was a delta
+        against a state the server does not hold. The rest is resent
+        starting with a full snapshot.
+    400
+        the batch failed validation and can never succeed as sent; it is dropped
+    other 4xx / 5xx / network error
+        nothing is acknowledged; the batch is retried with backoff
+        (Retry-After, in seconds or as an HTTP date, is honoured when present).
+        401/403 (bad or rotated token) and 404 (backend without the batch
+        route) are retried too: the outbox keeps every transition until the
+        configuration is fixed. After a 413 the batch size is halved.
+"""
+import gzip
+import json
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+import metrics
+from config import (
+    API_KEY, BATCH_URL, OUTBOX_FILE, OUTBOX_ACK_FILE, OUTBOX_BATCH_SIZE,
+    REQUEST_TIMEOUT_SECONDS
+)
+from pacing import retry_after_seconds
+from utils import now_iso, FieldHasher, META_KEYS, state_version
+
+COMPACT_AFTER = 256       # acknowledged records before the log is rewritten
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_CAP_SECONDS = 15 * 60
+HINT_CAP_SECONDS = 60 * 60  # longest a server hint may hold back uploads
+
+
+def _fsync_write(path: Path, data: str) -> None:
+    """Replace path atomically with data."""
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class Outbox:
+    def __init__(self, path: Path = OUTBOX_FILE, ack_path: Path = OUTBOX_ACK_FILE):
+        self.path = Path(path)
+        self.ack_path = Path(ack_path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.acked = self._read_ack()
+        self._torn = False
+        self._records = self._read_log()
+        if self._torn:
+            self._compact()  # later appends would otherwise join the torn line
+        self.last_seq = self._records[-1][0] if self._records else self.acked
+
+    def _read_ack(self) -> int:
+        try:
+            return int(self.ack_path.read_text().strip() or 0)
+        except Exception:
+            return 0
+
+    def _read_log(self) -> List[Tuple[int, Dict[str, Any]]]:
+        records = []
+        try:
+            with open(self.path, "r") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        self._torn = True  # torn tail from a crash mid-append
+                        continue
+                    records.append((rec["seq"], rec["report"]))
+        except FileNotFoundError:
+            pass
+        return records
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(1 for seq, _ in self._records if seq > self.acked)
+
+    def append(self, report: Dict[str, Any]) -> int:
+        return self.append_many([report])
+
+    def append_many(self, reports: List[Dict[str, Any]]) -> int:
+        """Append reports with a single fsync. Returns the last sequence number."""
+        with self._lock:
+            lines, records = [], []
+            for report in reports:
+                self.last_seq += 1
+                lines.append(json.dumps({"seq": self.last_seq, "report": report}, separators=(",", ":")) + "\n")
+                records.append((self.last_seq, report))
+            with open(self.path, "a") as f:
+                f.write("".join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+            self._records.extend(records)
+            return self.last_seq
+
+    def pending(self, limit: int) -> List[Tuple[int, Dict[str, Any]]]:
+        with self._lock:
+            return [r for r in self._records if r[0] > self.acked][:limit]
+
+    def ack(self, seq: int) -> None:
+        with self._lock:
+            self.acked = max(self.acked, seq)
+            _fsync_write(self.ack_path, str(self.acked))
+            done = sum(1 for s, _ in self._records if s <= self.acked)
+            if done >= COMPACT_AFTER or (done and done == len(self._records)):
+                self._compact()
+
+    def _compact(self) -> None:
+        """Rewrite the log without acknowledged records."""
+        self._records = [r for r in self._records if r[0] > self.acked]
+        _fsync_write(self.path, "".join(
+            json.dumps({"seq": s, "report": r}, separators=(",", ":")) + "\n" for s, r in self._records
+        ))
+
+
+def encode_deltas(hasher: FieldHasher, base: Optional[Dict[str, Any]],
+                  reports: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Batch items for one machine's reports: each a delta against the report
+    before it, the first against `base` (a full snapshot when base is None).
+    """
+    items = []
+    prev = None if base is None else hasher.digests(base)
+    for r in reports:
+        cur = hasher.digests(r)
+        version = state_version(cur)
+        if prev is None:
+            items.append(dict(r, version=version))
+        else:
+            item = {
+                "machineId": r["machineId"],
+                "baseVersion": state_version(prev),
+                "version": version,
+                "delta": {k: r[k] for k, d in cur.items() if prev.get(k) != d},
+            }
+            for k in sorted(META_KEYS):
+                if r.get(k) is not None:
+                    item[k] = r[k]
+            items.append(item)
+        prev = cur
+    return items
+
+
+def backoff_delay(failures: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * 2 ** failures))
+
+
+class Sender:
+    """
+    Drains an Outbox over one keep-alive session, sending field-level deltas
+    against `base`, the last state the server acknowledged. With log=False
+    (the relay) only failed sends are printed.
+    """
+
+    def __init__(self, outbox: Outbox, url: str = BATCH_URL, batch_size: int = OUTBOX_BATCH_SIZE,
+                 base: Optional[Dict[str, Any]] = None, deltas: bool = True, log: bool = True):
+        self.outbox = outbox
+        self.base = base
+        self.deltas = deltas
+        self.log = log
+        self.full_next = base is None or not deltas
+        self.hasher = FieldHasher(META_KEYS)
+        self.url = url
+        self.batch_size = batch_size
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Content-Encoding": "gzip",
+            "Authorization": f"Bearer {API_KEY}",
+            "User-Agent": "syshealth-utility/1.0",
+        })
+        self.failures = 0
+        self.retry_at = 0.0
+        self.rejected: List[Dict[str, Any]] = []  # reports the server refused in the last drain()
+
+    def seconds_until_retry(self) -> Optional[float]:
+        """None when there is nothing to send."""
+        if not len(self.outbox):
+            return None
+        return max(0.0, self.retry_at - time.monotonic())
+
+    def defer(self, seconds: float) -> None:
+        """Hold uploads for at least `seconds` (start-up splay, server hints)."""
+        self.retry_at = max(self.retry_at, time.monotonic() + seconds)
+
+    def encode(self, reports: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not self.deltas:
+            # several machines (relay): full snapshots, keeping versions already assigned
+            return [r if "version" in r else dict(r, version=self.hasher.version(r)) for r in reports]
+        return encode_deltas(self.hasher, None if self.full_next else self.base, reports)
+
+    def _post(self, reports: List[Dict[str, Any]]) -> Tuple[int, str, Any]:
+        body = gzip.compress(json.dumps({"reports": reports}, separators=(",", ":")).encode("utf-8"))
+        t0 = time.monotonic()
+        try:
+            resp = self.session.post(self.url, data=body, timeout=REQUEST_TIMEOUT_SECONDS)
+            metrics.upload(resp.status_code, len(body), time.monotonic() - t0)
+            return resp.status_code, resp.text or "", resp.headers
+        except Exception as e:
+            metrics.upload(0, len(body), time.monotonic() - t0)
+            return 0, str(e), {}
+
+    def drain(self) -> Optional[Dict[str, Any]]:
+        """
+        Send pending batches until the outbox is empty or a send fails.
+        Returns the newest report the backend acknowledged, if any.
+        """
+        acked = None
+        self.rejected = []
+        while time.monotonic() >= self.retry_at:
+            batch = self.outbox.pending(self.batch_size)
+            if not batch:
+                break
+            status, text, headers = self._post(self.encode([r for _, r in batch]))
+            if 200 <= status < 300:
+                self.outbox.ack(batch[-1][0])
+                self.failures = 0
+                acked = self.base = batch[-1][1]
+                rejected = self._rejected(batch, rejected_indexes(text))
+                # the server holds the last valid item, not necessarily ours
+                self.full_next = not self.deltas or bool(rejected)
+                if self.log:
+                    print(f"[{now_iso()}] sent {len(batch) - len(rejected)} report(s) ✅")
+                hint = _next_report_hint(text)
+                if hint:
+                    self.defer(hint)
+                    if self.log:
+                        print(f"[{now_iso()}] server asks for no upload before {hint:.0f}s")
+            elif status == 409:
+                # server holds a different state: everything before item <index>
+                # was applied or rejected; resume from a full snapshot of it
+                n = mismatch_index(text)
+                self._rejected(batch, [i for i in rejected_indexes(text) if i < n])
+                if n:
+                    self.outbox.ack(batch[n - 1][0])
+                    acked = self.base = batch[n - 1][1]
+                elif self.full_next:
+                    # a full snapshot cannot mismatch: treat as a server fault
+                    self.failures += 1
+                    self.retry_at = time.monotonic() + backoff_delay(self.failures)
+                self.full_next = True
+                if self.log:
+                    print(f"[{now_iso()}] server state differs at report {n}, sending full snapshot")
+            elif status == 400:
+                self.outbox.ack(batch[-1][0])
+                metrics.inc("reports_rejected_total", len(batch))
+                self.rejected.extend(r for _, r in batch)
+                self.full_next = True
+                if self.log:
+                    print(f"[{now_iso()}] batch rejected ({status}), dropping {len(batch)}: {text[:200]}")
+            else:
+                if status == 413 and self.batch_size > 1:
+                    self.batch_size = max(1, self.batch_size // 2)
+                delay = backoff_delay(self.failures)
+                retry_after = retry_after_seconds(headers.get("Retry-After"))
+                if retry_after is not None:
+                    delay = max(delay, min(retry_after, HINT_CAP_SECONDS))
+                self.failures += 1
+                self.retry_at = time.monotonic() + delay
+                print(f"[{now_iso()}] send failed ({status}), {len(self.outbox)} queued, retry in {delay:.0f}s: {text[:200]}")
+        return acked
+
+    def _rejected(self, batch: List[Tuple[int, Dict[str, Any]]], indexes: List[int]) -> List[Dict[str, Any]]:
+        """Count and log the items of an acknowledged batch that failed validation."""
+        reports = [batch[i][1] for i in indexes if 0 <= i < len(batch)]
+        if reports:
+            metrics.inc("reports_rejected_total", len(reports))
+            self.rejected.extend(reports)
+            if self.log:
+                for i in indexes:
+                    if 0 <= i < len(batch):
+                        r = batch[i][1]
+                        print(f"[{now_iso()}] report {i} of the batch rejected by the server "
+                              f"(machine {r.get('machineId')}, {r.get('timestamp')}), dropped")
+        return reports
+
+
+def rejected_indexes(text: str) -> List[int]:
+    """The "rejected" item indexes of a batch reply; [] when absent or malformed."""
+    try:
+        rejected = json.loads(text).get("rejected") or []
+        return [i for i in rejected if isinstance(i, int) and not isinstance(i, bool)]
+    except Exception:
+        return []
+
+
+def mismatch_index(text: str) -> int:
+    """Position of the mismatched item in a 409 body: "index", else accepted + rejected."""
+    try:
+        body = json.loads(text)
+        if isinstance(body.get("index"), int):
+            return max(0, body["index"])
+        return int(body.get("accepted", 0)) + len(body.get("rejected") or [])
+    except Exception:
+        return 0
+
+
+def _next_report_hint(text: str) -> Optional[float]:
+    """The nextReportSeconds of a 2xx response, capped; None when absent."""
+    try:
+        hint = json.loads(text).get("nextReportSeconds")
+    except Exception:
+        return None
+    if isinstance(hint, (int, float)) and not isinstance(hint, bool) and hint > 0:
+        return min(float(hint), HINT_CAP_SECONDS)
+    return None
@@ -0,0 +1,64 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+# Upload pacing: when a machine's reports reach the backend. The start-up
+# report is delayed by a per-machine offset so a fleet rebooting together
+# (patch day) does not report together; change reports from a flapping
+# machine are capped by a token bucket; server hints (Retry-After,
+# nextReportSeconds) are parsed here and honoured by outbox.Sender.
+
+
+def splay(key: str, window: float) -> float:
+    """Offset in [0, window) derived from key: stable for a machine, uniform across a fleet."""
+    if window <= 0:
+        return 0.0
+    h = int.from_bytes(hashlib.sha256(f"splay:{key}".encode("utf-8")).digest()[:8], "big")
+    return h / 2 ** 64 * window
+
+
+class TokenBucket:
+    """`burst` tokens, refilled at `rate` per second. Pass `now` to run on a simulated clock."""
+
+    def __init__(self, rate: float, burst: float, now: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now: Optional[float]) -> float:
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return now
+
+    def take(self, now: Optional[float] = None) -> bool:
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def seconds_until_token(self, now: Optional[float] = None) -> float:
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Retry-After as seconds: delta-seconds or an HTTP date. None when absent or malformed."""
+    value = (value or "").strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    return max(0.0, (at - datetime.now(timezone.utc)).total_seconds())
@@ -0,0 +1,111 @@
+import os
+import platform
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+import native
+from utils import run_command
+
+# Process names of AV / EDR products, per OS. Adding a vendor here costs no
+# extra subprocess: every name is answered from one process-table scan.
+AV_PROCESSES: Dict[str, List[str]] = {
+    "Darwin": [
+        "falcond", "SophosScanD", "SophosServiceManager",
+        "symantec", "NortonSecurity", "McAfee", "masvc", "mfemactl",
+        "bdredline",
+        "com.crowdstrike.falcon.Agent", "SentinelAgent", "sentineld",
+        "CbOsxSensorService", "cbagentd", "wdavdaemon", "ESETDaemon",
+        "esets_daemon", "kav", "iCoreService", "RTProtectionDaemon",
+        "com.avast.daemon", "JamfProtect", "CylanceSvc", "elastic-endpoint",
+        "Traps", "ClamXAV",
+    ],
+    "Linux": [
+        "clamd", "freshclam", "savd", "bdscan",
+        "falcon-sensor", "s1-agent", "sentinelone", "wdavdaemon", "mdatp",
+        "sophos-spl", "esets_daemon", "kesl", "ds_agent", "cbagentd",
+        "elastic-endpoint", "mfetpd", "cybereason", "wazuh-agentd",
+        "traps_pmd", "cylancesvc",
+    ],
+}
+
+# Service units whose active state means AV is running (checked before processes)
+AV_SERVICES: Dict[str, List[str]] = {
+    "Linux": ["clamav-daemon", "clamd", "sophosav", "bdscan", "bdredline"],
+}
+
+
+class ProcessIndex:
+    """
+    One snapshot of the process table, indexed by the names of interest.
+    A name hits when it is a whole word or path component of a process's
+    comm or cmdline: "kav" matches ".../Binaries/kav -d" but not
+    "/Users/kavya/notes.txt", which a `pgrep -f` substring match would.
+    """
+
+    def __init__(self, table: List[tuple], names: Iterable[str] = ()):
+        self._table = table  # [(pid, comm, cmdline)]
+        self._hits: Dict[str, Set[int]] = {}
+        self._indexed: Set[str] = set()
+        self._index(list(dict.fromkeys(names)))
+
+    def _index(self, names: List[str]) -> None:
+        if not names:
+            return
+        # One regex pass per process regardless of how many names are watched.
+        # A hit starts and ends at whitespace, "/" or the ends of the text.
+        ordered = sorted(names, key=len, reverse=True)
+        rx = re.compile(r"(?<![^\s/])(" + "|".join(re.escape(n) for n in ordered) + r")(?![^\s/])")
+        for n in names:
+            self._hits.setdefault(n, set())
+        for pid, comm, cmdline in self._table:
+            for m in rx.finditer(f"{comm}\n{cmdline}"):
+                self._hits[m.group(1)].add(pid)
+        self._indexed.update(names)
+
+    def pids(self, name: str) -> Set[int]:
+        if name not in self._indexed:
+            self._index([name])
+        return self._hits[name]
+
+    def running(self, names: Iterable[str]) -> List[str]:
+        """The given names that match at least one process, in order."""
+        return [n for n in names if self.pids(n)]
+
+
+def scan_processes() -> List[tuple]:
+    """Return [(pid, comm, cmdline)] for every process other than this one."""
+    if native.available():
+        return native.process_table()
+    code, out = run_command(["ps", "-axo", "pid=,comm=,args="])
+    table = []
+    if code != 0:
+        return table
+    me = os.getpid()
+    for line in out.splitlines():
+        parts = line.split(None, 2)
+        if len(parts) < 2 or not parts[0].isdigit() or int(parts[0]) == me:
+            continue
+        table.append((int(parts[0]), parts[1], parts[2] if len(parts) > 2 else ""))
+    return table
+
+
+# ---- One index per collection cycle, built on first use ----
+
+_lock = threading.Lock()
+_current: Optional[ProcessIndex] = None
+
+
+def new_cycle() -> None:
+    """Forget the previous cycle's index; the next query rescans."""
+    global _current
+    with _lock:
+        _current = None
+
+
+def process_index() -> ProcessIndex:
+    global _current
+    with _lock:
+        if _current is None:
+            _current = ProcessIndex(scan_processes(), AV_PROCESSES.get(platform.system(), []))
+        return _current
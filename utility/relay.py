@@ -0,0 +1,246 @@
+"""
+LAN relay: accepts agent reports, coalesces them per machine and forwards
+compressed batches upstream.
+
+Agents are pointed at the relay with SYSHEALTH_API_URL=http://<relay>:8470/api/reports
+and talk to it exactly as to the backend (POST /api/report, POST
+/api/reports/batch with full snapshots or deltas; see outbox.py). The relay
+keeps the latest state per machine so it can resolve deltas itself; a delta
+it cannot resolve gets 409 and the agent resends a full snapshot. Items
+are validated like the backend does (schema.py), so a report the backend
+would reject is rejected here rather than acknowledged and lost upstream.
+
+Within each window the relay keeps only the latest report per machine and
+drops reports whose version it already holds. At the end of the window the
+survivors are appended to a durable queue with one fsync, and only then are
+the agents that sent them answered, so an acknowledged report survives a
+relay crash. A forwarder drains the queue upstream in gzip batches of full
+snapshots and backs off while the upstream is down.
+
+    python relay.py --listen 0.0.0.0:8470 --upstream https://.../api/reports/batch
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import schema
+from asynchttp import HttpError, read_request, write_response
+from config import API_KEY, BATCH_URL, STATE_DIR
+from outbox import Outbox, Sender
+from utils import now_iso, FieldHasher, META_KEYS
+
+WINDOW_SECONDS = 1.0
+FORWARD_BATCH_SIZE = 200
+
+
+class CommitError(Exception):
+    """The window could not be written to the durable queue."""
+
+
+class Relay:
+    def __init__(self, upstream: str, state_dir: Path, tokens: Set[str],
+                 window: float = WINDOW_SECONDS, batch_size: int = FORWARD_BATCH_SIZE):
+        state_dir.mkdir(parents=True, exist_ok=True)
+        self.tokens = tokens
+        self.window = window
+        self.queue = Outbox(state_dir / "relay.log", state_dir / "relay.ack")
+        self.sender = Sender(self.queue, url=upstream, batch_size=batch_size, deltas=False, log=False)
+        self.states: Dict[str, Tuple[Optional[str], Dict[str, Any]]] = {}  # machineId -> (version, snapshot)
+        self.hasher = FieldHasher(META_KEYS)
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.waiters: List[asyncio.Future] = []
+        self.stats = {"received": 0, "duplicates": 0, "coalesced": 0, "queued": 0, "forwarded": 0,
+                      "rejected": 0}
+        self._work = asyncio.Event()
+
+    # ---- intake ----
+
+    def accept(self, items: List[Any]) -> Tuple[int, List[int], Optional[int]]:
+        """
+        Validate and apply items in order, like the backend batch route (see
+        schema.py). Returns (accepted, rejected indexes, mismatch index or None).
+        """
+        accepted, rejected = 0, []
+        for i, item in enumerate(items):
+            if isinstance(item, dict) and "delta" in item:
+                d, error = schema.delta(item)
+                if error:
+                    rejected.append(i)
+                    continue
+                version, state = self.states.get(d["machineId"], (None, None))
+                if state is None or version != d["baseVersion"]:
+                    return accepted, rejected, i
+                merged = {k: v for k, v in state.items() if k not in META_KEYS and k != "version"}
+                merged.update(d["delta"])
+                merged.update((k, d[k]) for k in META_KEYS if k in d)
+                merged.update(machineId=d["machineId"], version=d["version"])
+                snap, error = schema.snapshot(merged)
+            else:
+                snap, error = schema.snapshot(item)
+                if not error and not snap.get("version"):
+                    # what the agent will send as baseVersion next (outbox.encode_deltas)
+                    snap["version"] = self.hasher.version({k: v for k, v in item.items() if k != "version"})
+            if error:
+                rejected.append(i)
+                continue
+            mid = snap["machineId"]
+            version = self.states.get(mid, (None, None))[0]
+            self.stats["received"] += 1
+            accepted += 1
+            if snap["version"] == version:
+                self.stats["duplicates"] += 1
+                continue
+            self.states[mid] = (snap["version"], snap)
+            if mid in self.pending:
+                self.stats["coalesced"] += 1
+            self.pending[mid] = snap
+        return accepted, rejected, None
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    req = await read_request(reader)
+                except (HttpError, ValueError, asyncio.IncompleteReadError):
+                    write_response(writer, 400, b'{"error":"bad request"}', {"Connection": "close"})
+                    break
+                if req is None:
+                    break
+                status, body = await self.route(*req)
+                write_response(writer, status, json.dumps(body).encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method: str, path: str, headers: Dict[str, str], raw: bytes) -> Tuple[int, Dict[str, Any]]:
+        path = path.split("?")[0].rstrip("/")
+        if method != "POST" or path not in ("/api/report", "/api/reports/batch"):
+            return 404, {"error": "not found"}
+        auth = headers.get("authorization", "")
+        if not auth.startswith("Bearer ") or auth[7:] not in self.tokens:
+            return 401, {"error": "Invalid token"}
+        try:
+            data = json.loads(gzip.decompress(raw) if headers.get("content-encoding") == "gzip" else raw)
+        except Exception:
+            return 400, {"error": "invalid payload"}
+
+        if path == "/api/report":
+            items = [data]
+        elif isinstance(data, dict) and isinstance(data.get("reports"), list):
+            items = data["reports"]
+        else:
+            return 400, {"error": "invalid payload: reports[] required"}
+
+        accepted, rejected, mismatch = self.accept(items)
+        if accepted:
+            try:
+                await self._committed()
+            except CommitError:
+                return 503, {"error": "relay queue unavailable"}
+        if mismatch is not None:
+            return 409, {"error": "version mismatch", "accepted": accepted, "rejected": rejected, "index": mismatch}
+        if path == "/api/report" and rejected:
+            return 400, {"error": "invalid payload"}
+        return 200, {"ok": True, "accepted": accepted, "rejected": rejected}
+
+    async def _committed(self) -> None:
+        """Wait until the current window has been written to the durable queue."""
+        fut = asyncio.get_running_loop().create_future()
+        self.waiters.append(fut)
+        await fut
+
+    # ---- window commit + forwarding ----
+
+    async def commit_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.window)
+            if not self.waiters and not self.pending:
+                continue
+            batch, self.pending = list(self.pending.values()), {}
+            waiters, self.waiters = self.waiters, []
+            if batch:
+                try:
+                    await asyncio.to_thread(self.queue.append_many, batch)
+                except Exception as e:
+                    # nothing is acknowledged: keep the window for the next commit
+                    # (newer reports that arrived meanwhile win) and fail the waiters
+                    for snap in batch:
+                        self.pending.setdefault(snap["machineId"], snap)
+                    print(f"[{now_iso()}] relay queue write failed, {len(batch)} report(s) kept in memory: {e}")
+                    for w in waiters:
+                        if not w.done():
+                            w.set_exception(CommitError(str(e)))
+                    continue
+                self.stats["queued"] += len(batch)
+                self._work.set()
+            for w in waiters:
+                if not w.done():
+                    w.set_result(None)
+
+    async def forward_loop(self) -> None:
+        while True:
+            retry = self.sender.seconds_until_retry()
+            if retry is None:
+                self._work.clear()
+                await self._work.wait()
+                continue
+            if retry > 0:
+                try:
+                    await asyncio.wait_for(self._work.wait(), retry)
+                except asyncio.TimeoutError:
+                    pass
+                self._work.clear()
+                continue
+            before = self.queue.acked
+            await asyncio.to_thread(self.sender.drain)
+            rejected = self.sender.rejected
+            self.stats["forwarded"] += self.queue.acked - before - len(rejected)
+            if rejected:
+                # acknowledged to the agents already: the upstream's verdict is final
+                self.stats["rejected"] += len(rejected)
+                print(f"[{now_iso()}] upstream rejected {len(rejected)} report(s), dropped: "
+                      + ", ".join(f"{r.get('machineId')}@{r.get('timestamp')}" for r in rejected[:20]))
+
+    async def report_loop(self, every: float = 60.0) -> None:
+        while True:
+            await asyncio.sleep(every)
+            print(f"[{now_iso()}] relay {json.dumps(self.stats)} backlog={len(self.queue)}")
+
+
+async def serve(relay: Relay, host: str, port: int, started: Optional[asyncio.Future] = None) -> None:
+    server = await asyncio.start_server(relay.handle, host, port, backlog=1024)
+    if started is not None:
+        started.set_result(server.sockets[0].getsockname()[1])
+    print(f"[{now_iso()}] relay listening on {host}:{server.sockets[0].getsockname()[1]} → {relay.sender.url}")
+    async with server:
+        await asyncio.gather(server.serve_forever(), relay.commit_loop(),
+                             relay.forward_loop(), relay.report_loop())
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--listen", default="0.0.0.0:8470")
+    ap.add_argument("--upstream", default=BATCH_URL, help="upstream batch URL")
+    ap.add_argument("--window", type=float, default=WINDOW_SECONDS)
+    ap.add_argument("--state-dir", type=Path, default=STATE_DIR / "relay")
+    args = ap.parse_args()
+    tokens = {t.strip() for t in os.getenv("SYSHEALTH_RELAY_AGENT_KEYS", API_KEY).split(",") if t.strip()}
+    host, _, port = args.listen.rpartition(":")
+
+    async def run():
+        await serve(Relay(args.upstream, args.state_dir, tokens, args.window), host or "0.0.0.0", int(port))
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print(f"[{now_iso()}] relay exiting")
+
+
+if __name__ == "__main__":
+    main()
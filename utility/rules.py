@@ -0,0 +1,28 @@
+from typing import Any, Dict
+
+# Python port of backend/src/utils/deriveIssues.js, for local history and
+# offline analysis. Keep the two in step.
+
+ISSUES = [
+    "disk_not_encrypted", "os_outdated", "updates_pending",
+    "antivirus_missing", "antivirus_not_running", "sleep_policy_too_high",
+]
+
+
+def derive_issues(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns {"hasIssues": bool, "issues": [...]}. Unknown (None) values are never issues."""
+    issues = []
+    if snapshot.get("diskEncrypted") is False:
+        issues.append("disk_not_encrypted")
+    if snapshot.get("osUpdated") is False:
+        issues.append("os_outdated")
+    pending = snapshot.get("updatesPending")
+    if isinstance(pending, int) and not isinstance(pending, bool) and pending > 0:
+        issues.append("updates_pending")
+    if snapshot.get("antivirusInstalled") is False:
+        issues.append("antivirus_missing")
+    if snapshot.get("antivirusInstalled") is True and snapshot.get("antivirusRunning") is False:
+        issues.append("antivirus_not_running")
+    if snapshot.get("sleepPolicyOk") is False:
+        issues.append("sleep_policy_too_high")
+    return {"hasIssues": len(issues) > 0, "issues": issues}
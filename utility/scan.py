@@ -0,0 +1,168 @@
+"""
+Offline scan of mounted root filesystems (golden images, container rootfs),
+without running the agent inside them.
+
+Each root gets the file-based checks: os-release for the OS version and the
+native dpkg/apt pending-update count. Checks that need a running system
+(disk encryption, antivirus, sleep policy) are reported as unknown. Roots are
+scanned in a process pool; within a worker, the package index of a given set
+of apt lists is parsed once and shared by every image with the same lists
+(matched by content).
+
+    python scan.py /srv/images/*/rootfs > payloads.jsonl
+    python scan.py --from-file roots.txt --workers 8 --send
+
+Output: one JSON line per root, {"root": ..., "payload": {...}}, the payload
+shaped like main.collect_snapshot (osVersion is left out when a root has no
+os-release). --send uploads the payloads to the batch endpoint as full
+snapshots; exit status 3 when an upload failed, 4 when the backend rejected
+any payload.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import debpkg
+from checks import os_release_name
+from config import API_KEY, BATCH_URL, OUTBOX_BATCH_SIZE
+from utils import now_iso, http_post, FieldHasher, META_KEYS
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, "r") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def image_id(root: str) -> str:
+    """Stable id for an image: its /etc/machine-id when set (golden images usually leave it empty), else its path."""
+    seed = _read(os.path.join(root, "etc/machine-id")) or os.path.realpath(root)
+    return hashlib.sha256(f"image:{seed}".encode("utf-8")).hexdigest()[:16]
+
+
+def check_updates(root: str) -> Tuple[Dict[str, Any], Optional[str]]:
+    """Same result shape as checks.check_updates, plus the apt-lists fingerprint used."""
+    status = os.path.join(root, debpkg.STATUS_FILE)
+    lists = debpkg.package_lists(root)
+    if not os.path.isfile(status) or not lists or debpkg.has_pinning(root):
+        # pinned images need apt's own policy engine; not run offline
+        return {"pending": None, "upToDate": None}, None
+    fp, index = debpkg.candidate_index(lists)
+    pending = debpkg.count_pending(status, index)
+    return {"pending": pending, "upToDate": pending == 0}, fp
+
+
+def scan_root(root: str) -> Dict[str, Any]:
+    timings: Dict[str, float] = {}
+    t0 = time.monotonic()
+    pretty = os_release_name(root)
+    timings["os"] = round(time.monotonic() - t0, 3)
+    t0 = time.monotonic()
+    try:
+        updates, fp = check_updates(root)
+    except Exception as e:
+        print(f"[{now_iso()}] {root}: update check failed: {e}", file=sys.stderr)
+        updates, fp = {"pending": None, "upToDate": None}, None
+    timings["updates"] = round(time.monotonic() - t0, 3)
+
+    payload = {
+        "machineId": image_id(root),
+        "hostname": _read(os.path.join(root, "etc/hostname")) or os.path.basename(os.path.normpath(root)),
+        "os": "Linux",
+        "diskEncrypted": None,                          # not observable offline
+        "osUpdated": updates["upToDate"],
+        "updatesPending": updates["pending"],
+        "antivirusInstalled": None,
+        "antivirusRunning": None,
+        "antivirusName": None,
+        "sleepPolicyOk": None,
+        "sleepTimeoutMinutes": None,
+        "timestamp": now_iso(),
+        "checkTimings": timings,
+        "timedOut": [],
+    }
+    if pretty:
+        payload["osVersion"] = pretty  # the backend schema takes a string or nothing
+    return {"root": root, "listsFingerprint": fp, "payload": payload}
+
+
+def scan(roots: List[str], workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Scan roots in a process pool; results in input order."""
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        return [scan_root(r) for r in roots]
+    # contiguous chunks keep roots with the same lists (usually listed together) on one worker
+    chunksize = max(1, len(roots) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(scan_root, roots, chunksize=chunksize))
+
+
+def send(payloads: List[Dict[str, Any]]) -> Tuple[bool, List[int]]:
+    """Upload in batches. Returns (every batch acknowledged, indexes of payloads the backend rejected)."""
+    hasher = FieldHasher(META_KEYS)
+    ok, rejected = True, []
+    for i in range(0, len(payloads), OUTBOX_BATCH_SIZE):
+        batch = [dict(p, version=hasher.version(p)) for p in payloads[i:i + OUTBOX_BATCH_SIZE]]
+        body = gzip.compress(json.dumps({"reports": batch}, separators=(",", ":")).encode("utf-8"))
+        status, text, _ = http_post(BATCH_URL, body, {
+            "Content-Type": "application/json",
+            "Content-Encoding": "gzip",
+            "Authorization": f"Bearer {API_KEY}",
+            "User-Agent": "syshealth-utility/1.0",
+        })
+        if not 200 <= status < 300:
+            print(f"[{now_iso()}] send failed ({status}): {text[:200]}", file=sys.stderr)
+            ok = False
+            continue
+        try:
+            rejected += [i + j for j in json.loads(text).get("rejected") or []]
+        except (ValueError, AttributeError, TypeError):
+            pass
+    return ok, rejected
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("roots", nargs="*", help="mounted root filesystems")
+    ap.add_argument("--from-file", help="file with one root per line")
+    ap.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    ap.add_argument("--send", action="store_true", help=f"upload the payloads to {BATCH_URL}")
+    args = ap.parse_args()
+
+    roots = list(args.roots)
+    if args.from_file:
+        with open(args.from_file) as f:
+            roots += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    missing = [r for r in roots if not os.path.isdir(r)]
+    if missing:
+        sys.exit(f"not a directory: {', '.join(missing)}")
+    if not roots:
+        ap.error("no roots given")
+
+    t0 = time.monotonic()
+    results = scan(roots, args.workers)
+    for r in results:
+        print(json.dumps(r))
+    shared = len({r["listsFingerprint"] for r in results if r["listsFingerprint"]})
+    print(f"[{now_iso()}] scanned {len(results)} root(s), {shared} distinct apt list set(s), "
+          f"{time.monotonic() - t0:.1f}s", file=sys.stderr)
+    if args.send:
+        ok, rejected = send([r["payload"] for r in results])
+        for i in rejected:
+            print(f"[{now_iso()}] rejected by the backend: {results[i]['root']}", file=sys.stderr)
+        if not ok:
+            sys.exit(3)
+        if rejected:
+            sys.exit(4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import random
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import cache
+import procs
+from config import CHECK_CPU_BUDGET
+from utils import run_checks
+
+# Per-check adaptive cadence. A check whose value keeps changing (or just
+# changed) is polled more often, down to its floor; a check whose value holds
+# still backs off towards its ceiling. A check is not run more often than its
+# own cost allows (interval >= cost / CHECK_CPU_BUDGET, cost smoothed over
+# runs), but never waits longer than its ceiling. A check whose watched files
+# (cache.cached(watch=...)) changed is due right away.
+
+SPEED_UP = 0.5
+BACK_OFF = 1.5
+COST_SMOOTHING = 0.3  # weight of the newest run in the smoothed cost
+
+
+class CheckSchedule:
+    def __init__(self, name: str, fn: Callable[[], Any], deadline: float,
+                 min_interval: float, max_interval: float, jitter: float = 0.0):
+        self.name = name
+        self.fn = fn
+        self.deadline = deadline
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.interval = (min_interval * max_interval) ** 0.5
+        self.next_at = 0.0
+        self.value: Any = None
+        self.has_value = False
+        self.cost = 0.0
+        self.avg_cost: Optional[float] = None  # smoothed; the first (cold) run is left out
+        self.runs = 0
+        self.files = cache.signature(fn)
+        self.timed_out = False
+
+    def runner(self) -> Callable[[], Any]:
+        # First run may come from the result cache; scheduled runs re-probe.
+        return getattr(self.fn, "refresh", self.fn) if self.has_value else self.fn
+
+    def files_changed(self) -> bool:
+        return self.files is not None and cache.signature(self.fn) != self.files
+
+    def _observe(self, cost: float) -> float:
+        """Record a run's cost; returns the interval floor it implies."""
+        self.cost = cost
+        self.runs += 1
+        if self.runs > 1:  # the first run pays one-off start-up (bash worker, cold caches)
+            self.avg_cost = cost if self.avg_cost is None else \
+                COST_SMOOTHING * cost + (1 - COST_SMOOTHING) * self.avg_cost
+        return (self.avg_cost or 0.0) / CHECK_CPU_BUDGET
+
+    def update(self, value: Any, cost: float, now: float) -> bool:
+        changed = not self.has_value or value != self.value
+        factor = SPEED_UP if changed else BACK_OFF
+        floor = max(self.min_interval, self._observe(cost))
+        self.interval = min(self.max_interval, max(floor, self.interval * factor))
+        self.value, self.has_value, self.timed_out = value, True, False
+        j = min(self.jitter, self.interval * 0.1)
+        self.next_at = now + self.interval + random.uniform(-j, j)
+        return changed
+
+    def missed(self, cost: float, now: float) -> None:
+        # keep the last value; try again soon, but not before the check could
+        # finish, and never later than the ceiling
+        self.timed_out = True
+        self.next_at = now + min(self.max_interval, max(self.min_interval, self._observe(cost)))
+
+
+class Scheduler:
+    def __init__(self, checks: Dict[str, Tuple[Callable[[], Any], float]],
+                 cadence: Dict[str, Tuple[float, float]], jitter: float = 0.0):
+        self.checks = {
+            name: CheckSchedule(name, fn, deadline, *cadence[name], jitter=jitter)
+            for name, (fn, deadline) in checks.items()
+        }
+
+    def seconds_until_due(self) -> float:
+        return max(0.0, min(s.next_at for s in self.checks.values()) - time.monotonic())
+
+    def run_due(self, force: bool = False, names: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        Run every due check together, or exactly `names` when given.
+        Returns the names whose value changed.
+        """
+        now = time.monotonic()
+        if names is not None:
+            due = [self.checks[n] for n in names if n in self.checks]
+        else:
+            due = [s for s in self.checks.values() if force or s.next_at <= now or s.files_changed()]
+        if not due:
+            return []
+        for s in due:
+            s.files = cache.signature(s.fn)
+        procs.new_cycle()
+        results, timings, timed_out = run_checks({s.name: (s.runner(), s.deadline) for s in due})
+        now = time.monotonic()
+        changed = []
+        for s in due:
+            if s.name in timed_out:
+                s.missed(timings[s.name], now)
+            elif s.update(results[s.name], timings[s.name], now):
+                changed.append(s.name)
+        return changed
+
+    def latest(self) -> Tuple[Dict[str, Any], Dict[str, float], list]:
+        """Latest value, cost and timeout state of every check, shaped like run_checks."""
+        results = {n: s.value for n, s in self.checks.items()}
+        timings = {n: round(s.cost, 3) for n, s in self.checks.items()}
+        timed_out = [n for n, s in self.checks.items() if s.timed_out]
+        return results, timings, timed_out
+
+    def describe(self) -> str:
+        return " ".join(f"{n}={s.interval:.0f}s" for n, s in self.checks.items())
@@ -0,0 +1,115 @@
+"""
+The backend's payload validation (SnapshotSchema / DeltaSchema in
+backend/src/routes/report.routes.js), mirrored for standin.py and relay.py
+so a payload the backend would reject is rejected before it is acknowledged.
+
+Like zod's z.object, unknown keys are dropped rather than rejected; an
+optional field may be absent but not null unless it is also nullable.
+
+    clean, error = snapshot(item)     error is None when item is valid
+    clean, error = delta(item)
+"""
+import re
+from typing import Any, Callable, Dict, Optional, Tuple
+
+Result = Tuple[Optional[Dict[str, Any]], Optional[str]]
+
+# z.string().datetime(): UTC ("Z") only, seconds and fractions optional
+_DATETIME = re.compile(r"^\d{4}-\d{2}-\d{2}T([01]\d|2[0-3]):[0-5]\d(:[0-5]\d(\.\d+)?)?Z$")
+
+
+def _string(v: Any) -> bool:
+    return isinstance(v, str)
+
+
+def _number(v: Any) -> bool:
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+def _int(v: Any) -> bool:
+    return _number(v) and float(v).is_integer()
+
+
+def _bool(v: Any) -> bool:
+    return isinstance(v, bool)
+
+
+def _nullable(check: Callable[[Any], bool]) -> Callable[[Any], bool]:
+    return lambda v: v is None or check(v)
+
+
+def _datetime(v: Any) -> bool:
+    return isinstance(v, str) and bool(_DATETIME.match(v))
+
+
+def _record(check: Callable[[Any], bool]) -> Callable[[Any], bool]:
+    return lambda v: isinstance(v, dict) and all(isinstance(k, str) and check(x) for k, x in v.items())
+
+
+def _strings(v: Any) -> bool:
+    return isinstance(v, list) and all(isinstance(x, str) for x in v)
+
+
+# Optional fields of a snapshot (machineId is required and checked separately)
+SNAPSHOT_FIELDS: Dict[str, Callable[[Any], bool]] = {
+    "hostname": _string,
+    "os": _string,
+    "osVersion": _string,
+    "diskEncrypted": _nullable(_bool),
+    "osUpdated": _nullable(_bool),
+    "updatesPending": _nullable(_int),
+    "antivirusInstalled": _nullable(_bool),
+    "antivirusRunning": _nullable(_bool),
+    "antivirusName": _nullable(_string),
+    "sleepPolicyOk": _nullable(_bool),
+    "sleepTimeoutMinutes": _nullable(_int),
+    "timestamp": _datetime,
+    "version": _string,
+    "checkTimings": _record(_number),
+    "timedOut": _strings,
+    "agentMetrics": _record(_nullable(_number)),
+}
+
+# Collection metadata sent next to a delta (utils.META_KEYS)
+META_FIELDS = ("timestamp", "checkTimings", "timedOut", "agentMetrics")
+
+
+def _fields(item: Dict[str, Any], names, out: Dict[str, Any]) -> Optional[str]:
+    for k in names:
+        if k in item:
+            if not SNAPSHOT_FIELDS[k](item[k]):
+                return f"invalid {k}"
+            out[k] = item[k]
+    return None
+
+
+def _nonempty(v: Any) -> bool:
+    return isinstance(v, str) and len(v) > 0
+
+
+def snapshot(item: Any) -> Result:
+    if not isinstance(item, dict):
+        return None, "not an object"
+    if not _nonempty(item.get("machineId")):
+        return None, "invalid machineId"
+    clean = {"machineId": item["machineId"]}
+    error = _fields(item, SNAPSHOT_FIELDS, clean)
+    return (None, error) if error else (clean, None)
+
+
+def delta(item: Any) -> Result:
+    if not isinstance(item, dict):
+        return None, "not an object"
+    for k in ("machineId", "baseVersion", "version"):
+        if not _nonempty(item.get(k)):
+            return None, f"invalid {k}"
+    if not isinstance(item.get("delta"), dict):
+        return None, "invalid delta"
+    changes: Dict[str, Any] = {}
+    error = _fields(item["delta"], SNAPSHOT_FIELDS, changes)
+    if error:
+        return None, f"delta: {error}"
+    clean = {k: item[k] for k in ("machineId", "baseVersion", "version")}
+    clean["delta"] = changes
+    error = _fields(item, META_FIELDS, clean)
+    return (None, error) if error else (clean, None)
@@ -0,0 +1,195 @@
+"""
+Local stand-in for the backend's agent endpoints, for tests and benchmarks.
+
+Speaks the same protocol as backend/src/routes/report.routes.js:
+
+    POST /api/report           one snapshot                 -> {"ok": true}
+    POST /api/reports/batch    {"reports": [...]}, gzip ok  -> {"ok": true, "accepted": n, "rejected": []}
+                               full snapshots and deltas; a stale delta base -> 409
+
+Items are validated like the backend's zod schemas (schema.py): invalid ones
+are listed in "rejected", and an invalid /api/report payload gets a 400.
+
+Bearer auth is checked against --token. --fail-rate and --cold-start
+simulate an unreliable backend (random 503s, with Retry-After when
+--retry-after is set; every request stalls until the server has been up for
+N seconds, like a Render cold start). --max-batch answers 413 to larger
+batches, like a body-size limit. --next-report adds the "nextReportSeconds"
+scheduling hint to every 200. Tests can queue exact replies in `scripted`.
+
+    python standin.py --port 5055
+    SYSHEALTH_API_URL=http://127.0.0.1:5055/api/reports python main.py
+"""
+import argparse
+import gzip
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+import schema
+from utils import META_KEYS
+
+
+class StandIn(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # a fleet reconnecting at once must not overflow the listen backlog
+
+    def __init__(self, addr: Tuple[str, int], token: Optional[str] = "dev-agent-token",
+                 fail_rate: float = 0.0, cold_start: float = 0.0, keep: bool = True,
+                 next_report: float = 0.0, retry_after: Optional[str] = None, max_batch: int = 0):
+        super().__init__(addr, _Handler)
+        self.token = token
+        self.fail_rate = fail_rate
+        self.retry_after = retry_after
+        self.max_batch = max_batch
+        self.scripted: List[Tuple[int, Dict[str, Any], Dict[str, str]]] = []  # (status, body, headers), served first
+        self.next_report = next_report
+        self.ready_at = time.monotonic() + cold_start
+        self.keep = keep
+        self.lock = threading.Lock()
+        self.reports: List[Dict[str, Any]] = []
+        self.states: Dict[str, Tuple[Optional[str], Dict[str, Any]]] = {}  # machineId -> (version, snapshot)
+        self.stats = {"requests": 0, "reports": 0, "failed": 0, "bytes": 0}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/reports"
+
+    def apply(self, items: List[Dict[str, Any]], nbytes: int) -> Tuple[int, List[int], Optional[int]]:
+        """
+        Apply full snapshots and deltas in order, like the backend batch route.
+        Returns (accepted, rejected indexes, index of a version mismatch or None).
+        """
+        applied, rejected, mismatch = [], [], None
+        with self.lock:
+            for i, item in enumerate(items):
+                if isinstance(item, dict) and "delta" in item:
+                    d, error = schema.delta(item)
+                    if error:
+                        rejected.append(i)
+                        continue
+                    version, state = self.states.get(d["machineId"], (None, None))
+                    if state is None or version != d["baseVersion"]:
+                        mismatch = i
+                        break
+                    # the backend rebuilds the base from stored state fields only
+                    merged = {k: v for k, v in state.items() if k not in META_KEYS and k != "version"}
+                    merged.update(d["delta"])
+                    merged.update((k, d[k]) for k in META_KEYS if k in d)
+                    merged.update(machineId=d["machineId"], version=d["version"])
+                    snap, error = schema.snapshot(merged)
+                else:
+                    snap, error = schema.snapshot(item)
+                if error:
+                    rejected.append(i)
+                    continue
+                mid = snap["machineId"]
+                self.states[mid] = (snap.get("version"), snap)
+                applied.append(snap)
+            self.stats["reports"] += len(applied)
+            self.stats["bytes"] += nbytes
+            if self.keep:
+                self.reports.extend(applied)
+        return len(applied), rejected, mismatch
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real backend
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _ok(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        if self.server.next_report:
+            body["nextReportSeconds"] = self.server.next_report
+        return dict(ok=True, **body)
+
+    def do_POST(self):
+        srv: StandIn = self.server
+        raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        with srv.lock:
+            srv.stats["requests"] += 1
+        wait = srv.ready_at - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        if srv.token and self.headers.get("Authorization", "") != f"Bearer {srv.token}":
+            return self._reply(401, {"error": "Invalid token"})
+        with srv.lock:
+            scripted = srv.scripted.pop(0) if srv.scripted else None
+        if scripted:
+            return self._reply(*scripted)
+        if random.random() < srv.fail_rate:
+            with srv.lock:
+                srv.stats["failed"] += 1
+            return self._reply(503, {"error": "unavailable"},
+                               {"Retry-After": srv.retry_after} if srv.retry_after else None)
+        try:
+            body = gzip.decompress(raw) if self.headers.get("Content-Encoding") == "gzip" else raw
+            data = json.loads(body or b"{}")
+        except Exception:
+            return self._reply(400, {"error": "invalid payload"})
+
+        path = self.path.split("?")[0].rstrip("/")
+        if path == "/api/report":
+            if schema.snapshot(data)[1]:
+                return self._reply(400, {"error": "invalid payload"})
+            srv.apply([data], len(raw))
+            return self._reply(200, self._ok({}))
+        if path == "/api/reports/batch":
+            reports = data.get("reports") if isinstance(data, dict) else None
+            if not isinstance(reports, list):
+                return self._reply(400, {"error": "invalid payload: reports[] required"})
+            if srv.max_batch and len(reports) > srv.max_batch:
+                return self._reply(413, {"error": "payload too large"})
+            accepted, rejected, mismatch = srv.apply(reports, len(raw))
+            if mismatch is not None:
+                return self._reply(409, {"error": "version mismatch", "accepted": accepted,
+                                         "rejected": rejected, "index": mismatch})
+            return self._reply(200, self._ok({"accepted": accepted, "rejected": rejected}))
+        return self._reply(404, {"error": "not found"})
+
+
+def start(port: int = 0, **kwargs) -> StandIn:
+    """Start a stand-in on 127.0.0.1 in a background thread. port=0 picks a free port."""
+    srv = StandIn(("127.0.0.1", port), **kwargs)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--port", type=int, default=5055)
+    ap.add_argument("--token", default="dev-agent-token")
+    ap.add_argument("--fail-rate", type=float, default=0.0)
+    ap.add_argument("--cold-start", type=float, default=0.0)
+    ap.add_argument("--next-report", type=float, default=0.0, help="nextReportSeconds hint in every 200 (0 = none)")
+    ap.add_argument("--retry-after", default=None, help="Retry-After on the --fail-rate 503s (seconds or an HTTP date)")
+    ap.add_argument("--max-batch", type=int, default=0, help="413 for batches with more reports (0 = no limit)")
+    args = ap.parse_args()
+    srv = start(args.port, token=args.token, fail_rate=args.fail_rate, cold_start=args.cold_start, keep=False,
+                next_report=args.next_report, retry_after=args.retry_after, max_batch=args.max_batch)
+    print(f"stand-in listening on {srv.url}")
+    try:
+        while True:
+            time.sleep(10)
+            print(json.dumps(srv.stats))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
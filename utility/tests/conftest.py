@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+
+# The agent's modules are flat siblings run from utility/; make them importable.
+UTILITY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, UTILITY)
+
+# config.py reads the environment at import: keep tests out of ~/.syshealth-utility
+os.environ.setdefault("SYSHEALTH_STATE_DIR", tempfile.mkdtemp(prefix="syshealth-test-"))
+
+FIXTURES = os.path.join(UTILITY, "fixtures", "linux")
+
+
+def fixture_root(case: str, tree: str) -> str:
+    """fixtures/linux/<case>/<proc|sys>"""
+    return os.path.join(FIXTURES, case, tree)
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from analyze import analyze
+
+DAY = 86400
+T0 = 20370 * DAY  # 2025-10-09T00:00:00Z
+OK = {"diskEncrypted": True, "osUpdated": True, "updatesPending": 0, "antivirusInstalled": True,
+      "antivirusRunning": True, "sleepPolicyOk": True}
+BAD = dict(OK, diskEncrypted=False)
+
+
+def export(tmp_path, rows):
+    """rows: (machineId, seconds after T0, payload fields), as mongoexport writes Report documents."""
+    path = tmp_path / "reports.jsonl"
+    with open(path, "w") as f:
+        for mid, t, fields in rows:
+            f.write(json.dumps({"machineId": mid, "createdAt": {"$date": (T0 + t) * 1000},
+                                "payload": dict(fields, machineId=mid, hostname=f"host-{mid}")}) + "\n")
+    return str(path)
+
+
+def compliance(result):
+    return [(r["machines"], r["reporting"], r["compliant"]) for r in result["compliance"]]
+
+
+def test_silent_machines_keep_their_last_state(tmp_path):
+    path = export(tmp_path, [
+        ("a", 0 * DAY + 10, OK),
+        ("b", 0 * DAY + 20, BAD),
+        ("b", 1 * DAY + 30, OK),   # day 2: only b reports; a is still compliant
+        ("c", 3 * DAY + 40, BAD),  # day 3 has no reports at all
+    ])
+    result = analyze(path)
+    assert compliance(result) == [(2, 2, 1), (2, 1, 2), (2, 0, 2), (3, 1, 2)]
+    assert [r["pct"] for r in result["compliance"]] == [50.0, 100.0, 100.0, 66.7]
+    assert result["compliance"][1]["start"] == "2025-10-10T00:00:00Z"
+
+
+def test_latest_report_in_a_bucket_wins(tmp_path):
+    path = export(tmp_path, [
+        ("a", 3600 * 5, BAD),
+        ("a", 3600 * 2, OK),       # older, though later in the file
+        ("a", DAY + 60, OK),
+    ])
+    assert compliance(analyze(path)) == [(1, 1, 0), (1, 1, 1)]
+
+
+@pytest.mark.parametrize("chunk", [1, 2, 3, 1000])
+def test_compliance_does_not_depend_on_chunks(tmp_path, chunk):
+    rows = [("a", 3 * DAY, BAD), ("b", 0, OK), ("a", 0, OK), ("b", 2 * DAY, BAD), ("a", DAY, BAD)]
+    assert compliance(analyze(export(tmp_path, rows), chunk=chunk)) == \
+        [(2, 2, 2), (2, 1, 1), (2, 1, 0), (2, 1, 0)]
+
+
+def test_remediation_and_offenders(tmp_path):
+    path = export(tmp_path, [
+        ("a", 0, OK),
+        ("a", 3600, BAD),
+        ("a", 3 * 3600, OK),           # fixed after 2 h
+        ("b", 0, dict(OK, antivirusRunning=False)),
+        ("b", 10 * 3600, dict(OK, antivirusRunning=False)),
+    ])
+    result = analyze(path)
+    disk = result["remediation"]["disk_not_encrypted"]
+    assert disk == {"remediated": 1, "meanHours": 2.0, "stillOpen": 0}
+    assert result["remediation"]["antivirus_not_running"]["stillOpen"] == 1
+    offenders = {o["machineId"]: o for o in result["offenders"]}
+    assert offenders["b"]["hoursWithIssues"] == 10.0 and offenders["b"]["openNow"] == ["antivirus_not_running"]
+    assert offenders["a"]["hoursWithIssues"] == 2.0 and offenders["a"]["openNow"] == []
+
+
+def test_stale_reports_across_chunks_are_skipped(tmp_path):
+    rows = [("a", 1000, BAD), ("a", 10, OK), ("a", 20, OK), ("a", 30, OK)]
+    result = analyze(export(tmp_path, rows), chunk=1)
+    assert result["outOfOrder"] == 3
+    # the newest report stands: the issue is still open, never remediated
+    assert result["remediation"]["disk_not_encrypted"] == {"remediated": 0, "meanHours": None, "stillOpen": 1}
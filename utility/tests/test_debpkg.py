@@ -0,0 +1,70 @@
+import shutil
+import subprocess
+
+import pytest
+
+import bench
+import debpkg
+from debpkg import compare_versions
+
+# (a, b, sign of compare_versions(a, b)), as ordered by dpkg --compare-versions
+CASES = [
+    ("1.0", "1.0", 0),
+    ("1.0", "1.0-0", 0),         # a missing revision compares equal to "0"
+    ("1.0-1", "1.0-2", -1),
+    ("1.10", "1.9", 1),
+    ("1.01", "1.1", 0),          # leading zeros are ignored
+    ("1:0.1", "2.0", 1),         # epoch wins
+    ("0:2.0", "2.0", 0),
+    ("1.0~rc1", "1.0", -1),      # '~' sorts before the end of the string
+    ("1.0~rc1", "1.0~rc2", -1),
+    ("1.0~~", "1.0~", -1),
+    ("1.0a", "1.0", 1),
+    ("1.0a", "1.0+", -1),        # letters sort before non-letters
+    ("1.0+dfsg", "1.0.1", -1),
+    ("2.36-9+deb12u4", "2.36-9+deb12u10", -1),
+    ("1.2.3-1ubuntu1", "1.2.3-1", 1),
+    ("7.88.1-10+deb12u5", "7.88.1-10+deb12u5~bpo11+1", 1),
+    ("1:2.3-a-b", "1:2.3-a", 1),  # only the last hyphen starts the revision
+]
+
+
+def _sign(n):
+    return (n > 0) - (n < 0)
+
+
+@pytest.mark.parametrize("a,b,expected", CASES)
+def test_compare_versions(a, b, expected):
+    assert _sign(compare_versions(a, b)) == expected
+    assert _sign(compare_versions(b, a)) == -expected
+
+
+@pytest.mark.skipif(shutil.which("dpkg") is None, reason="dpkg not installed")
+@pytest.mark.parametrize("a,b,expected", CASES)
+def test_matches_dpkg(a, b, expected):
+    op = {-1: "lt", 0: "eq", 1: "gt"}[expected]
+    assert subprocess.run(["dpkg", "--compare-versions", a, op, b]).returncode == 0
+
+
+# ---------------- pending upgrades ----------------
+
+def test_dependency_names():
+    assert debpkg._names("a (>= 1), b:any | c [amd64], d:amd64") == (("a",), ("b", "c"), ("d",))
+    assert debpkg._names("") == ()
+
+
+@pytest.mark.parametrize("upgradable", [0.05, 0.4])
+def test_pending_matches_fixture(tmp_path, upgradable):
+    # the fixture holds phased updates and a kept-back kernel meta-package
+    expected = bench.make_apt_fixture(str(tmp_path), 600, upgradable, seed=7)
+    assert debpkg.pending_upgrades(str(tmp_path)) == expected
+    fp, index = debpkg.candidate_index(debpkg.package_lists(str(tmp_path)))
+    assert debpkg.count_pending(str(tmp_path / debpkg.STATUS_FILE), index) == expected
+    if shutil.which("apt-get"):
+        assert bench.apt_get_pending(str(tmp_path)) == expected
+
+
+def test_pinning_declines(tmp_path):
+    bench.make_apt_fixture(str(tmp_path), 20, 0.5)
+    (tmp_path / "etc/apt/preferences").write_text("Package: *\nPin: release a=stable-backports\nPin-Priority: 500\n")
+    assert debpkg.pending_upgrades(str(tmp_path)) is None
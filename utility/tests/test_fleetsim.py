@@ -0,0 +1,33 @@
+import asyncio
+
+import pytest
+
+import standin
+from fleetsim import DEFAULT_TOKEN, Fleet
+
+MAX_PEAK_TO_MEAN = 2.0  # the fleetsim.py --max-peak-to-mean gate
+
+
+@pytest.fixture(scope="module")
+def url():
+    srv = standin.start(token=DEFAULT_TOKEN, keep=False)
+    yield srv.url.rsplit("/", 1)[0]  # .../api
+    srv.shutdown()
+    srv.server_close()
+
+
+def restart(url, **kwargs):
+    """300 agents restarting together: 20 simulated minutes, 300x compressed."""
+    return asyncio.run(Fleet(url, agents=300, duration=1200, compress=300, interval_minutes=15, **kwargs).run())
+
+
+def test_restart_wave_is_flat(url):
+    result = restart(url)
+    assert result["dropped"] == 0 and result["rejected"] == 0
+    assert result["sent"] >= 300  # every start-up report arrived
+    assert result["restartPeakToMean"] <= MAX_PEAK_TO_MEAN, result["ingest"]
+
+
+def test_without_splay_the_wave_shows(url):
+    # the check above must be able to fail: no splay puts every start-up report in one bucket
+    assert restart(url, splay=0.0)["restartPeakToMean"] > MAX_PEAK_TO_MEAN
@@ -0,0 +1,83 @@
+import native
+from conftest import fixture_root
+
+
+def roots(case):
+    return {"proc": fixture_root(case, "proc"), "sys": fixture_root(case, "sys")}
+
+
+# ---------------- Disk Encryption ----------------
+
+def test_available_needs_mountinfo_and_block():
+    assert native.available(**roots("luks-lvm"))
+    assert not native.available(**roots("cgroup-v2"))
+
+
+def test_luks_on_lvm():
+    r = roots("luks-lvm")
+    assert native.root_mount_source(r["proc"]) == "/dev/mapper/vg-root"
+    assert native.disk_encryption(**r) is True
+    # vg-root (dm-1) sits on the LUKS mapping dm-0
+    assert native._stack_has_crypt("dm-1", r["sys"])
+
+
+def test_luks_root_named_by_kernel_device(tmp_path):
+    mountinfo = tmp_path / "self" / "mountinfo"
+    mountinfo.parent.mkdir()
+    mountinfo.write_text("22 1 253:1 / / rw,relatime shared:1 - ext4 /dev/dm-1 rw\n")
+    assert native.disk_encryption(proc=str(tmp_path), sys=fixture_root("luks-lvm", "sys")) is True
+
+
+def test_plain_lvm():
+    r = roots("lvm")
+    assert not native._stack_has_crypt("dm-0", r["sys"])
+    # Parity with `findmnt -n -o SOURCE /`: a root on /dev/mapper/* counts as
+    # encrypted on the command path too, crypt layer or not.
+    assert native.disk_encryption(**r) is True
+
+
+def test_btrfs_subvolume():
+    r = roots("btrfs")
+    # the subvolume mount stacked on rootfs is the one that counts
+    assert native.root_mount_source(r["proc"]) == "/dev/nvme0n1p2"
+    assert native.disk_encryption(**r) is None
+
+
+def test_escaped_mountpoint(tmp_path):
+    mountinfo = tmp_path / "self" / "mountinfo"
+    mountinfo.parent.mkdir()
+    mountinfo.write_text(
+        "22 1 8:2 / / rw - ext4 /dev/sda2 rw\n"
+        "30 22 8:3 / /mnt/my\\040disk rw - ext4 /dev/sda3 rw\n"
+    )
+    assert native.root_mount_source(str(tmp_path)) == "/dev/sda2"
+
+
+# ---------------- Services / Processes ----------------
+
+def test_unit_active_cgroup_v2():
+    sys = fixture_root("cgroup-v2", "sys")
+    assert native.unit_active("clamav-daemon", sys) is True
+    assert native.unit_active("clamav-freshclam", sys) is False  # unit loaded, cgroup empty
+    assert native.unit_active("sophos-spl", sys) is False
+
+
+def test_unit_active_cgroup_v1():
+    sys = fixture_root("cgroup-v1", "sys")
+    assert native.unit_active("clamav-daemon", sys) is True
+    # only the named systemd hierarchy says whether a unit runs, not cpu,cpuacct
+    assert native.unit_active("clamav-freshclam", sys) is False
+
+
+def test_process_table():
+    table = sorted(native.process_table(fixture_root("procs", "proc")))
+    assert table == [
+        (1, "systemd", "/sbin/init splash"),
+        (2, "kthreadd", ""),
+        (812, "clamd", "/usr/sbin/clamd --foreground=true"),
+        (1044, "python3", "/usr/bin/python3 /opt/tools/avscan.py --report"),
+    ]
+
+
+def test_process_table_missing_root(tmp_path):
+    assert native.process_table(str(tmp_path / "nope")) == []
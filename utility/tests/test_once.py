@@ -0,0 +1,78 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import pytest
+
+import main
+import standin
+import utils
+from conftest import UTILITY
+
+
+@pytest.fixture
+def state(tmp_path, monkeypatch):
+    path = tmp_path / "last_state.json"
+    monkeypatch.setattr(utils, "LAST_STATE_FILE", path)
+    monkeypatch.setattr(main, "open_history", lambda: None)
+    monkeypatch.setattr(main, "collect_snapshot", lambda: {
+        "machineId": "m1", "os": "Linux", "osVersion": "Debian GNU/Linux 12 (bookworm)",
+        "updatesPending": 0, "timestamp": "2026-10-18T09:00:00Z", "timedOut": [],
+    })
+    return path
+
+
+def reply(status, body):
+    return lambda url, data, headers: (status, json.dumps(body), {})
+
+
+def test_sent(state, monkeypatch):
+    monkeypatch.setattr(main, "http_post", reply(200, {"ok": True, "accepted": 1, "rejected": []}))
+    assert main.once() == main.EXIT_OK
+    assert json.loads(state.read_text())["machineId"] == "m1"
+
+
+def test_rejected_item_keeps_last_state(state, monkeypatch, capsys):
+    monkeypatch.setattr(main, "http_post", reply(200, {"ok": True, "accepted": 0, "rejected": [0]}))
+    assert main.once() == main.EXIT_REJECTED
+    assert not state.exists()
+    assert "rejected" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("status,code", [(401, main.EXIT_REJECTED), (503, main.EXIT_SEND_FAILED),
+                                         (0, main.EXIT_SEND_FAILED)])
+def test_failed(state, monkeypatch, status, code):
+    monkeypatch.setattr(main, "http_post", reply(status, {"error": "x"}))
+    assert main.once() == code
+    assert not state.exists()
+
+
+# ---------------- cold start to exit ----------------
+
+BUDGET_SECONDS = 1.0  # bench.py once --budget
+
+
+def test_cold_start_to_exit(tmp_path):
+    srv = standin.start()
+    env = dict(os.environ, SYSHEALTH_STATE_DIR=str(tmp_path), SYSHEALTH_API_URL=srv.url,
+               SYSHEALTH_METRICS_FILE="")
+
+    def run(*argv) -> float:
+        t0 = time.perf_counter()
+        p = subprocess.run([sys.executable, "main.py", "--once", *argv], cwd=UTILITY, env=env,
+                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        assert p.returncode in (main.EXIT_OK, main.EXIT_PARTIAL), p.stdout
+        return time.perf_counter() - t0
+
+    try:
+        run("--force")  # the checks run once and fill the check cache
+        sends = statistics.median(run("--force") for _ in range(3))
+        unchanged = statistics.median(run() for _ in range(3))
+    finally:
+        srv.shutdown()
+        srv.server_close()
+    assert srv.stats["reports"] == 4
+    assert sends <= BUDGET_SECONDS and unchanged <= BUDGET_SECONDS, (sends, unchanged)
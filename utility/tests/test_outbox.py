@@ -0,0 +1,83 @@
+import json
+
+import outbox
+from outbox import Outbox
+
+
+def make(tmp_path):
+    return Outbox(tmp_path / "outbox.log", tmp_path / "outbox.ack")
+
+
+def report(i):
+    return {"machineId": "m1", "timestamp": f"t{i}", "n": i}
+
+
+def test_append_and_reload(tmp_path):
+    box = make(tmp_path)
+    assert box.append(report(1)) == 1
+    assert box.append_many([report(2), report(3)]) == 3
+    assert len(box) == 3
+    again = make(tmp_path)
+    assert [s for s, _ in again.pending(10)] == [1, 2, 3]
+    assert again.append(report(4)) == 4
+
+
+def test_ack_survives_restart(tmp_path):
+    box = make(tmp_path)
+    box.append_many([report(i) for i in range(1, 6)])
+    box.ack(2)
+    again = make(tmp_path)
+    assert again.acked == 2
+    assert [r["n"] for _, r in again.pending(10)] == [3, 4, 5]
+    assert [s for s, _ in again.pending(2)] == [3, 4]
+
+
+def test_fully_acked_log_is_compacted(tmp_path):
+    box = make(tmp_path)
+    box.append_many([report(i) for i in range(1, 4)])
+    box.ack(3)
+    assert (tmp_path / "outbox.log").read_text() == ""
+    assert len(box) == 0
+    # sequence numbers keep counting from the ack after compaction
+    again = make(tmp_path)
+    assert again.append(report(4)) == 4
+
+
+def test_compaction_keeps_unacked(tmp_path, monkeypatch):
+    monkeypatch.setattr(outbox, "COMPACT_AFTER", 3)
+    box = make(tmp_path)
+    box.append_many([report(i) for i in range(1, 6)])
+    box.ack(2)
+    assert len((tmp_path / "outbox.log").read_text().splitlines()) == 5
+    box.ack(3)
+    lines = (tmp_path / "outbox.log").read_text().splitlines()
+    assert [json.loads(l)["seq"] for l in lines] == [4, 5]
+    assert [s for s, _ in make(tmp_path).pending(10)] == [4, 5]
+
+
+def test_ack_never_goes_backwards(tmp_path):
+    box = make(tmp_path)
+    box.append_many([report(i) for i in range(1, 4)])
+    box.ack(2)
+    box.ack(1)
+    assert box.acked == 2
+    assert (tmp_path / "outbox.ack").read_text() == "2"
+
+
+def test_torn_tail_is_skipped(tmp_path):
+    box = make(tmp_path)
+    box.append_many([report(1), report(2)])
+    with open(tmp_path / "outbox.log", "a") as f:
+        f.write('{"seq": 3, "report": {"machi')  # crash mid-append
+    again = make(tmp_path)
+    assert [s for s, _ in again.pending(10)] == [1, 2]
+    assert again.last_seq == 2
+
+
+def test_append_after_torn_tail(tmp_path):
+    box = make(tmp_path)
+    box.append(report(1))
+    with open(tmp_path / "outbox.log", "a") as f:
+        f.write('{"seq": 2, "report": {"machi')
+    make(tmp_path).append(report(2))
+    assert [r["n"] for _, r in make(tmp_path).pending(10)] == [1, 2]
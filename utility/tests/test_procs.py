@@ -0,0 +1,20 @@
+import native
+from conftest import fixture_root
+from procs import AV_PROCESSES, ProcessIndex
+
+
+def test_av_names_from_fixture_table():
+    index = ProcessIndex(native.process_table(fixture_root("procs", "proc")), AV_PROCESSES["Linux"])
+    assert index.running(AV_PROCESSES["Linux"]) == ["clamd"]
+    assert index.pids("clamd") == {812}
+
+
+def test_short_names_match_whole_words_only():
+    table = [
+        (10, "vim", "vim /home/kavya/notes.txt"),
+        (11, "less", "less /var/log/clamd.log"),
+        (12, "kav", "/opt/kaspersky/kav -d"),
+    ]
+    index = ProcessIndex(table, ["kav", "clamd"])
+    assert index.pids("kav") == {12}
+    assert index.pids("clamd") == set()
@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+import pytest
+
+import relay
+import standin
+from outbox import encode_deltas
+from utils import FieldHasher, META_KEYS
+
+AUTH = {"authorization": "Bearer agent"}
+
+
+def report(**fields):
+    return dict({"machineId": "m1", "hostname": "h1", "os": "Linux", "updatesPending": 2,
+                 "timestamp": "2026-10-18T09:00:00Z"}, **fields)
+
+
+@pytest.fixture
+def upstream():
+    srv = standin.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def run(upstream, tmp_path, scenario):
+    async def main():
+        r = relay.Relay(upstream.url + "/batch", tmp_path, {"agent"}, window=0.01)
+        tasks = [asyncio.create_task(r.commit_loop()), asyncio.create_task(r.forward_loop())]
+        try:
+            return await scenario(r)
+        finally:
+            for t in tasks:
+                t.cancel()
+    return asyncio.run(main())
+
+
+async def post(r, path, body):
+    status, reply = await r.route("POST", path, AUTH, json.dumps(body).encode())
+    return status, reply
+
+
+async def forwarded(r, n):
+    for _ in range(200):
+        if r.stats["forwarded"] >= n:
+            return
+        await asyncio.sleep(0.01)
+
+
+def test_invalid_items_are_rejected_not_acknowledged(upstream, tmp_path):
+    async def scenario(r):
+        status, reply = await post(r, "/api/reports/batch", {"reports": [
+            report(version="v1"), report(machineId="m2", osVersion=None, version="v1"),
+            report(machineId="m3", checkTimings={"os": "slow"}, version="v1")]})
+        assert (status, reply["accepted"], reply["rejected"]) == (200, 1, [1, 2])
+        assert (await post(r, "/api/report", report(osVersion=None)))[0] == 400
+        await forwarded(r, 1)
+    run(upstream, tmp_path, scenario)
+    assert [x["machineId"] for x in upstream.reports] == ["m1"]
+
+
+def test_single_report_then_delta_agrees_on_versions(upstream, tmp_path):
+    first, second = report(), report(updatesPending=0)
+
+    async def scenario(r):
+        assert (await post(r, "/api/report", first))[0] == 200
+        # the agent's next item is a delta against its own version of `first`
+        delta = encode_deltas(FieldHasher(META_KEYS), first, [second])[0]
+        status, reply = await post(r, "/api/reports/batch", {"reports": [delta]})
+        assert status == 200 and reply["accepted"] == 1
+    run(upstream, tmp_path, scenario)
+
+
+def test_queue_write_failure_answers_503_and_keeps_running(upstream, tmp_path):
+    async def scenario(r):
+        append_many, calls = r.queue.append_many, []
+
+        def flaky(batch):
+            calls.append(len(batch))
+            if len(calls) == 1:
+                raise OSError(28, "No space left on device")
+            return append_many(batch)
+        r.queue.append_many = flaky
+        status, _ = await post(r, "/api/report", report())
+        assert status == 503
+        # the agent retries; the kept report is committed with the next window
+        status, _ = await post(r, "/api/report", report())
+        assert status == 200
+        await forwarded(r, 1)
+        return calls
+    assert run(upstream, tmp_path, scenario) == [1, 1]
+    assert len(upstream.reports) == 1
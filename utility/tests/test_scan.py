@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+import bench
+import schema
+import scan
+import standin
+
+FIELDS = {"machineId", "hostname", "os", "osVersion", "diskEncrypted", "osUpdated", "updatesPending",
+          "antivirusInstalled", "antivirusRunning", "antivirusName", "sleepPolicyOk",
+          "sleepTimeoutMinutes", "timestamp", "checkTimings", "timedOut"}
+
+
+@pytest.fixture
+def roots(tmp_path):
+    """Three small Debian-like roots, the first two with the same apt lists."""
+    out = []
+    for name, list_set in (("web", 1), ("db", 1), ("ci", 2)):
+        root = str(tmp_path / name)
+        os.makedirs(os.path.join(root, "etc"))
+        out.append((root, bench.make_rootfs(root, list_set, packages=200, upgradable=0.2)))
+    return out
+
+
+def test_payload_shape(roots):
+    root, expected = roots[0]
+    result = scan.scan_root(root)
+    p = result["payload"]
+    assert set(p) == FIELDS
+    assert schema.snapshot(p)[1] is None
+    assert p["hostname"] == "web"
+    assert p["osVersion"] == "Debian GNU/Linux 12 (bookworm) fixture 1"  # through the relative symlink
+    assert (p["updatesPending"], p["osUpdated"]) == (expected, expected == 0)
+    assert p["diskEncrypted"] is None and p["antivirusRunning"] is None
+    assert set(p["checkTimings"]) == {"os", "updates"}
+
+
+def test_pending_counts_and_shared_lists(roots):
+    results = scan.scan([r for r, _ in roots], workers=1)
+    assert [r["payload"]["updatesPending"] for r in results] == [e for _, e in roots]
+    fps = [r["listsFingerprint"] for r in results]
+    assert fps[0] == fps[1] != fps[2]
+    key = lambda rs: [(r["root"], r["listsFingerprint"], r["payload"]["updatesPending"]) for r in rs]
+    assert key(scan.scan([r for r, _ in roots], workers=2)) == key(results)  # process pool, input order
+
+
+def test_unknown_os_version_is_omitted(tmp_path):
+    root = tmp_path / "bare"
+    root.mkdir()
+    p = scan.scan_root(str(root))["payload"]
+    assert "osVersion" not in p
+    assert (p["updatesPending"], p["osUpdated"]) == (None, None)
+    assert p["hostname"] == "bare"
+    assert schema.snapshot(p)[1] is None
+
+
+def test_pinned_root_is_unknown(roots):
+    root, _ = roots[2]
+    with open(os.path.join(root, "etc/apt/preferences"), "w") as f:
+        f.write("Package: *\nPin: release a=stable-backports\nPin-Priority: 990\n")
+    result = scan.scan_root(root)
+    assert result["payload"]["updatesPending"] is None and result["listsFingerprint"] is None
+
+
+def test_image_id(tmp_path):
+    a, b = tmp_path / "a", tmp_path / "b"
+    for root in (a, b):
+        (root / "etc").mkdir(parents=True)
+        (root / "etc/machine-id").write_text("0123456789abcdef0123456789abcdef\n")
+    assert scan.image_id(str(a)) == scan.image_id(str(b))
+    (b / "etc/machine-id").write_text("")  # golden images leave it empty: fall back to the path
+    assert scan.image_id(str(a)) != scan.image_id(str(b))
+
+
+def test_send_reports_rejected_payloads(roots, monkeypatch):
+    srv = standin.start()
+    monkeypatch.setattr(scan, "BATCH_URL", srv.url + "/batch")
+    try:
+        payloads = [r["payload"] for r in scan.scan([r for r, _ in roots], workers=1)]
+        payloads[1] = dict(payloads[1], osVersion=None)
+        assert scan.send(payloads) == (True, [1])
+        assert len(srv.reports) == 2
+    finally:
+        srv.shutdown()
+        srv.server_close()
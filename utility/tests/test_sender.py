@@ -0,0 +1,178 @@
+import time
+
+import pytest
+
+import metrics
+import standin
+from outbox import Outbox, Sender
+from utils import FieldHasher, META_KEYS
+
+
+@pytest.fixture(scope="module")
+def running():
+    srv = standin.start()  # default token, as config.API_KEY
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def server(running):
+    running.reports.clear()
+    running.states.clear()
+    running.scripted.clear()
+    running.fail_rate, running.retry_after, running.max_batch = 0.0, None, 0
+    return running
+
+
+@pytest.fixture
+def box(tmp_path):
+    return Outbox(tmp_path / "outbox.log", tmp_path / "outbox.ack")
+
+
+def report(i, **fields):
+    return dict({"machineId": "m1", "hostname": "h1", "updatesPending": i,
+                 "timestamp": f"2026-10-18T09:{i:02d}:00Z"}, **fields)
+
+
+def test_rejected_items_are_logged_and_counted(server, box, capsys):
+    box.append_many([report(1), report(2, osVersion=None)])
+    before = metrics.total("reports_rejected_total")
+    sender = Sender(box, url=server.url + "/batch")
+    sender.drain()
+    assert [r["updatesPending"] for r in server.reports] == [1]
+    assert sender.rejected == [report(2, osVersion=None)]
+    assert metrics.total("reports_rejected_total") - before == 1
+    out = capsys.readouterr().out
+    assert "report 1 of the batch rejected" in out and "sent 1 report(s)" in out
+    assert len(box) == 0
+    # the server never stored the rejected state: the next item is a full snapshot
+    assert "delta" not in sender.encode([report(3)])[0]
+    box.append(report(3))
+    sender.drain()
+    assert server.reports[-1]["updatesPending"] == 3
+    assert "differs" not in capsys.readouterr().out
+
+
+def drain_all(sender, rounds=10):
+    """Drain, skipping backoff waits, until the outbox is empty."""
+    for _ in range(rounds):
+        sender.retry_at = 0.0
+        sender.drain()
+        if not len(sender.outbox):
+            return
+
+
+# ---------------- encoding ----------------
+
+def test_full_snapshot_then_deltas(server, box):
+    sender = Sender(box, url=server.url + "/batch")
+    first, second = sender.encode([report(1), report(2)])
+    assert "delta" not in first and first["updatesPending"] == 1
+    assert second["baseVersion"] == first["version"]
+    assert second["delta"] == {"updatesPending": 2}
+    assert second["timestamp"] == report(2)["timestamp"]  # metadata travels next to the delta
+
+    box.append_many([report(1), report(2)])
+    sender.drain()
+    # the server holds what the agent last had acknowledged: the next item is a delta against it
+    assert server.states["m1"][0] == FieldHasher(META_KEYS).version(report(2))
+    (item,) = sender.encode([report(3)])
+    assert item["baseVersion"] == server.states["m1"][0]
+    box.append(report(3))
+    sender.drain()
+    assert [r["updatesPending"] for r in server.reports] == [1, 2, 3]
+
+
+# ---------------- 409 ----------------
+
+def test_409_resumes_from_index(server, box):
+    # item 1 is rejected, so item 2 (a delta against it) cannot apply: 409 at index 2
+    box.append_many([report(1), report(2, osVersion=None), report(3)])
+    sender = Sender(box, url=server.url + "/batch")
+    requests_before = server.stats["requests"]
+    sender.drain()
+    assert [r["updatesPending"] for r in server.reports] == [1, 3]  # item 0 is not resent
+    assert server.stats["requests"] - requests_before == 2
+    assert sender.failures == 0 and len(box) == 0
+
+
+def test_409_after_server_lost_state(server, box):
+    sender = Sender(box, url=server.url + "/batch")
+    box.append(report(1))
+    sender.drain()
+    server.states.clear()  # e.g. the backend's machine document was deleted
+    box.append(report(2))
+    sender.drain()  # delta -> 409 at 0 -> full snapshot, in one drain
+    assert server.reports[-1]["updatesPending"] == 2
+    assert sender.failures == 0 and len(box) == 0
+
+
+def test_409_on_a_full_snapshot_backs_off(server, box):
+    server.scripted.append((409, {"error": "version mismatch", "accepted": 0, "rejected": [], "index": 0}, {}))
+    box.append(report(1))
+    sender = Sender(box, url=server.url + "/batch")
+    sender.drain()
+    assert sender.failures == 1 and sender.retry_at > 0 and len(box) == 1
+    drain_all(sender)
+    assert len(box) == 0 and server.reports[-1]["updatesPending"] == 1
+
+
+# ---------------- 400, 413, 5xx ----------------
+
+def test_400_drops_the_batch(server, box, capsys):
+    server.scripted.append((400, {"error": "invalid payload"}, {}))
+    box.append_many([report(1), report(2)])
+    sender = Sender(box, url=server.url + "/batch", log=False)
+    before = metrics.total("reports_rejected_total")
+    sender.drain()
+    assert len(box) == 0 and server.reports == []
+    assert metrics.total("reports_rejected_total") - before == 2
+    assert sender.full_next
+    assert capsys.readouterr().out == ""  # log=False
+
+
+def test_413_halves_the_batch(server, box):
+    server.max_batch = 2
+    box.append_many([report(i) for i in range(1, 8)])
+    sender = Sender(box, url=server.url + "/batch", batch_size=8)
+    drain_all(sender)
+    assert sender.batch_size == 2
+    assert [r["updatesPending"] for r in server.reports] == list(range(1, 8))
+
+
+def test_retry_after_is_honoured(server, box):
+    server.fail_rate, server.retry_after = 1.0, "120"
+    box.append(report(1))
+    sender = Sender(box, url=server.url + "/batch")
+    sender.drain()
+    assert 119 <= sender.seconds_until_retry() <= 120
+    assert sender.failures == 1 and len(box) == 1
+    sender.drain()  # still waiting: nothing is sent
+    assert sender.failures == 1
+
+
+def test_backoff_grows_and_resets(server, box):
+    server.fail_rate = 1.0
+    box.append(report(1))
+    sender = Sender(box, url=server.url + "/batch")
+    for failures in range(1, 4):
+        sender.retry_at = 0.0
+        t0 = time.monotonic()
+        sender.drain()
+        assert sender.failures == failures
+        assert sender.retry_at - t0 <= 5 * 2 ** (failures - 1) + 1  # full jitter under the cap
+    server.fail_rate = 0.0
+    drain_all(sender)
+    assert sender.failures == 0 and len(box) == 0
+
+
+@pytest.mark.parametrize("status", [401, 403, 404, 408])
+def test_client_errors_other_than_400_are_retried(server, box, status):
+    server.scripted.append((status, {"error": "x"}, {}))
+    box.append(report(1))
+    sender = Sender(box, url=server.url + "/batch")
+    sender.drain()
+    assert len(box) == 1 and sender.failures == 1
+    drain_all(sender)
+    assert len(box) == 0
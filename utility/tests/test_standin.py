@@ -0,0 +1,88 @@
+import gzip
+import json
+
+import pytest
+import requests
+
+import standin
+from main import build_payload
+from outbox import encode_deltas
+from utils import FieldHasher, META_KEYS
+
+TOKEN = "test-token"
+
+
+@pytest.fixture(scope="module")
+def running():
+    srv = standin.start(token=TOKEN)
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def server(running):
+    running.reports.clear()
+    running.states.clear()
+    return running
+
+
+def post(srv, path, body):
+    return requests.post(srv.url.rsplit("/", 1)[0] + path, data=gzip.compress(json.dumps(body).encode()),
+                         headers={"Authorization": f"Bearer {TOKEN}", "Content-Encoding": "gzip",
+                                  "Content-Type": "application/json"}, timeout=5)
+
+
+def agent_report(**changes):
+    results = {
+        "os": {"os": "Linux", "osVersion": "Debian GNU/Linux 12 (bookworm)"},
+        "diskEncryption": None,
+        "updates": {"pending": 3, "upToDate": False},
+        "antivirus": {"installed": True, "running": True, "name": "clamav-daemon"},
+        "sleepPolicy": {"timeoutMinutes": None, "ok": None},
+    }
+    report = build_payload(results, {"os": 0.0012, "updates": 0.034}, [])
+    report.update(changes)
+    return report
+
+
+def test_agent_payload_keeps_collection_metadata(server):
+    hasher = FieldHasher(META_KEYS)
+    first, second = agent_report(), agent_report(updatesPending=0, osUpdated=True, timedOut=["sleepPolicy"])
+    r = post(server, "/reports/batch", {"reports": encode_deltas(hasher, None, [first, second])})
+    assert r.status_code == 200
+    assert r.json()["rejected"] == []
+    full, merged = server.reports
+    assert full["checkTimings"] == first["checkTimings"]
+    assert set(full["agentMetrics"]) == set(first["agentMetrics"])
+    assert merged["updatesPending"] == 0 and merged["antivirusName"] == "clamav-daemon"
+    assert merged["timedOut"] == ["sleepPolicy"]
+
+
+@pytest.mark.parametrize("changes", [
+    {"osVersion": None},                      # optional, but not nullable
+    {"checkTimings": {"os": "fast"}},
+    {"agentMetrics": {"rssBytes": True}},
+    {"timedOut": "updates"},
+    {"updatesPending": 2.5},
+    {"timestamp": "2026-10-18 09:00:00"},
+    {"machineId": ""},
+])
+def test_invalid_items_are_rejected(server, changes):
+    items = [dict(agent_report(), version="v1"), dict(agent_report(**changes), version="v2")]
+    r = post(server, "/reports/batch", {"reports": items})
+    assert r.status_code == 200
+    assert r.json()["accepted"] == 1 and r.json()["rejected"] == [1]
+    assert post(server, "/report", agent_report(**changes)).status_code == 400
+
+
+def test_invalid_delta_is_rejected_before_its_base_is_checked(server):
+    item = {"machineId": "m1", "baseVersion": "nope", "version": "v2", "delta": {"updatesPending": "3"}}
+    r = post(server, "/reports/batch", {"reports": [item]})
+    assert r.status_code == 200 and r.json()["rejected"] == [0]
+
+
+def test_unknown_fields_are_dropped(server):
+    r = post(server, "/report", dict(agent_report(), extra={"a": 1}))
+    assert r.status_code == 200
+    assert "extra" not in server.reports[0]
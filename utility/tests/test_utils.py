@@ -0,0 +1,47 @@
+import subprocess
+
+import pytest
+
+import utils
+
+
+@pytest.fixture
+def probes(monkeypatch):
+    monkeypatch.setattr(utils, "_commands", {})
+    calls = []
+
+    def run(replies):
+        def fake(cmd, shell=False, timeout=None):
+            calls.append(cmd)
+            return replies.pop(0)
+        monkeypatch.setattr(utils, "run_command", fake)
+        return calls
+    return run
+
+
+def test_has_command_caches_answers(probes):
+    calls = probes([(0, ""), (1, "")])
+    assert utils.has_command("apt-get") is True
+    assert utils.has_command("dnf") is False
+    assert utils.has_command("apt-get") is True and utils.has_command("dnf") is False
+    assert len(calls) == 2
+
+
+def test_has_command_retries_failed_probes(probes):
+    calls = probes([(1, "ERROR:Command 'command -v apt-get' timed out after 2 seconds"), (0, "")])
+    assert utils.has_command("apt-get") is False
+    assert utils.has_command("apt-get") is True
+    assert len(calls) == 2
+
+
+@pytest.mark.skipif(utils._shells is None, reason="needs bash")
+def test_slow_profile_does_not_count_against_the_first_command(tmp_path, monkeypatch):
+    (tmp_path / ".bash_profile").write_text("sleep 1.5\n")
+    monkeypatch.setenv("HOME", str(tmp_path))
+    worker = utils.ShellWorker()
+    try:
+        assert worker.run("echo ok", timeout=1) == (0, "ok")
+        with pytest.raises(subprocess.TimeoutExpired):
+            worker.run("sleep 5", timeout=0.2)
+    finally:
+        worker.kill()
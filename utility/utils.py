@@ -1,27 +1,154 @@
 import hashlib
 import json
+import os
 import platform
+import select
 import shlex
+import shutil
+import signal
 import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, Any, Optional, Tuple
-
-import requests
+from typing import Dict, Any, Optional, Tuple, Callable
 
+import metrics
 from config import (
-    API_URL, API_KEY, STATE_DIR, MACHINE_ID_FILE, LAST_STATE_FILE,
-    REQUEST_TIMEOUT_SECONDS, COMMAND_TIMEOUT_SECONDS
+    MACHINE_ID_FILE, LAST_STATE_FILE,
+    REQUEST_TIMEOUT_SECONDS, COMMAND_TIMEOUT_SECONDS, SHELL_WORKERS, ensure_state_dir
 )
 
+# Keys that describe the collection itself rather than machine state;
+# they never count as a change.
+META_KEYS = {"timestamp", "checkTimings", "timedOut", "agentMetrics"}
+
+
 def now_iso() -> str:
     """Return current UTC time in strict ISO8601 format"""
     return datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
 
 
+class ShellWorker:
+    """
+    A long-lived `bash --login` co-process that runs shell commands one at a
+    time. Each command is sent NUL-terminated on stdin and runs in a subshell
+    with stdin from /dev/null and stderr merged into stdout; its output ends
+    with a sentinel line carrying the exit code. The profile is sourced once,
+    when the worker starts, instead of once per command; the constructor
+    waits for it (up to START_TIMEOUT_SECONDS) so a slow profile does not eat
+    into the first command's timeout.
+    """
+
+    START_TIMEOUT_SECONDS = 30
+
+    _LOOP = (
+        "while IFS= read -r -d '' __cmd; do "
+        "( eval \"$__cmd\" ) </dev/null 2>&1; "
+        "printf '\\n%s %d\\n' \"$__SENTINEL\" \"$?\"; "
+        "done\n"
+    )
+
+    def __init__(self):
+        self.sentinel = f"__syshealth_{uuid.uuid4().hex}__"
+        env = dict(os.environ, __SENTINEL=self.sentinel)
+        metrics.inc("subprocesses_total", kind="worker")
+        self.proc = subprocess.Popen(
+            ["bash", "--login"], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, env=env, start_new_session=True,
+        )
+        self.proc.stdin.write(self._LOOP.encode())
+        self.proc.stdin.flush()
+        self._buf = b""
+        self.run(":", self.START_TIMEOUT_SECONDS)  # round-trip once the profile has loaded
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def run(self, cmd: str, timeout: float) -> Tuple[int, str]:
+        self.proc.stdin.write(cmd.encode("utf-8") + b"\0")
+        self.proc.stdin.flush()
+        marker = b"\n" + self.sentinel.encode() + b" "
+        deadline = time.monotonic() + timeout
+        fd = self.proc.stdout.fileno()
+        while True:
+            i = self._buf.find(marker)
+            if i >= 0:
+                j = self._buf.find(b"\n", i + len(marker))
+                if j >= 0:
+                    out, code = self._buf[:i], int(self._buf[i + len(marker):j])
+                    self._buf = self._buf[j + 1:]
+                    return code, out.decode("utf-8", "replace").strip()
+            left = deadline - time.monotonic()
+            if left <= 0:
+                self.kill()
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            ready, _, _ = select.select([fd], [], [], left)
+            if ready:
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    self.kill()
+                    raise RuntimeError("shell worker exited")
+                self._buf += chunk
+
+    def kill(self) -> None:
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        self.proc.wait()
+
+
+class ShellPool:
+    """Hands out idle shell workers; a hung or dead worker is dropped and replaced on demand."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._idle: list = []
+        self._count = 0
+        self._cond = threading.Condition()
+
+    def run(self, cmd: str, timeout: float) -> Tuple[int, str]:
+        with self._cond:
+            while not self._idle and self._count >= self.size:
+                self._cond.wait()
+            worker = self._idle.pop() if self._idle else None
+            if worker is None:
+                self._count += 1
+        try:
+            if worker is None or not worker.alive:
+                worker = ShellWorker()
+            result = worker.run(cmd, timeout)
+        except BaseException:
+            with self._cond:
+                self._count -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._idle.append(worker)
+            self._cond.notify()
+        return result
+
+
+_shells: Optional[ShellPool] = (
+    ShellPool(SHELL_WORKERS) if os.name == "posix" and shutil.which("bash") else None
+)
+
+
 def run_command(cmd, shell: bool = False, timeout: int = COMMAND_TIMEOUT_SECONDS) -> Tuple[int, str]:
-    """Run a command robustly and return (exit_code, stdout)."""
+    """
+    Run a command robustly and return (exit_code, stdout).
+    On POSIX, shell commands go through a pool of persistent bash workers.
+    """
+    kind = "shell" if shell else "exec"
+    metrics.inc("subprocesses_total", kind=kind)
+    t0 = time.monotonic()
     try:
+        if shell and _shells is not None:
+            return _shells.run(cmd, timeout)
         if shell:
             p = subprocess.run(
                 cmd, shell=True, text=True,
@@ -35,8 +162,31 @@ def run_command(cmd, shell: bool = False, timeout: int = COMMAND_TIMEOUT_SECONDS
                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout
             )
         return p.returncode, (p.stdout or "").strip()
+    except subprocess.TimeoutExpired as e:
+        metrics.inc("command_timeouts_total", kind=kind)
+        return 1, f"ERROR:{e}"
     except Exception as e:
+        metrics.inc("command_errors_total", kind=kind)
         return 1, f"ERROR:{e}"
+    finally:
+        metrics.observe("command_seconds", time.monotonic() - t0, kind=kind)
+
+
+_commands: Dict[str, bool] = {}
+
+
+def has_command(name: str) -> bool:
+    """
+    `command -v name`, memoized: installed tools don't change while we run.
+    A probe that timed out or failed to run is not an answer and is retried.
+    """
+    if name in _commands:
+        return _commands[name]
+    code, out = run_command(f"command -v {shlex.quote(name)} >/dev/null 2>&1", shell=True)
+    if code != 0 and out.startswith("ERROR:"):
+        return False
+    _commands[name] = code == 0
+    return code == 0
 
 
 def stable_machine_id() -> str:
@@ -56,6 +206,7 @@ def stable_machine_id() -> str:
 
     raw = f"{host}-{mac}".encode("utf-8")
     mid = hashlib.sha256(raw).hexdigest()[:16]
+    ensure_state_dir()
     Path(MACHINE_ID_FILE).write_text(mid)
     return mid
 
@@ -75,6 +226,41 @@ def hash_payload(data: Dict[str, Any], exclude_keys: Optional[set] = None) -> st
     return hashlib.sha256(blob).hexdigest()
 
 
+class FieldHasher:
+    """
+    Per-field digests of successive payloads. A field's value is serialized and
+    hashed only when it differs from the value this hasher saw last time, so
+    change detection costs one comparison per unchanged field.
+    """
+
+    def __init__(self, exclude_keys: Optional[set] = None):
+        self.exclude_keys = exclude_keys or set()
+        self._seen: Dict[str, Tuple[Any, str]] = {}
+
+    def digests(self, data: Dict[str, Any]) -> Dict[str, str]:
+        out = {}
+        for k, v in data.items():
+            if k in self.exclude_keys:
+                continue
+            seen = self._seen.get(k)
+            # bool is an int subclass: True == 1, so compare types too
+            if seen is None or type(seen[0]) is not type(v) or seen[0] != v:
+                blob = json.dumps(v, sort_keys=True, separators=(",", ":")).encode("utf-8")
+                seen = (v, hashlib.sha256(blob).hexdigest()[:16])
+                self._seen[k] = seen
+            out[k] = seen[1]
+        return out
+
+    def version(self, data: Dict[str, Any]) -> str:
+        return state_version(self.digests(data))
+
+
+def state_version(digests: Dict[str, str]) -> str:
+    """Version of a whole state from its field digests."""
+    blob = "\n".join(f"{k}={d}" for k, d in sorted(digests.items())).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()[:32]
+
+
 def load_last_state() -> Optional[Dict[str, Any]]:
     try:
         if Path(LAST_STATE_FILE).exists():
@@ -85,19 +271,70 @@ def load_last_state() -> Optional[Dict[str, Any]]:
 
 
 def save_last_state(payload: Dict[str, Any]) -> None:
+    ensure_state_dir()
     Path(LAST_STATE_FILE).write_text(json.dumps(payload, indent=2))
 
 
-def send_report(payload: Dict[str, Any]) -> Tuple[bool, int, str]:
-    """POST payload to backend with bearer auth. Returns (ok, status_code, text)."""
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {API_KEY}",
-        "User-Agent": "syshealth-utility/1.0"
-    }
+def http_post(url: str, body: bytes, headers: Dict[str, str],
+              timeout: float = REQUEST_TIMEOUT_SECONDS) -> Tuple[int, str, Dict[str, str]]:
+    """
+    One POST over http.client, for short-lived runs that should not pay for
+    importing requests. Returns (status, text, lower-cased headers); status 0
+    on a network error.
+    """
+    import http.client
+    from urllib.parse import urlsplit
+
+    u = urlsplit(url)
+    conn_cls = http.client.HTTPSConnection if u.scheme == "https" else http.client.HTTPConnection
+    conn = conn_cls(u.hostname, u.port, timeout=timeout)
     try:
-        resp = requests.post(API_URL, headers=headers, json=payload, timeout=REQUEST_TIMEOUT_SECONDS)
-        ok = 200 <= resp.status_code < 300
-        return ok, resp.status_code, resp.text or ""
+        conn.request("POST", (u.path or "/") + (f"?{u.query}" if u.query else ""), body=body, headers=headers)
+        resp = conn.getresponse()
+        text = resp.read().decode("utf-8", "replace")
+        return resp.status, text, {k.lower(): v for k, v in resp.getheaders()}
     except Exception as e:
-        return False, 0, str(e)
+        return 0, str(e), {}
+    finally:
+        conn.close()
+
+
+def run_checks(checks: Dict[str, Tuple[Callable[[], Any], float]]) -> Tuple[Dict[str, Any], Dict[str, float], list]:
+    """
+    Run checks concurrently, each against its own deadline.
+    Returns (results, wall_seconds, timed_out_names). Timed out checks are None.
+    """
+    pool = ThreadPoolExecutor(max_workers=len(checks), thread_name_prefix="check")
+    started = time.monotonic()
+    finished: Dict[str, float] = {}
+
+    def timed(name, fn):
+        cpu = time.thread_time()
+        try:
+            return fn()
+        finally:
+            finished[name] = time.monotonic()
+            metrics.observe("check_wall_seconds", finished[name] - started, check=name)
+            metrics.observe("check_cpu_seconds", time.thread_time() - cpu, check=name)
+
+    futures = {name: pool.submit(timed, name, fn) for name, (fn, _) in checks.items()}
+    results: Dict[str, Any] = {}
+    timings: Dict[str, float] = {}
+    timed_out = []
+    try:
+        for name, fut in futures.items():
+            deadline = started + checks[name][1]
+            try:
+                results[name] = fut.result(timeout=max(0.0, deadline - time.monotonic()))
+            except Exception as e:
+                results[name] = None
+                if not fut.done():
+                    timed_out.append(name)
+                    metrics.inc("check_timeouts_total", check=name)
+                else:
+                    print(f"[{now_iso()}] check {name} failed: {e}")
+            timings[name] = round(finished.get(name, time.monotonic()) - started, 3)
+    finally:
+        # don't wait for stragglers; their subprocesses carry their own timeouts
+        pool.shutdown(wait=False, cancel_futures=True)
+    return results, timings, timed_out
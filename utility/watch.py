@@ -0,0 +1,110 @@
+import ctypes
+import ctypes.util
+import fnmatch
+import os
+import select
+import struct
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from procs import AV_SERVICES
+
+# Linux inotify watcher: maps file-system events on the sources the checks
+# read to the name of the check (as in main.CHECKS) that must re-run.
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+
+# (directory, check, file-name patterns; None = any entry)
+WATCHES: List[Tuple[str, str, Optional[List[str]]]] = [
+    ("/etc", "os", ["os-release"]),
+    ("/usr/lib", "os", ["os-release"]),
+    ("/etc", "diskEncryption", ["crypttab"]),
+    ("/var/lib/dpkg", "updates", ["status"]),
+    ("/var/lib/apt/lists", "updates", ["*_Packages", "*_Packages.gz"]),
+    ("/var/log", "updates", ["pacman.log", "dnf.rpm.log"]),
+    ("/var/lib/pacman/local", "updates", None),
+    # systemd keeps an invocation:<unit> entry per running unit
+    ("/run/systemd/units", "antivirus", [f"*{s}.service" for s in AV_SERVICES["Linux"]]),
+    (os.path.expanduser("~/.config/dconf"), "sleepPolicy", ["user"]),
+]
+
+DEBOUNCE_SECONDS = 2.0
+MAX_BURST_SECONDS = 15.0
+
+
+class Watcher:
+    def __init__(self, watches: List[Tuple[str, str, Optional[List[str]]]] = WATCHES):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add = libc.inotify_add_watch
+        self._add.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._targets: Dict[int, List[Tuple[str, Optional[List[str]]]]] = {}
+        self.watched: List[str] = []
+        for directory, check, patterns in watches:
+            if not os.path.isdir(directory):
+                continue
+            wd = self._add(self.fd, os.fsencode(directory), MASK)
+            if wd < 0:
+                continue  # unreadable: the periodic safety net still covers it
+            self._targets.setdefault(wd, []).append((check, patterns))
+            self.watched.append(directory)
+        self.all_checks = {check for _d, check, _p in watches}
+
+    def _drain(self) -> Set[str]:
+        hits: Set[str] = set()
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return hits
+            off = 0
+            while off < len(buf):
+                wd, mask, _cookie, length = _EVENT.unpack_from(buf, off)
+                name = buf[off + _EVENT.size: off + _EVENT.size + length].rstrip(b"\0").decode("utf-8", "replace")
+                off += _EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    hits |= self.all_checks  # events lost: re-run everything we watch
+                    continue
+                for check, patterns in self._targets.get(wd, []):
+                    if patterns is None or any(fnmatch.fnmatch(name, p) for p in patterns):
+                        hits.add(check)
+
+    def wait(self, timeout: float) -> Set[str]:
+        """
+        Block up to `timeout` seconds for relevant events. A burst is collected
+        until it has been quiet for DEBOUNCE_SECONDS. Returns the checks to re-run.
+        """
+        deadline = time.monotonic() + timeout
+        hits: Set[str] = set()
+        while not hits:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return hits
+            ready, _, _ = select.select([self.fd], [], [], left)
+            if not ready:
+                return hits
+            hits = self._drain()
+        burst_end = time.monotonic() + MAX_BURST_SECONDS
+        while time.monotonic() < burst_end:
+            ready, _, _ = select.select([self.fd], [], [], DEBOUNCE_SECONDS)
+            if not ready:
+                break
+            hits |= self._drain()
+        return hits
+
+    def close(self) -> None:
+        os.close(self.fd)